@@ -4,7 +4,34 @@ import bcrypt
 from datetime import datetime
 import threading
 import re
+import bisect
+import json
+import uuid
+import random
+import csv
+import itertools
+import tempfile
+import queue
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import locale
+import math
+import os
+import sys
+import time
+import atexit
+import gzip
+import hashlib
+import ipaddress
+import glob
+import shutil
+import smtplib
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.message import EmailMessage
 
 # Встановлення локалізації для української мови
 try:
@@ -12,8 +39,425 @@ try:
 except locale.Error:
     pass
 
+# Режим кіоску: python app.py kiosk [сервер]. Користувач входить своїм
+# паролем (сервер видає токен, POST /api/kiosk/login), кіоск тримає локальний
+# кеш SQLite з технікою та бронюваннями користувача і підтягує з сервера лише
+# зміни після останнього побаченого seq (GET /api/changes). Без мережі
+# перегляд іде з кешу, а нові бронювання чекають у черзі й повторюються
+# через POST /api/reservations, коли зв'язок повернеться. Кіоск — окремий
+# клієнт: команда виконується до ініціалізації серверної бази нижче.
+KIOSK_DB_PATH = os.environ.get("INVENTORY_KIOSK_DB", "kiosk.db")
+KIOSK_SERVER = os.environ.get("INVENTORY_KIOSK_SERVER", f"http://127.0.0.1:{int(os.environ.get('INVENTORY_API_PORT', '8090')) or 8090}")
+KIOSK_SYNC_INTERVAL = 30  # секунд між синхронізаціями
+KIOSK_SYNC_BATCH = 1000  # змін за один запит, не більше API_MAX_PAGE_SIZE сервера
+KIOSK_TIMEOUT = 5  # секунд на запит до сервера
+KIOSK_LIST_LIMIT = 50  # скільки техніки показувати за пошуком
+KIOSK_PENDING_STATES = {"pending": "очікує синхронізації", "conflict": "конфлікт", "rejected": "відхилено"}
+
+def open_kiosk(path, server):
+    kiosk_conn = sqlite3.connect(path, check_same_thread=False)
+    kiosk_conn.executescript("""
+    CREATE TABLE IF NOT EXISTS kiosk_state (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS kiosk_equipment (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        serial_number TEXT,
+        location TEXT,
+        responsible TEXT,
+        status TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_kiosk_equipment_name ON kiosk_equipment (name, id);
+    CREATE TABLE IF NOT EXISTS kiosk_reservations (
+        id INTEGER PRIMARY KEY,
+        equipment_id INTEGER NOT NULL,
+        reservation_time INTEGER NOT NULL,
+        priority INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS kiosk_pending (
+        key TEXT PRIMARY KEY,
+        user_email TEXT NOT NULL,
+        equipment_id INTEGER NOT NULL,
+        equipment_version INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        reason TEXT
+    );
+    """)
+    state = dict(kiosk_conn.execute("SELECT name, value FROM kiosk_state WHERE name IN ('email', 'token')").fetchall())
+    kiosk = {
+        "conn": kiosk_conn,
+        "lock": threading.Lock(),
+        "server": server.rstrip("/"),
+        "email": state.get("email"),
+        "token": state.get("token"),  # None — ніхто не увійшов
+        "wakeup": threading.Event(),
+        "online": None,  # None — ще не синхронізувалися
+        "last_sync": None,
+        "error": None,
+        "on_sync": None,
+    }
+    return kiosk
+
+def kiosk_request(kiosk, path, payload=None):
+    headers = {"Accept-Encoding": "gzip"}
+    if kiosk["token"]:
+        headers["Authorization"] = f"Bearer {kiosk['token']}"
+    data = None
+    if payload is not None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers["Content-Type"] = "application/json; charset=utf-8"
+    request = urllib.request.Request(kiosk["server"] + path, data=data, headers=headers)
+    with urllib.request.urlopen(request, timeout=KIOSK_TIMEOUT) as response:
+        body = response.read()
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+    return json.loads(body)
+
+def kiosk_login(kiosk, email, password):
+    # Вхід потребує мережі; повертає текст помилки або None
+    try:
+        session = kiosk_request(kiosk, "/api/kiosk/login", {"email": email, "password": password})
+    except urllib.error.HTTPError as err:
+        return "Неправильний email або пароль!" if err.code == 401 else f"Помилка сервера: {err.code}"
+    except (OSError, ValueError):
+        return "Немає зв'язку з сервером: для входу потрібна мережа"
+    # Кеш бронювань належить одному користувачу: для іншого email кеш
+    # будується заново, а його черга офлайн-бронювань лишається за ним
+    with kiosk["lock"]:
+        kiosk_conn = kiosk["conn"]
+        if kiosk["email"] != session["email"]:
+            kiosk_conn.execute("DELETE FROM kiosk_equipment")
+            kiosk_conn.execute("DELETE FROM kiosk_reservations")
+            kiosk_conn.execute("INSERT OR REPLACE INTO kiosk_state (name, value) VALUES ('since', '0')")
+            kiosk_conn.execute("INSERT OR REPLACE INTO kiosk_state (name, value) VALUES ('email', ?)", (session["email"],))
+        kiosk_conn.execute("INSERT OR REPLACE INTO kiosk_state (name, value) VALUES ('token', ?)", (session["token"],))
+        kiosk_conn.commit()
+        kiosk["email"], kiosk["token"] = session["email"], session["token"]
+    kiosk["wakeup"].set()
+    return None
+
+def kiosk_forget_token(kiosk):
+    with kiosk["lock"]:
+        kiosk["conn"].execute("DELETE FROM kiosk_state WHERE name = 'token'")
+        kiosk["conn"].commit()
+        kiosk["token"] = None
+
+def kiosk_logout(kiosk):
+    # Сервер відкликає токен, якщо досяжний; без мережі токен просто забувається
+    try:
+        kiosk_request(kiosk, "/api/kiosk/logout", {})
+    except (OSError, ValueError):
+        pass
+    kiosk_forget_token(kiosk)
+
+def kiosk_push(kiosk):
+    # Повтор черги по порядку створення; прийняті й уже наявні на сервері
+    # бронювання зникають з черги, конфлікти лишаються для показу користувачу
+    with kiosk["lock"]:
+        pending = kiosk["conn"].execute("""
+            SELECT key, equipment_id, equipment_version FROM kiosk_pending
+            WHERE state = 'pending' AND user_email = ? ORDER BY created_at, key
+        """, (kiosk["email"],)).fetchall()
+    results = Counter()
+    # Токен дає право лише на бронювання свого користувача: черги інших
+    # користувачів кіоску чекають, поки вони увійдуть
+    for key, equipment_id, version in pending:
+        try:
+            result = kiosk_request(kiosk, "/api/reservations",
+                                   {"key": key, "equipment_id": equipment_id, "equipment_version": version})
+        except urllib.error.HTTPError as err:
+            if err.code != 400:
+                raise
+            result = {"status": "rejected", "reason": json.loads(err.read() or b"{}").get("error", str(err))}
+        with kiosk["lock"]:
+            if result["status"] in ("created", "duplicate"):
+                kiosk["conn"].execute("DELETE FROM kiosk_pending WHERE key = ?", (key,))
+            else:
+                kiosk["conn"].execute("UPDATE kiosk_pending SET state = ?, reason = ? WHERE key = ?",
+                                      (result["status"], result.get("reason"), key))
+            kiosk["conn"].commit()
+        results[result["status"]] += 1
+    return results
+
+def kiosk_apply_change(kiosk_conn, change):
+    data = change["data"]
+    if change["table"] == "equipment":
+        if change["op"] == "delete":
+            kiosk_conn.execute("DELETE FROM kiosk_equipment WHERE id = ?", (change["row_id"],))
+        else:
+            kiosk_conn.execute("""
+                INSERT OR REPLACE INTO kiosk_equipment (id, name, serial_number, location, responsible, status, version)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (data["id"], data["name"], data["serial_number"], data["location"], data["responsible"], data["status"], data["version"]))
+    elif change["table"] == "reservations":
+        if change["op"] == "delete":
+            kiosk_conn.execute("DELETE FROM kiosk_reservations WHERE id = ?", (change["row_id"],))
+        else:
+            kiosk_conn.execute("""
+                INSERT OR REPLACE INTO kiosk_reservations (id, equipment_id, reservation_time, priority)
+                VALUES (?, ?, ?, ?)
+            """, (data["id"], data["equipment_id"], data["reservation_time"], data["priority"]))
+
+def kiosk_pull(kiosk):
+    # Кожен пакет застосовується разом із новим seq в одній транзакції,
+    # тож обрив посеред синхронізації не лишає кеш напівоновленим
+    applied = 0
+    while True:
+        with kiosk["lock"]:
+            since = int(kiosk["conn"].execute("SELECT value FROM kiosk_state WHERE name = 'since'").fetchone()[0])
+        query = urllib.parse.urlencode({"since": since, "limit": KIOSK_SYNC_BATCH})
+        delta = kiosk_request(kiosk, f"/api/changes?{query}")
+        with kiosk["lock"]:
+            if delta["reset"]:
+                kiosk["conn"].execute("DELETE FROM kiosk_equipment")
+                kiosk["conn"].execute("DELETE FROM kiosk_reservations")
+            for change in delta["changes"]:
+                kiosk_apply_change(kiosk["conn"], change)
+            kiosk["conn"].execute("UPDATE kiosk_state SET value = ? WHERE name = 'since'", (str(delta["next_since"]),))
+            kiosk["conn"].commit()
+        applied += len(delta["changes"])
+        if not delta["more"]:
+            return applied
+
+def kiosk_sync(kiosk):
+    # Спершу черга, потім дельта: свіжі бронювання приходять у тій самій синхронізації
+    if not kiosk["token"]:
+        return None
+    try:
+        pushed = kiosk_push(kiosk)
+        pulled = kiosk_pull(kiosk)
+    except urllib.error.HTTPError as err:
+        if err.code != 401:
+            kiosk["online"] = False
+            kiosk["error"] = str(err)
+            return None
+        kiosk_forget_token(kiosk)  # Токен прострочено або відкликано: потрібен новий вхід
+        kiosk["error"] = "Сесію завершено, увійдіть знову"
+        return None
+    except (OSError, ValueError) as err:  # немає зв'язку, помилка сервера чи зіпсована відповідь
+        kiosk["online"] = False
+        kiosk["error"] = str(err)
+        return None
+    kiosk["online"] = True
+    kiosk["last_sync"] = time.time()
+    kiosk["error"] = None
+    return {"pushed": dict(pushed), "pulled": pulled}
+
+def run_kiosk_sync(kiosk):
+    while True:
+        try:
+            kiosk_sync(kiosk)
+            if kiosk["on_sync"]:
+                kiosk["on_sync"]()
+        except Exception as err:  # Потік синхронізації не має зупинятися через одну невдачу
+            kiosk["online"] = False
+            kiosk["error"] = str(err) or type(err).__name__
+        kiosk["wakeup"].wait(KIOSK_SYNC_INTERVAL)
+        kiosk["wakeup"].clear()
+
+def kiosk_equipment(kiosk, search=""):
+    with kiosk["lock"]:
+        return kiosk["conn"].execute("""
+            SELECT id, name, serial_number, location, responsible, status, version FROM kiosk_equipment
+            WHERE name LIKE ? ORDER BY name, id LIMIT ?
+        """, (f"%{search}%", KIOSK_LIST_LIMIT)).fetchall()
+
+def kiosk_reservations(kiosk):
+    # (бронювання з сервера, черга офлайн-бронювань поточного користувача)
+    with kiosk["lock"]:
+        reservations = kiosk["conn"].execute("""
+            SELECT r.id, r.equipment_id, e.name, r.reservation_time FROM kiosk_reservations r
+            LEFT JOIN kiosk_equipment e ON e.id = r.equipment_id
+            ORDER BY r.reservation_time DESC, r.id DESC
+        """).fetchall()
+        pending = kiosk["conn"].execute("""
+            SELECT p.key, p.equipment_id, e.name, p.created_at, p.state, p.reason FROM kiosk_pending p
+            LEFT JOIN kiosk_equipment e ON e.id = p.equipment_id
+            WHERE p.user_email = ? ORDER BY p.created_at, p.key
+        """, (kiosk["email"],)).fetchall()
+    return reservations, pending
+
+def kiosk_reserve(kiosk, equipment_id):
+    # Бронювання потрапляє в чергу з версією техніки, яку бачив користувач;
+    # повертає текст помилки або None
+    with kiosk["lock"]:
+        row = kiosk["conn"].execute("SELECT status, version FROM kiosk_equipment WHERE id = ?", (equipment_id,)).fetchone()
+        if row is None:
+            return "Обладнання не знайдено!"
+        if row[0] == "Списана":
+            return "Списану техніку бронювати не можна!"
+        reserved = kiosk["conn"].execute("""
+            SELECT 1 FROM kiosk_reservations WHERE equipment_id = ?
+            UNION ALL
+            SELECT 1 FROM kiosk_pending WHERE equipment_id = ? AND user_email = ? AND state = 'pending'
+        """, (equipment_id, equipment_id, kiosk["email"])).fetchone()
+        if reserved:
+            return "Цю техніку вже заброньовано!"
+        kiosk["conn"].execute("""
+            INSERT INTO kiosk_pending (key, user_email, equipment_id, equipment_version, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (str(uuid.uuid4()), kiosk["email"], equipment_id, row[1], int(time.time())))
+        kiosk["conn"].commit()
+    kiosk["wakeup"].set()
+    return None
+
+def kiosk_dismiss(kiosk, key):
+    # Прибрати з черги конфлікт чи відмову, яку користувач уже побачив
+    with kiosk["lock"]:
+        kiosk["conn"].execute("DELETE FROM kiosk_pending WHERE key = ? AND state != 'pending'", (key,))
+        kiosk["conn"].commit()
+
+def kiosk_main(page: ft.Page, kiosk):
+    page.title = "Кіоск обліку техніки"
+    page.horizontal_alignment = 'center'
+    page.vertical_alignment = 'center'
+    page.theme_mode = 'white'
+    page.padding = 20
+    background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg"
+    refresh_lock = threading.Lock()
+
+    status_text = ft.Text("", color='white')
+    search_field = ft.TextField(hint_text='Пошук за назвою', width=350, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    equipment_view = ft.ListView(auto_scroll=False, width=750, height=220)
+    reservations_view = ft.ListView(auto_scroll=False, width=750, height=160)
+    title_text = ft.Text("", size=24, weight="bold", color='white')
+    email_field = ft.TextField(hint_text='Email', width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    password_field = ft.TextField(hint_text='Пароль', password=True, can_reveal_password=True, width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    screen = ft.Column(spacing=15, alignment='center')
+
+    def show_snackbar(message, bgcolor=None):
+        page.open(ft.SnackBar(ft.Text(message, color='white'), bgcolor=bgcolor, duration=3000))
+
+    def reserve(equipment_id):
+        error = kiosk_reserve(kiosk, equipment_id)
+        if error:
+            show_snackbar(error, bgcolor="red_400")
+            return
+        show_snackbar("Бронювання збережено й буде надіслане під час синхронізації")
+        refresh()
+
+    def dismiss(key):
+        kiosk_dismiss(kiosk, key)
+        refresh()
+
+    def sync_now(e):
+        kiosk["wakeup"].set()
+        show_snackbar("Синхронізація...")
+
+    def login(e):
+        if not email_field.value or not password_field.value:
+            show_snackbar("Введіть email і пароль!", bgcolor="red_400")
+            return
+        error = kiosk_login(kiosk, email_field.value.strip(), password_field.value)
+        password_field.value = ""
+        if error:
+            show_snackbar(error, bgcolor="red_400")
+            page.update()
+            return
+        show_kiosk()
+
+    def logout(e):
+        kiosk_logout(kiosk)
+        show_login()
+
+    def show_login():
+        screen.controls[:] = [
+            ft.Text("Вхід на кіоску", size=24, weight="bold", color='white'),
+            ft.Text(kiosk["error"] or "", color='red'),
+            email_field,
+            password_field,
+            ft.ElevatedButton("Увійти", on_click=login, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+        ]
+        page.update()
+
+    def show_kiosk():
+        title_text.value = f"Кіоск: {kiosk['email']}"
+        screen.controls[:] = [
+            title_text,
+            status_text,
+            search_field,
+            equipment_view,
+            ft.Text("Мої бронювання", size=18, weight="bold", color='white'),
+            reservations_view,
+            ft.Row([
+                ft.ElevatedButton("Синхронізувати", on_click=sync_now, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                ft.ElevatedButton("Вийти", on_click=logout, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+            ], alignment='center'),
+        ]
+        refresh()
+
+    def refresh(e=None):
+        # Викликається і з інтерфейсу, і з потоку синхронізації
+        if not kiosk["token"]:
+            if title_text in screen.controls:
+                show_login()  # Сервер не прийняв токен: потрібен новий вхід
+            return
+        with refresh_lock:
+            reservations, pending = kiosk_reservations(kiosk)
+            waiting = sum(1 for row in pending if row[4] == "pending")
+            last_sync = datetime.fromtimestamp(kiosk["last_sync"]).strftime("%H:%M:%S") if kiosk["last_sync"] else "ще не було"
+            if kiosk["online"] is False:
+                status_text.value = f"Офлайн ({kiosk['error']}). Остання синхронізація: {last_sync}. У черзі: {waiting}"
+            else:
+                status_text.value = f"Онлайн. Остання синхронізація: {last_sync}. У черзі: {waiting}"
+
+            equipment_view.controls.clear()
+            for row in kiosk_equipment(kiosk, search_field.value or ""):
+                equipment_view.controls.append(ft.Row([
+                    ft.Text(f"ID: {row[0]}, Назва: {row[1]}, Кабінет: {row[3]}, Стан: {row[5]}", color='white', expand=True),
+                    ft.ElevatedButton("Забронювати", on_click=lambda e, equipment_id=row[0]: reserve(equipment_id),
+                                      disabled=row[5] == "Списана", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                ]))
+
+            reservations_view.controls.clear()
+            for row in pending:
+                controls = [ft.Text(f"{row[2] or row[1]}: {KIOSK_PENDING_STATES[row[4]]}{f' — {row[5]}' if row[5] else ''}",
+                                    color='white' if row[4] == "pending" else 'red', expand=True)]
+                if row[4] != "pending":
+                    controls.append(ft.ElevatedButton("Прибрати", on_click=lambda e, key=row[0]: dismiss(key),
+                                                      style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+                reservations_view.controls.append(ft.Row(controls))
+            for row in reservations:
+                reservations_view.controls.append(ft.Text(
+                    f"{row[2] or row[1]}: заброньовано {datetime.fromtimestamp(row[3]).strftime('%d.%m.%Y %H:%M')}", color='white'))
+            page.update()
+
+    search_field.on_change = refresh
+    page.add(ft.Container(
+        content=ft.Stack([
+            ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=600),
+            screen
+        ]),
+        width=800,
+        height=600,
+        border_radius=20,
+        shadow=ft.BoxShadow(blur_radius=5, color='red')
+    ))
+    kiosk["on_sync"] = refresh
+    if kiosk["token"]:
+        show_kiosk()
+    else:
+        show_login()
+
+def cli_kiosk(args):
+    # python app.py kiosk [сервер]
+    kiosk = open_kiosk(KIOSK_DB_PATH, args[0] if args else KIOSK_SERVER)
+    threading.Thread(target=run_kiosk_sync, args=(kiosk,), name="kiosk-sync", daemon=True).start()
+    ft.app(target=lambda page: kiosk_main(page, kiosk))
+
+if __name__ == "__main__" and sys.argv[1:2] == ["kiosk"]:
+    cli_kiosk(sys.argv[2:])
+    sys.exit(0)
+
+
 # Database connection
-conn = sqlite3.connect("inventory.db", check_same_thread=False)
+DB_PATH = "inventory.db"
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+conn.execute("PRAGMA journal_mode = WAL")  # Редагування через окремі з'єднання не блокує читачів
 cursor = conn.cursor()
 
 # Додаємо блокування для синхронізації доступу до бази даних
@@ -27,18 +471,39 @@ try:
 except sqlite3.OperationalError:
     pass
 
-# Create tables
-with db_lock:
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS equipment (
+# Термін дії підписки (unix-час); існуючі підписки отримують повний період від сьогодні
+SUBSCRIPTION_PERIOD = 30 * 24 * 3600  # секунд
+try:
+    with db_lock:
+        cursor.execute("ALTER TABLE users ADD COLUMN subscription_expires_at INTEGER")
+        cursor.execute("UPDATE users SET subscription_expires_at = ? WHERE subscription_status AND subscription_expires_at IS NULL",
+                       (int(time.time()) + SUBSCRIPTION_PERIOD,))
+        conn.commit()
+except sqlite3.OperationalError:
+    pass
+
+EQUIPMENT_COLUMNS_SQL = """
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
         serial_number TEXT UNIQUE NOT NULL,
-        location TEXT,
-        responsible TEXT,
-        status TEXT
-    )
-    """)
+        location_id INTEGER REFERENCES locations(id),
+        responsible_id INTEGER REFERENCES people(id),
+        status TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+"""
+EQUIPMENT_TABLE_SQL = f"CREATE TABLE IF NOT EXISTS equipment ({EQUIPMENT_COLUMNS_SQL})"
+
+# Факультет користувача (для режиму шардування)
+try:
+    with db_lock:
+        cursor.execute("ALTER TABLE users ADD COLUMN faculty TEXT")
+        conn.commit()
+except sqlite3.OperationalError:
+    pass
+
+# Create tables
+with db_lock:
+    cursor.execute(EQUIPMENT_TABLE_SQL)
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
@@ -46,15 +511,18 @@ with db_lock:
         email TEXT UNIQUE NOT NULL,
         password TEXT NOT NULL,
         role TEXT NOT NULL,
-        subscription_status BOOLEAN DEFAULT FALSE
+        subscription_status BOOLEAN DEFAULT FALSE,
+        subscription_expires_at INTEGER,
+        faculty TEXT
     )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_subscription_expires ON users (subscription_expires_at)")
 
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS login_logs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         email TEXT NOT NULL,
-        login_time TEXT NOT NULL,
+        login_time INTEGER NOT NULL,
         device_info TEXT NOT NULL
     )
     """)
@@ -64,7 +532,7 @@ with db_lock:
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         equipment_id INTEGER NOT NULL,
         user_email TEXT NOT NULL,
-        reservation_time TEXT NOT NULL,
+        reservation_time INTEGER NOT NULL,
         priority INTEGER DEFAULT 0,
         FOREIGN KEY (equipment_id) REFERENCES equipment(id),
         FOREIGN KEY (user_email) REFERENCES users(email)
@@ -76,437 +544,4303 @@ with db_lock:
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_email TEXT NOT NULL,
         amount TEXT NOT NULL,
-        payment_time TEXT NOT NULL,
+        payment_time INTEGER NOT NULL,
         FOREIGN KEY (user_email) REFERENCES users(email)
     )
     """)
     conn.commit()
 
-def initialize_equipment_data():
+# Міграція часових міток з рядків "%Y-%m-%d %H:%M:%S" у цілі unix-секунди з
+# індексами. SQLite не змінює тип колонки на місці, тому таблиця
+# перебудовується; тригери на ній створюються нижче заново.
+TIMESTAMP_COLUMNS = {
+    "login_logs": ("login_time", "id, email, login_time, device_info", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        login_time INTEGER NOT NULL,
+        device_info TEXT NOT NULL
+    """),
+    "payment_logs": ("payment_time", "id, user_email, amount, payment_time", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_email TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        payment_time INTEGER NOT NULL,
+        FOREIGN KEY (user_email) REFERENCES users(email)
+    """),
+    "reservations": ("reservation_time", "id, equipment_id, user_email, reservation_time, priority", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        equipment_id INTEGER NOT NULL,
+        user_email TEXT NOT NULL,
+        reservation_time INTEGER NOT NULL,
+        priority INTEGER DEFAULT 0,
+        FOREIGN KEY (equipment_id) REFERENCES equipment(id),
+        FOREIGN KEY (user_email) REFERENCES users(email)
+    """),
+}
+
+def migrate_timestamp_column(table, column, columns, definition):
+    # Викликається під db_lock; нічого не робить, якщо колонка вже не TEXT
+    cursor.execute(f"PRAGMA table_info({table})")
+    if {row[1]: row[2] for row in cursor.fetchall()}.get(column, "").upper() != "TEXT":
+        return
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    sequence = cursor.fetchone()
+    converted = ", ".join(
+        f"COALESCE(CAST(strftime('%s', {name}, 'utc') AS INTEGER), 0)" if name == column else name
+        for name in columns.split(", ")
+    )
+    cursor.execute(f"CREATE TABLE {table}_migrated ({definition})")
+    cursor.execute(f"INSERT INTO {table}_migrated ({columns}) SELECT {converted} FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_migrated RENAME TO {table}")
+    if sequence:
+        # Номери видалених рядків не повинні повторитися
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+
+with db_lock:
+    for table, (column, columns, definition) in TIMESTAMP_COLUMNS.items():
+        migrate_timestamp_column(table, column, columns, definition)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_login_logs_time ON login_logs (login_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payment_logs_time ON payment_logs (payment_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservations_time ON reservations (reservation_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservations_queue ON reservations (equipment_id, priority DESC, reservation_time)")
+    conn.commit()
+
+def format_ts(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts is not None else ""
+
+# Запити по часу: події між start і end (unix-секунди, end не включно)
+# та кількість подій по годинах чи днях місцевого часу
+TIME_SERIES = {
+    "logins": ("login_logs", "login_time", "email, login_time, device_info"),
+    "payments": ("payment_logs", "payment_time", "user_email, amount, payment_time"),
+    "reservations": ("reservations", "reservation_time", "id, equipment_id, user_email, reservation_time, priority"),
+}
+BUCKET_SIZES = {"hour": 3600, "day": 24 * 3600}
+
+def events_between(kind, start, end, limit=1000):
+    table, column, columns = TIME_SERIES[kind]
     with db_lock:
-        cursor.execute("SELECT COUNT(*) FROM equipment")
-        count = cursor.fetchone()[0]
-        if count == 0:  # Додаємо записи лише якщо таблиця порожня
-            equipment_data = [
-                ("Ноутбук Dell", "SN001", "Кабінет 101", "Іванов І.Б", "Справна"),
-                ("Принтер HP", "SN002", "Кабінет 102", "Петров Б.Б", "Потрібен ремонт"),
-                ("Проектор Epson", "SN003", "Кабінет 103", "Сидорова К.Г", "Справна"),
-                ("Монітор LG", "SN004", "Кабінет 104", "Коваленко О.А", "Справна"),
-                ("Сканер Canon", "SN005", "Кабінет 105", "Григоренко С.Р", "Потрібен ремонт"),
-                ("Комп'ютер Lenovo", "SN006", "Кабінет 106", "Лисенко Р.Н", "Справна")
-            ]
-            cursor.executemany("INSERT INTO equipment (name, serial_number, location, responsible, status) VALUES (?, ?, ?, ?, ?)", equipment_data)
-            conn.commit()
+        cursor.execute(f"SELECT {columns} FROM {table} WHERE {column} >= ? AND {column} < ? ORDER BY {column} LIMIT ?",
+                       (int(start), int(end), limit))
+        return cursor.fetchall()
 
-def main(page: ft.Page):
-    page.title = "Облік техніки"
-    page.window_min_width = 500
-    page.horizontal_alignment = 'center'
-    page.vertical_alignment = 'center'
-    page.theme_mode = 'white'
-    page.padding = 20
+def utc_offset_spans(start, end):
+    # Проміжки [від, до) зі сталим зсувом місцевого часу від UTC. Переходи на
+    # літній чи зимовий час шукаються кроком у добу й уточнюються бісекцією.
+    spans = []
+    span_start, offset = start, time.localtime(start).tm_gmtoff
+    t = start
+    while t < end:
+        step = min(t + 24 * 3600, end)
+        if time.localtime(step).tm_gmtoff == offset:
+            t = step
+            continue
+        low, high = t, step
+        while high - low > 1:
+            middle = (low + high) // 2
+            if time.localtime(middle).tm_gmtoff == offset:
+                low = middle
+            else:
+                high = middle
+        spans.append((span_start, high, offset))
+        span_start, offset = high, time.localtime(high).tm_gmtoff
+        t = high
+    spans.append((span_start, end, offset))
+    return [span for span in spans if span[0] < span[1]]
 
-    role = None
-    current_email = None
-    equipment = []
+def count_events_by_bucket(kind, start, end, bucket="hour"):
+    # Групування по цілих мітках окремо для кожного проміжку зі сталим
+    # зсувом, тож переведення годинника не зсуває межі днів після нього
+    table, column, _ = TIME_SERIES[kind]
+    size = BUCKET_SIZES[bucket]
+    counts = {}
+    with db_lock:
+        for span_start, span_end, offset in utc_offset_spans(int(start), int(end)):
+            cursor.execute(f"""
+                SELECT ({column} + :offset) / :size * :size - :offset AS bucket, COUNT(*)
+                FROM {table} WHERE {column} >= :start AND {column} < :end
+                GROUP BY bucket
+            """, {"offset": offset, "size": size, "start": span_start, "end": span_end})
+            for label, count in cursor.fetchall():
+                if bucket == "day":
+                    # Доба з переходом потрапляє в обидва проміжки; мітка — її місцева північ
+                    label = int(time.mktime(time.gmtime(label + offset)[:3] + (0, 0, 0, 0, 0, -1)))
+                counts[label] = counts.get(label, 0) + count
+    return sorted(counts.items())
 
-    # Button styling
-    bg_color = "white"
-    hover_color = "red"
+def benchmark_time_queries(rows=10_000_000, queries=200, span_days=365):
+    # Заповнює тимчасову базу rows логами входу за span_days днів і міряє
+    # діапазонні запити та групування по цілих мітках з індексом
+    workdir = tempfile.mkdtemp(prefix="inventory-bench-")
+    bench = sqlite3.connect(os.path.join(workdir, "bench.db"))
+    results = {}
+    try:
+        bench.execute("PRAGMA journal_mode = OFF")
+        bench.execute("PRAGMA synchronous = OFF")
+        bench.execute(f"CREATE TABLE login_logs ({TIMESTAMP_COLUMNS['login_logs'][2]})")
+        end = int(time.time())
+        start = end - span_days * 24 * 3600
+        rng = random.Random(42)
+        started = time.monotonic()
+        generated = ((f"user{i % 5000}@uni.edu", rng.randrange(start, end), "bench") for i in range(rows))
+        while True:
+            batch = list(itertools.islice(generated, 100_000))
+            if not batch:
+                break
+            bench.executemany("INSERT INTO login_logs (email, login_time, device_info) VALUES (?, ?, ?)", batch)
+        bench.execute("CREATE INDEX idx_login_logs_time ON login_logs (login_time)")
+        bench.commit()
+        results["load_s"] = time.monotonic() - started
+        results["rows"] = rows
+        results["db_mb"] = os.path.getsize(os.path.join(workdir, "bench.db")) / 1024 / 1024
 
-    # Input fields
-    email_field = ft.TextField(hint_text='Логін', width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
-    password_field = ft.TextField(hint_text='Пароль', password=True, can_reveal_password=True, width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
-    confirm_password_field = ft.TextField(hint_text='Підтвердіть пароль', password=True, can_reveal_password=True, width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
-    role_dropdown = ft.Dropdown(
-        width=300,
-        hint_text="Роль",
-        options=[
-            ft.dropdown.Option("student", "Студент"),
-            ft.dropdown.Option("teacher", "Викладач"),
-        ],
-        border_color='white',
-        hint_style=ft.TextStyle(color='white'),
-        text_style=ft.TextStyle(color='white')
-    )
+        for label, window in (("hour", 3600), ("day", 24 * 3600), ("week", 7 * 24 * 3600)):
+            started = time.monotonic()
+            matched = 0
+            for _ in range(queries):
+                t1 = rng.randrange(start, end - window)
+                matched += bench.execute("SELECT COUNT(*) FROM login_logs WHERE login_time >= ? AND login_time < ?",
+                                         (t1, t1 + window)).fetchone()[0]
+            results[f"count_{label}_ms"] = (time.monotonic() - started) * 1000 / queries
+            results[f"avg_rows_{label}"] = matched // queries
 
-    # Store previous sizes for comparison
-    prev_btn_width = None
-    prev_btn_height = None
+        started = time.monotonic()
+        for _ in range(queries):
+            t1 = rng.randrange(start, end - 3600)
+            bench.execute("SELECT email, login_time, device_info FROM login_logs WHERE login_time >= ? AND login_time < ? ORDER BY login_time LIMIT 1000",
+                          (t1, t1 + 3600)).fetchall()
+        results["fetch_hour_ms"] = (time.monotonic() - started) * 1000 / queries
 
-    # List to store active timers
-    active_timers = []
+        started = time.monotonic()
+        t1 = end - 30 * 24 * 3600
+        bench.execute("SELECT (login_time + ?) / 86400 * 86400 AS bucket, COUNT(*) FROM login_logs WHERE login_time >= ? AND login_time < ? GROUP BY bucket",
+                      (time.localtime(t1).tm_gmtoff, t1, end)).fetchall()
+        results["bucket_30_days_by_day_ms"] = (time.monotonic() - started) * 1000
+    finally:
+        bench.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
 
-    # Flags to control timers
-    stop_timers = threading.Event()
+# Кабінети та відповідальні винесені в довідники locations і people.
+# name_key — ключ без пробілів, крапок і регістру, тож "Кабінет 101" і
+# "кабінет  101" чи "Іванов І.Б" і "Іванов І. Б." стають одним записом.
+# Представлення equipment_details повертає техніку з назвами, у старому
+# порядку колонок.
+LOOKUP_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS locations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        name_key TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS people (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        name_key TEXT UNIQUE NOT NULL
+    );
+"""
+EQUIPMENT_INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_equipment_location ON equipment (location_id, id);
+    CREATE INDEX IF NOT EXISTS idx_equipment_responsible ON equipment (responsible_id, id);
+"""
+EQUIPMENT_VERSION_SQL = "ALTER TABLE equipment ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+EQUIPMENT_VIEW_SQL = """
+    DROP VIEW IF EXISTS equipment_details;
+    CREATE VIEW equipment_details AS
+    SELECT e.id, e.name, e.serial_number, l.name AS location, p.name AS responsible, e.status,
+           e.location_id, e.responsible_id, e.version
+    FROM equipment e
+    LEFT JOIN locations l ON l.id = e.location_id
+    LEFT JOIN people p ON p.id = e.responsible_id;
+"""
+EQUIPMENT_PAGE_SIZE = 20
 
-    def on_hover(e):
-        e.control.bgcolor = hover_color if e.data == "true" else bg_color
-        e.control.update()
+def canonical_name(name):
+    return " ".join((name or "").split())
 
-    # Containers for UI elements
-    text_login = ft.Container(ft.Text(value='Увійти в систему', size=25, weight='bold', color='white'), margin=ft.margin.only(left=100))
-    text_register = ft.Container(ft.Text(value='Реєстрація', size=25, weight='bold', color='white'), margin=ft.margin.only(left=150))
-    login_input = ft.Container(content=email_field, margin=ft.margin.only(left=50))
-    senha_input = ft.Container(content=password_field, margin=ft.margin.only(left=50))
-    confirm_senha_input = ft.Container(content=confirm_password_field, margin=ft.margin.only(left=50))
-    role_input = ft.Container(content=role_dropdown, margin=ft.margin.only(left=50))
+def lookup_key(name):
+    return re.sub(r"[\s.,]+", "", name or "").casefold()
 
-    btn_login = ft.Container(
-        ft.ElevatedButton(text='Увійти', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: login(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-        margin=ft.margin.only(left=100)
-    )
-    btn_register = ft.Container(
-        ft.ElevatedButton(text='Зареєструватися', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: register(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-        margin=ft.margin.only(left=100)
-    )
-    btn_to_register = ft.Container(
-        ft.ElevatedButton(text='Реєстрація', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: show_register(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-        margin=ft.margin.only(left=100)
-    )
-    btn_to_login = ft.Container(
-        ft.ElevatedButton(text='Увійти', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: show_login(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-        margin=ft.margin.only(left=100)
-    )
+def lookup_id(cur, table, name):
+    # id запису довідника locations/people, створює його за потреби
+    name = canonical_name(name)
+    if not name:
+        return None
+    key = lookup_key(name)
+    cur.execute(f"INSERT OR IGNORE INTO {table} (name, name_key) VALUES (?, ?)", (name, key))
+    cur.execute(f"SELECT id FROM {table} WHERE name_key = ?", (key,))
+    return cur.fetchone()[0]
 
-    # Dynamic time text
-    time_text = ft.Text(value="", size=12, italic=True, color='white')
+# Триграмний індекс назв техніки для пошуку схожих записів. Рядок індексу —
+# (триграма, кабінет, техніка): пошук дублікатів при додаванні читає лише
+# кабінет нового запису, пошук за назвою — усі кабінети, а звіт про
+# дублікати порівнює пари лише в межах одного кабінету. Вставку індексує
+# insert_equipment, зміну кабінету і видалення — тригери.
+TRIGRAM_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS equipment_trigrams (
+        trigram TEXT NOT NULL,
+        location_id INTEGER NOT NULL,
+        equipment_id INTEGER NOT NULL,
+        PRIMARY KEY (trigram, location_id, equipment_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_equipment_trigrams_equipment ON equipment_trigrams (equipment_id);
+    CREATE TRIGGER IF NOT EXISTS equipment_trigrams_move AFTER UPDATE OF location_id ON equipment BEGIN
+        UPDATE equipment_trigrams SET location_id = COALESCE(NEW.location_id, 0) WHERE equipment_id = NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS equipment_trigrams_delete AFTER DELETE ON equipment BEGIN
+        DELETE FROM equipment_trigrams WHERE equipment_id = OLD.id;
+    END;
+"""
+DUPLICATE_SIMILARITY = 0.75  # подібність Жаккара назв, з якої запис вважається можливим дублікатом
+SEARCH_SIMILARITY = 0.6  # частка триграм запиту, яка має збігтися з назвою при пошуку
+SIMILAR_LIMIT = 20
 
-    # Login layout
-    login_layout = ft.Container(
-        content=ft.Stack([
-            ft.Image(src="https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg", fit=ft.ImageFit.COVER, width=600, height=600),
-            ft.Column(
-                spacing=30,
-                alignment='center',
-                controls=[
-                    text_login,
-                    login_input,
-                    senha_input,
-                    btn_login,
-                    btn_to_register,
-                    time_text
-                ]
-            )
-        ]),
-        width=400,
-        height=400,
-        border_radius=20,
-        shadow=ft.BoxShadow(blur_radius=5, color='red')
-    )
+def name_trigrams(name):
+    # Без регістру, пунктуації та зайвих пробілів: "Ноутбук Dell" == "ноутбук  DELL"
+    text = " ".join(re.sub(r"[\W_]+", " ", (name or "").casefold()).split())
+    if not text:
+        return set()
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
 
-    # Register layout
-    register_layout = ft.Container(
-        content=ft.Stack([
-            ft.Image(src="https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg", fit=ft.ImageFit.COVER, width=750, height=700),
-            ft.Column(
-                spacing=25,
-                alignment='center',
-                controls=[
-                    text_register,
-                    login_input,
-                    senha_input,
-                    confirm_senha_input,
-                    role_input,
-                    btn_register,
-                    btn_to_login,
-                    time_text
-                ]
-            )
-        ]),
-        width=400,
-        height=500,
-        border_radius=20,
-        shadow=ft.BoxShadow(blur_radius=5, color='red')
-    )
+def index_trigrams(cur, equipment_id, name, location_id):
+    cur.executemany("INSERT OR IGNORE INTO equipment_trigrams (trigram, location_id, equipment_id) VALUES (?, ?, ?)",
+                    [(trigram, location_id or 0, equipment_id) for trigram in name_trigrams(name)])
 
-    content_container = ft.Column()
+def insert_equipment(cur, name, serial, location, responsible, status):
+    location_id = lookup_id(cur, "locations", location)
+    responsible_id = lookup_id(cur, "people", responsible)
+    cur.execute("INSERT INTO equipment (name, serial_number, location_id, responsible_id, status) VALUES (?, ?, ?, ?, ?)",
+                (name, serial, location_id, responsible_id, status))
+    index_trigrams(cur, cur.lastrowid, name, location_id)
 
-    def show_snackbar(message, bgcolor=None, duration=3000):
-        if not stop_timers.is_set():
-            page.open(ft.SnackBar(ft.Text(message, color='white'), bgcolor=bgcolor, duration=duration))
-            page.update()
+EQUIPMENT_GROUPINGS = {"location": ("locations", "location_id"), "responsible": ("people", "responsible_id")}
 
-    def update_time():
-        if stop_timers.is_set():
-            return
-        current_time = datetime.now().strftime("Дата і час: %H:%M EEST, %A, %d %B %Y")
-        time_text.value = current_time
-        if not stop_timers.is_set():
-            try:
-                page.update()
-                timer = threading.Timer(1, update_time)
-                active_timers.append(timer)
-                timer.start()
-            except RuntimeError:
-                pass  # Handle case where page is no longer accessible
+def equipment_groups(db, grouping):
+    # Кабінети або відповідальні з кількістю техніки: лічильники stats_counters
+    # (kind = назва колонки, key = id групи) ведуть тригери, тож запит читає
+    # по рядку на групу, а не всю таблицю equipment. Лічильників немає в
+    # репліці, тому читаємо основне з'єднання, як load_stats
+    table, column = EQUIPMENT_GROUPINGS[grouping]
+    with db["lock"]:
+        db["cursor"].execute(f"""
+            SELECT g.id, g.name, s.value FROM stats_counters s
+            JOIN {table} g ON g.id = CAST(s.key AS INTEGER)
+            WHERE s.kind = ?
+            ORDER BY g.name
+        """, (column,))
+        return db["cursor"].fetchall()
 
-    def check_button_size():
-        nonlocal prev_btn_width, prev_btn_height
-        if stop_timers.is_set():
+def equipment_page(read, grouping, group_id, after_id=0, limit=EQUIPMENT_PAGE_SIZE):
+    # Сторінка техніки групи за ключем (id > after_id), без OFFSET;
+    # grouping=None — сторінка всієї техніки
+    if grouping is None:
+        return read("SELECT * FROM equipment_details WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    column = EQUIPMENT_GROUPINGS[grouping][1]
+    return read(f"SELECT * FROM equipment_details WHERE {column} = ? AND id > ? ORDER BY id LIMIT ?",
+                (group_id, after_id, limit))
+
+# Міграція: текстові equipment.location/responsible -> довідники з дедуплікацією.
+# Канонічним написанням стає найчастіше серед варіантів.
+with db_lock:
+    cursor.executescript(LOOKUP_TABLES_SQL)
+    cursor.execute("PRAGMA table_info(equipment)")
+    lookups_migrated = "location" in {row[1] for row in cursor.fetchall()}
+    if lookups_migrated:
+        cursor.execute("SELECT id, location, responsible FROM equipment")
+        rows = cursor.fetchall()
+        for table, index in (("locations", 1), ("people", 2)):
+            spellings = {}
+            for row in rows:
+                name = canonical_name(row[index])
+                if name:
+                    spellings.setdefault(lookup_key(name), Counter())[name] += 1
+            for key, counter in spellings.items():
+                cursor.execute(f"INSERT OR IGNORE INTO {table} (name, name_key) VALUES (?, ?)", (counter.most_common(1)[0][0], key))
+        mapping = [(lookup_id(cursor, "locations", row[1]), lookup_id(cursor, "people", row[2]), row[0]) for row in rows]
+
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'equipment'")
+        sequence = cursor.fetchone()
+        cursor.execute(f"CREATE TABLE equipment_migrated ({EQUIPMENT_COLUMNS_SQL})")
+        cursor.execute("INSERT INTO equipment_migrated (id, name, serial_number, status) SELECT id, name, serial_number, status FROM equipment")
+        cursor.executemany("UPDATE equipment_migrated SET location_id = ?, responsible_id = ? WHERE id = ?", mapping)
+        cursor.execute("DROP TABLE equipment")
+        cursor.execute("ALTER TABLE equipment_migrated RENAME TO equipment")
+        if sequence:
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'equipment'", (sequence[0],))
+        conn.commit()
+    try:
+        cursor.execute(EQUIPMENT_VERSION_SQL)
+    except sqlite3.OperationalError:
+        pass  # Колонка вже існує
+    cursor.executescript(EQUIPMENT_INDEXES_SQL + EQUIPMENT_VIEW_SQL)
+    conn.commit()
+
+def rebuild_trigram_index(cur):
+    cur.execute("DELETE FROM equipment_trigrams")
+    for equipment_id, name, location_id in cur.execute("SELECT id, name, location_id FROM equipment").fetchall():
+        index_trigrams(cur, equipment_id, name, location_id)
+
+with db_lock:
+    cursor.executescript(TRIGRAM_TABLE_SQL)
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM equipment_trigrams), EXISTS (SELECT 1 FROM equipment)")
+    if cursor.fetchone() == (0, 1):
+        rebuild_trigram_index(cursor)
+    conn.commit()
+
+def similar_equipment(db, name, location=None, containment=False, threshold=None, limit=SIMILAR_LIMIT):
+    # Схожі записи [(подібність, рядок equipment_details)], найсхожіші першими.
+    # location — шукати лише в цьому кабінеті; containment — для пошуку:
+    # частка триграм запиту в назві замість подібності Жаккара.
+    # Читає через з'єднання з пулу редагувань без db_lock (WAL не блокує читачів).
+    threshold = threshold or (SEARCH_SIMILARITY if containment else DUPLICATE_SIMILARITY)
+    grams = name_trigrams(name)
+    if not grams:
+        return []
+    path = db.get("path", DB_PATH)
+    reader = acquire_edit_connection(path)
+    try:
+        params = list(grams)
+        scope = ""
+        if location is not None:
+            found = reader.execute("SELECT id FROM locations WHERE name_key = ?", (lookup_key(canonical_name(location)),)).fetchone()
+            if found is None:
+                return []
+            scope = " AND location_id = ?"
+            params.append(found[0])
+        # Для обох мір подібності спільних триграм щонайменше threshold * |запит|
+        candidates = dict(reader.execute(f"""
+            SELECT equipment_id, COUNT(*) FROM equipment_trigrams
+            WHERE trigram IN ({','.join('?' * len(grams))}){scope}
+            GROUP BY equipment_id
+            HAVING COUNT(*) >= ?
+            ORDER BY COUNT(*) DESC
+            LIMIT ?
+        """, (*params, math.ceil(threshold * len(grams)), limit * 5)).fetchall())
+        if not candidates:
+            return []
+        rows = reader.execute(f"SELECT * FROM equipment_details WHERE id IN ({','.join('?' * len(candidates))})",
+                              list(candidates)).fetchall()
+        results = []
+        for row in rows:
+            shared = candidates[row[0]]
+            score = shared / len(grams) if containment else shared / (len(grams) + len(name_trigrams(row[1])) - shared)
+            if score >= threshold:
+                results.append((score, row))
+        results.sort(key=lambda result: (-result[0], result[1][0]))
+        return results[:limit]
+    finally:
+        release_edit_connection(path, reader)
+
+def duplicate_report(db, threshold=DUPLICATE_SIMILARITY):
+    # Пари можливих дублікатів у межах кабінету: [(подібність, рядок, рядок)].
+    # Фільтр префіксів: триграми назви впорядковуються від найрідших у кабінеті,
+    # і дві назви з подібністю не нижче threshold мають спільну триграму серед
+    # перших |A| - ceil(threshold * |A|) + 1. Точна подібність рахується лише
+    # для таких кандидатів, а не для кожної пари кабінету зі спільним «ноу».
+    path = db.get("path", DB_PATH)
+    reader = acquire_edit_connection(path)
+    try:
+        rooms = {}
+        for trigram, location_id, equipment_id in reader.execute("SELECT trigram, location_id, equipment_id FROM equipment_trigrams"):
+            rooms.setdefault(location_id, {}).setdefault(equipment_id, set()).add(trigram)
+        pairs = []
+        for names in rooms.values():
+            frequency = Counter(trigram for grams in names.values() for trigram in grams)
+            prefixes = {}
+            # Від коротших назв до довших: кандидат ніколи не коротший за threshold * |A|
+            for equipment_id in sorted(names, key=lambda item: (len(names[item]), item)):
+                grams = names[equipment_id]
+                ordered = sorted(grams, key=lambda trigram: (frequency[trigram], trigram))
+                candidates = set()
+                for trigram in ordered[:len(grams) - math.ceil(threshold * len(grams) - 1e-9) + 1]:
+                    candidates.update(prefixes.get(trigram, ()))
+                    prefixes.setdefault(trigram, []).append(equipment_id)
+                for other in candidates:
+                    other_grams = names[other]
+                    if len(other_grams) < threshold * len(grams):
+                        continue
+                    shared = len(grams & other_grams)
+                    score = shared / (len(grams) + len(other_grams) - shared)
+                    if score >= threshold:
+                        pairs.append((score, min(equipment_id, other), max(equipment_id, other)))
+        ids = sorted({equipment_id for _, first, second in pairs for equipment_id in (first, second)})
+        rows = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in reader.execute(f"SELECT * FROM equipment_details WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                rows[row[0]] = row
+        pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+        return [(score, rows[first], rows[second]) for score, first, second in pairs if first in rows and second in rows]
+    finally:
+        release_edit_connection(path, reader)
+
+# Агрегатна статистика: лічильники оновлюються тригерами при кожному записі,
+# тож панель статистики читає кілька рядків незалежно від обсягу даних
+STATS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, key)
+    ) WITHOUT ROWID
+"""
+
+STATS_INVENTORY_TRIGGERS_SQL = """
+    CREATE TRIGGER IF NOT EXISTS stats_equipment_insert AFTER INSERT ON equipment BEGIN
+        INSERT INTO stats_counters (kind, key, value) VALUES ('total', 'equipment', 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) VALUES ('status', COALESCE(NEW.status, ''), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) VALUES ('location', COALESCE((SELECT name FROM locations WHERE id = NEW.location_id), ''), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_equipment_delete AFTER DELETE ON equipment BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'total' AND key = 'equipment';
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'status' AND key = COALESCE(OLD.status, '');
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'location' AND key = COALESCE((SELECT name FROM locations WHERE id = OLD.location_id), '');
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_equipment_update AFTER UPDATE OF status, location_id ON equipment BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'status' AND key = COALESCE(OLD.status, '');
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'location' AND key = COALESCE((SELECT name FROM locations WHERE id = OLD.location_id), '');
+        INSERT INTO stats_counters (kind, key, value) VALUES ('status', COALESCE(NEW.status, ''), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) VALUES ('location', COALESCE((SELECT name FROM locations WHERE id = NEW.location_id), ''), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_groups_insert AFTER INSERT ON equipment BEGIN
+        INSERT INTO stats_counters (kind, key, value) SELECT 'location_id', CAST(NEW.location_id AS TEXT), 1
+            WHERE NEW.location_id IS NOT NULL
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) SELECT 'responsible_id', CAST(NEW.responsible_id AS TEXT), 1
+            WHERE NEW.responsible_id IS NOT NULL
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_groups_delete AFTER DELETE ON equipment BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'location_id' AND key = CAST(OLD.location_id AS TEXT);
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'responsible_id' AND key = CAST(OLD.responsible_id AS TEXT);
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_groups_update AFTER UPDATE OF location_id, responsible_id ON equipment BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'location_id' AND key = CAST(OLD.location_id AS TEXT);
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'responsible_id' AND key = CAST(OLD.responsible_id AS TEXT);
+        INSERT INTO stats_counters (kind, key, value) SELECT 'location_id', CAST(NEW.location_id AS TEXT), 1
+            WHERE NEW.location_id IS NOT NULL
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) SELECT 'responsible_id', CAST(NEW.responsible_id AS TEXT), 1
+            WHERE NEW.responsible_id IS NOT NULL
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_reservations_insert AFTER INSERT ON reservations BEGIN
+        INSERT INTO stats_counters (kind, key, value) VALUES ('total', 'reservations', 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) VALUES ('reservations', CAST(NEW.equipment_id AS TEXT), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_reservations_delete AFTER DELETE ON reservations BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'total' AND key = 'reservations';
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'reservations' AND key = CAST(OLD.equipment_id AS TEXT);
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_reservations_update AFTER UPDATE OF equipment_id ON reservations BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'reservations' AND key = CAST(OLD.equipment_id AS TEXT);
+        INSERT INTO stats_counters (kind, key, value) VALUES ('reservations', CAST(NEW.equipment_id AS TEXT), 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        DELETE FROM stats_counters WHERE kind != 'total' AND value <= 0;
+    END;
+"""
+
+STATS_USERS_TRIGGERS_SQL = """
+    CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN
+        INSERT INTO stats_counters (kind, key, value) VALUES ('total', 'users', 1)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + 1;
+        INSERT INTO stats_counters (kind, key, value) VALUES ('total', 'subscribers', COALESCE(NEW.subscription_status, 0) != 0)
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + excluded.value;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE kind = 'total' AND key = 'users';
+        UPDATE stats_counters SET value = value - (COALESCE(OLD.subscription_status, 0) != 0)
+            WHERE kind = 'total' AND key = 'subscribers';
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stats_users_update AFTER UPDATE OF subscription_status ON users BEGIN
+        INSERT INTO stats_counters (kind, key, value)
+            VALUES ('total', 'subscribers', (COALESCE(NEW.subscription_status, 0) != 0) - (COALESCE(OLD.subscription_status, 0) != 0))
+            ON CONFLICT (kind, key) DO UPDATE SET value = value + excluded.value;
+    END;
+"""
+
+GROUP_STATS_SQL = """
+    SELECT 'location_id', CAST(location_id AS TEXT), COUNT(*) FROM equipment WHERE location_id IS NOT NULL GROUP BY location_id
+    UNION ALL SELECT 'responsible_id', CAST(responsible_id AS TEXT), COUNT(*) FROM equipment WHERE responsible_id IS NOT NULL GROUP BY responsible_id
+"""
+
+def fill_group_stats(cur):
+    # Лічильники груп додано пізніше за решту: для наявної бази заповнюються один раз
+    cur.execute("SELECT 1 FROM stats_counters WHERE kind IN ('location_id', 'responsible_id') LIMIT 1")
+    if cur.fetchone() is None:
+        cur.execute(f"INSERT INTO stats_counters (kind, key, value) {GROUP_STATS_SQL}")
+
+with db_lock:
+    cursor.execute(STATS_TABLE_SQL)
+    cursor.executescript(STATS_INVENTORY_TRIGGERS_SQL + STATS_USERS_TRIGGERS_SQL)
+    conn.commit()
+
+def rebuild_stats():
+    # Перерахунок усіх лічильників з нуля (після ручних правок бази чи відновлення)
+    with db_lock:
+        cursor.execute("DELETE FROM stats_counters")
+        cursor.execute(f"""
+            INSERT INTO stats_counters (kind, key, value)
+            SELECT 'total', 'equipment', COUNT(*) FROM equipment
+            UNION ALL SELECT 'total', 'reservations', COUNT(*) FROM reservations
+            UNION ALL SELECT 'total', 'users', COUNT(*) FROM users
+            UNION ALL SELECT 'total', 'subscribers', COUNT(*) FROM users WHERE COALESCE(subscription_status, 0) != 0
+            UNION ALL SELECT 'status', COALESCE(status, ''), COUNT(*) FROM equipment GROUP BY COALESCE(status, '')
+            UNION ALL SELECT 'location', COALESCE(location, ''), COUNT(*) FROM equipment_details GROUP BY COALESCE(location, '')
+            UNION ALL SELECT 'reservations', CAST(equipment_id AS TEXT), COUNT(*) FROM reservations GROUP BY equipment_id
+            UNION ALL {GROUP_STATS_SQL}
+        """)
+        conn.commit()
+
+def load_stats():
+    with db_lock:
+        cursor.execute("SELECT kind, key, value FROM stats_counters ORDER BY kind, value DESC, key")
+        rows = cursor.fetchall()
+    stats = {}
+    for kind, key, value in rows:
+        stats.setdefault(kind, {})[key] = value
+    return stats
+
+# Лічильники з'являються разом із тригерами, тож для наявної бази їх треба заповнити один раз
+with db_lock:
+    cursor.execute("SELECT COUNT(*) FROM stats_counters")
+    stats_empty = cursor.fetchone()[0] == 0
+if stats_empty or lookups_migrated:
+    rebuild_stats()
+with db_lock:
+    fill_group_stats(cursor)
+    conn.commit()
+
+# Журнал змін (change data capture) для інкрементальної синхронізації із
+# зовнішніми системами: кожна вставка, зміна чи видалення в equipment,
+# reservations, users та довідниках отримує монотонний номер seq
+CHANGE_LOG_KEEP = 10000  # скільки останніх записів журналу не ущільнювати
+CHANGE_LOG_TOMBSTONE_TTL = 30 * 24 * 3600  # скільки зберігати записи про видалення, секунд
+CHANGE_LOG_COMPACT_INTERVAL = 15 * 60  # як часто ущільнювати журнал, секунд
+CHANGE_LOG_COMPACT_BATCH = 5000  # номерів seq за один прохід ущільнення
+
+# Епоха даних: випадкове значення, яке змінюється після відновлення з копії,
+# щоб ETag HTTP API не збігся з виданим до відновлення
+DATA_EPOCH_SQL = """
+    CREATE TABLE IF NOT EXISTS data_epoch (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch TEXT NOT NULL
+    );
+    INSERT OR IGNORE INTO data_epoch (id, epoch) VALUES (1, lower(hex(randomblob(4))));
+"""
+
+def renew_data_epoch(cur):
+    # Копія могла бути зроблена до появи таблиці
+    cur.executescript(DATA_EPOCH_SQL)
+    cur.execute("UPDATE data_epoch SET epoch = lower(hex(randomblob(4)))")
+
+with db_lock:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'")
+    change_log_exists = cursor.fetchone() is not None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL,
+        changed_at INTEGER NOT NULL,
+        data TEXT
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id, seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_table ON change_log (table_name, seq)")  # Версії таблиць для ETag
+    cursor.executescript(DATA_EPOCH_SQL)
+    # Найбільший seq серед відкинутих записів про видалення: споживач, що
+    # відстав далі за нього, мусить перечитати журнал з нуля
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_log_purged (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL
+    )
+    """)
+
+    equipment_json = ("json_object('id', {0}.id, 'name', {0}.name, 'serial_number', {0}.serial_number, "
+                      "'location', (SELECT name FROM locations WHERE id = {0}.location_id), "
+                      "'responsible', (SELECT name FROM people WHERE id = {0}.responsible_id), 'status', {0}.status, "
+                      "'location_id', {0}.location_id, 'responsible_id', {0}.responsible_id, 'version', {0}.version)")
+    lookup_json = "json_object('id', {0}.id, 'name', {0}.name)"
+    reservation_json = "json_object('id', {0}.id, 'equipment_id', {0}.equipment_id, 'user_email', {0}.user_email, 'reservation_time', {0}.reservation_time, 'priority', {0}.priority)"
+    # Користувачі потрапляють у журнал без хешу пароля — лише для оновлення репліки
+    user_json = "json_object('id', {0}.id, 'email', {0}.email, 'role', {0}.role, 'subscription_status', {0}.subscription_status)"
+    for table, row_json in (("equipment", equipment_json), ("reservations", reservation_json), ("users", user_json),
+                            ("locations", lookup_json), ("people", lookup_json)):
+        for op, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_{op} AFTER {op.upper()} ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id, op, changed_at, data)
+                VALUES ('{table}', {row}.id, '{op}', CAST(strftime('%s', 'now') AS INTEGER), {row_json.format(row)});
+            END
+            """)
+        # Рядки, що існували до появи журналу, потрапляють у нього як вставки,
+        # щоб читання з seq 0 давало повний знімок
+        if not change_log_exists:
+            cursor.execute(f"""
+                INSERT INTO change_log (table_name, row_id, op, changed_at, data)
+                SELECT '{table}', id, 'insert', CAST(strftime('%s', 'now') AS INTEGER), {row_json.format(table)}
+                FROM {table} ORDER BY id
+            """)
+    # Журнал, заведений до переходу на цілі мітки часу, зберігає
+    # reservation_time рядком: перетворюємо так само, як колонку в таблиці
+    cursor.execute("""
+        UPDATE change_log
+        SET data = json_set(data, '$.reservation_time',
+                            COALESCE(CAST(strftime('%s', json_extract(data, '$.reservation_time'), 'utc') AS INTEGER), 0))
+        WHERE table_name = 'reservations' AND json_type(data, '$.reservation_time') = 'text'
+    """)
+    conn.commit()
+
+# Історія бронювань для симулятора черги: лише дописується і не ущільнюється,
+# на відміну від change_log. Заявку записує тригер, видачу — сам
+# process_queue_for_equipment у тій самій транзакції, а будь-яке інше
+# видалення (скасування, прострочене бронювання, видалення користувача)
+# тригер записує як скасування.
+RESERVATION_HISTORY_SQL = """
+    CREATE TABLE IF NOT EXISTS reservation_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reservation_id INTEGER NOT NULL,
+        equipment_id INTEGER NOT NULL,
+        user_email TEXT NOT NULL,
+        event TEXT NOT NULL,  -- request, dispatch або cancel
+        reservation_time INTEGER NOT NULL,
+        event_time INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_reservation_history_reservation ON reservation_history (reservation_id, event);
+    CREATE TRIGGER IF NOT EXISTS reservation_history_request AFTER INSERT ON reservations BEGIN
+        INSERT INTO reservation_history (reservation_id, equipment_id, user_email, event, reservation_time, event_time)
+        VALUES (NEW.id, NEW.equipment_id, NEW.user_email, 'request', NEW.reservation_time, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+    CREATE TRIGGER IF NOT EXISTS reservation_history_cancel AFTER DELETE ON reservations
+    WHEN NOT EXISTS (SELECT 1 FROM reservation_history WHERE reservation_id = OLD.id AND event = 'dispatch') BEGIN
+        INSERT INTO reservation_history (reservation_id, equipment_id, user_email, event, reservation_time, event_time)
+        VALUES (OLD.id, OLD.equipment_id, OLD.user_email, 'cancel', OLD.reservation_time, CAST(strftime('%s', 'now') AS INTEGER));
+    END;
+"""
+
+def record_dispatch(cur, reservation_id):
+    # Викликати в транзакції видачі перед видаленням бронювання
+    cur.execute("""
+        INSERT INTO reservation_history (reservation_id, equipment_id, user_email, event, reservation_time, event_time)
+        SELECT id, equipment_id, user_email, 'dispatch', reservation_time, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM reservations WHERE id = ?
+    """, (reservation_id,))
+
+with db_lock:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reservation_history'")
+    history_exists = cursor.fetchone() is not None
+    cursor.executescript(RESERVATION_HISTORY_SQL)
+    # Заявки, що лишилися в журналі змін, переносяться в історію. Видалення
+    # до появи історії не розрізнялися, тож видачами їх не вважаємо; рядкові
+    # мітки, які міграція не змогла розібрати (0), пропускаються.
+    if not history_exists:
+        cursor.execute("""
+            INSERT INTO reservation_history (reservation_id, equipment_id, user_email, event, reservation_time, event_time)
+            SELECT row_id, json_extract(data, '$.equipment_id'), json_extract(data, '$.user_email'), 'request',
+                   json_extract(data, '$.reservation_time'), changed_at
+            FROM change_log
+            WHERE table_name = 'reservations' AND op = 'insert'
+              AND json_type(data, '$.reservation_time') = 'integer' AND json_extract(data, '$.reservation_time') > 0
+            ORDER BY seq
+        """)
+    conn.commit()
+
+def read_changes(since_seq=0, limit=500, tables=None):
+    # Зміни з номером більшим за since_seq, не більше limit за раз
+    query = "SELECT seq, table_name, row_id, op, changed_at, data FROM change_log WHERE seq > ?"
+    params = [since_seq]
+    if tables:
+        query += f" AND table_name IN ({','.join('?' * len(tables))})"
+        params.extend(tables)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+    with db_lock:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    return [
+        {
+            "seq": row[0],
+            "table": row[1],
+            "row_id": row[2],
+            "op": row[3],
+            "changed_at": row[4],
+            "data": json.loads(row[5]) if row[5] else None,
+        } for row in rows
+    ]
+
+def change_log_gap(since_seq):
+    # True, якщо ущільнення вже відкинуло видалення після since_seq:
+    # такий споживач має скинути свою копію й читати журнал з нуля
+    with db_lock:
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log_purged")
+        return 0 < since_seq < cursor.fetchone()[0]
+
+def stream_changes(since_seq=0, batch_size=500, tables=None):
+    # Генератор пакетів змін: споживач забирає все після since_seq,
+    # тримаючи в пам'яті не більше одного пакета
+    while True:
+        batch = read_changes(since_seq, batch_size, tables)
+        if not batch:
+            return
+        yield batch
+        since_seq = batch[-1]["seq"]
+        if len(batch) < batch_size:
+            return
+
+def compact_change_log(keep=CHANGE_LOG_KEEP, tombstone_ttl=CHANGE_LOG_TOMBSTONE_TTL, batch_size=CHANGE_LOG_COMPACT_BATCH):
+    # Ущільнення: поза останніми keep записами для кожного рядка лишається лише
+    # найсвіжіша зміна, а старі записи про видалення відкидаються зовсім.
+    # Споживач, що відстав, все одно отримає актуальний стан кожного рядка.
+    # Журнал обробляється діапазонами по batch_size номерів seq з фіксацією
+    # після кожного, тож db_lock щоразу тримається недовго.
+    with db_lock:
+        cursor.execute("SELECT COALESCE(MIN(seq), 0), COALESCE(MAX(seq), 0) FROM change_log")
+        low, last = cursor.fetchone()
+    horizon = last - keep
+    expired = int(time.time()) - tombstone_ttl
+    removed = 0
+    while low <= horizon:
+        high = min(low + batch_size - 1, horizon)
+        with db_lock:
+            cursor.execute("""
+                DELETE FROM change_log
+                WHERE seq BETWEEN ? AND ? AND EXISTS (
+                    SELECT 1 FROM change_log later
+                    WHERE later.table_name = change_log.table_name
+                      AND later.row_id = change_log.row_id
+                      AND later.seq > change_log.seq
+                )
+            """, (low, high))
+            removed += cursor.rowcount
+            cursor.execute("SELECT MAX(seq) FROM change_log WHERE seq BETWEEN ? AND ? AND op = 'delete' AND changed_at < ?",
+                           (low, high, expired))
+            purged = cursor.fetchone()[0]
+            if purged is not None:
+                cursor.execute("""
+                    INSERT INTO change_log_purged (id, seq) VALUES (1, ?)
+                    ON CONFLICT (id) DO UPDATE SET seq = MAX(seq, excluded.seq)
+                """, (purged,))
+                cursor.execute("DELETE FROM change_log WHERE seq BETWEEN ? AND ? AND op = 'delete' AND changed_at < ?",
+                               (low, high, expired))
+                removed += cursor.rowcount
+            conn.commit()
+        low = high + 1
+    return removed
+
+# Резервне копіювання на льоту: Connection.backup копіює базу невеликими
+# порціями сторінок з паузами між ними, тож записи під db_lock не чекають
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 7  # скільки стиснених копій зберігати
+BACKUP_PAGES = 64  # сторінок за один крок
+BACKUP_SLEEP = 0.05  # пауза між кроками, секунд
+BACKUP_MAX_RESTARTS = 5  # скільки разів дозволено почати копіювання заново через паралельні записи
+BACKUP_INTERVAL = 6 * 3600  # як часто робити копію автоматично, секунд
+
+BACKUP_LOGS_DEFINITION = """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at INTEGER NOT NULL,
+        path TEXT,
+        duration_ms INTEGER NOT NULL,
+        pages INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        compressed_bytes INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL
+"""
+
+with db_lock:
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS backup_logs ({BACKUP_LOGS_DEFINITION})")
+    # Старі журнали зберігали час рядком, як і решта таблиць до міграції вище
+    migrate_timestamp_column(
+        "backup_logs", "created_at",
+        "id, created_at, path, duration_ms, pages, bytes, compressed_bytes, status",
+        BACKUP_LOGS_DEFINITION,
+    )
+    conn.commit()
+
+def copy_database(target, pages, sleep):
+    # Копіюємо з окремого з'єднання, щоб у знімок потрапили лише зафіксовані
+    # транзакції. Якщо інше з'єднання змінює базу, SQLite починає копію заново;
+    # після BACKUP_MAX_RESTARTS таких спроб копіюємо за один крок.
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise sqlite3.OperationalError("backup restarted too many times")
+        last_remaining = remaining
+
+    source = sqlite3.connect(DB_PATH)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        except sqlite3.OperationalError:
+            source.backup(target)
+    finally:
+        source.close()
+
+def rotate_backups(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    snapshots = sorted(glob.glob(os.path.join(backup_dir, "inventory-*.db.gz")))
+    for path in snapshots[:-keep] if keep > 0 else snapshots:
+        os.remove(path)
+
+def backup_database(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP):
+    os.makedirs(backup_dir, exist_ok=True)
+    created_at = datetime.now()
+    base_name = f"inventory-{created_at.strftime('%Y%m%d-%H%M%S-%f')}.db"
+    tmp_path = os.path.join(backup_dir, base_name + ".tmp")
+    path = os.path.join(backup_dir, base_name + ".gz")
+    started = time.monotonic()
+    report = {"path": None, "pages": 0, "bytes": 0, "compressed_bytes": 0, "status": "error"}
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            copy_database(target, pages, sleep)
+            report["status"] = target.execute("PRAGMA integrity_check").fetchone()[0]
+            report["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+        report["bytes"] = os.path.getsize(tmp_path)
+
+        if report["status"] == "ok":
+            with open(tmp_path, "rb") as src, gzip.open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            report["path"] = path
+            report["compressed_bytes"] = os.path.getsize(path)
+            rotate_backups(backup_dir, keep)
+    except (sqlite3.Error, OSError) as err:
+        report["status"] = f"error: {err}"
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    with db_lock:
+        cursor.execute("""
+            INSERT INTO backup_logs (created_at, path, duration_ms, pages, bytes, compressed_bytes, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (int(created_at.timestamp()), report["path"], report["duration_ms"],
+              report["pages"], report["bytes"], report["compressed_bytes"], report["status"]))
+        conn.commit()
+    return report
+
+def restore_backup(path):
+    # Відновлення, навпаки, блокує всіх: база підміняється цілком під db_lock
+    tmp_path = path + ".restore"
+    try:
+        with gzip.open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        source = sqlite3.connect(tmp_path)
+        try:
+            status = source.execute("PRAGMA integrity_check").fetchone()[0]
+            if status != "ok":
+                raise sqlite3.DatabaseError(f"integrity check failed: {status}")
+            with db_lock:
+                source.backup(conn)
+        finally:
+            source.close()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with db_lock:
+        renew_data_epoch(cursor)
+        conn.commit()
+    init_replica()
+    init_queue_ranks()
+
+# Репліка гарячих таблиць у пам'яті: усі запити лише на читання йдуть сюди,
+# а файлова база обслуговує записи. Після кожної фіксації репліка
+# підтягує зміни з change_log. Вимкнути: INVENTORY_READ_REPLICA=0
+READ_REPLICA = os.environ.get("INVENTORY_READ_REPLICA", "1") != "0"
+REPLICA_TABLES = ("equipment", "users", "reservations", "locations", "people")
+REPLICA_VIEWS = ("equipment_details",)
+
+replica_conn = None
+replica_lock = threading.Lock()
+replica_seq = 0
+
+def init_replica():
+    global replica_conn, replica_seq
+    if not READ_REPLICA:
+        return
+    # Копіюються лише гарячі таблиці (з індексами) та представлення над ними;
+    # журнали й інші холодні таблиці в пам'ять не потрапляють. Копія читає
+    # файл через ATTACH в одній транзакції читання: у режимі WAL це
+    # узгоджений знімок, і db_lock на час копіювання не потрібен. Зміни,
+    # зафіксовані після знімка, мають seq більший за збережений і
+    # потраплять у репліку з наступним refresh_replica.
+    replica = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+    replica.execute("ATTACH DATABASE ? AS source", (DB_PATH,))
+    replica.execute("BEGIN")
+    names = REPLICA_TABLES + REPLICA_VIEWS
+    schema = replica.execute(f"""
+        SELECT type, name, sql FROM source.sqlite_master
+        WHERE tbl_name IN ({','.join('?' * len(names))}) AND type IN ('table', 'index', 'view') AND sql IS NOT NULL
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+    """, names).fetchall()
+    for kind, name, sql in schema:
+        replica.execute(sql)
+        if kind == "table":
+            replica.execute(f"INSERT INTO main.{name} SELECT * FROM source.{name}")
+    seq = replica.execute("SELECT COALESCE(MAX(seq), 0) FROM source.change_log").fetchone()[0]
+    replica.execute("COMMIT")
+    replica.execute("DETACH DATABASE source")
+    replica.isolation_level = ""
+    with replica_lock:
+        old_replica = replica_conn
+        replica_conn = replica
+        replica_seq = seq
+    if old_replica is not None:
+        old_replica.close()
+
+def refresh_replica(source=None):
+    # Викликати одразу після фіксації: під db_lock для спільного з'єднання
+    # або з тим з'єднанням (source), через яке йшов запис
+    global replica_seq
+    source = source or conn
+    with replica_lock:
+        if replica_conn is None:
+            return
+        changes = source.execute(
+            f"SELECT seq, table_name, row_id, op FROM change_log WHERE seq > ? AND table_name IN ({','.join('?' * len(REPLICA_TABLES))}) ORDER BY seq",
+            (replica_seq, *REPLICA_TABLES)
+        ).fetchall()
+        if not changes:
+            return
+        for seq, table, row_id, op in changes:
+            row = None
+            if op != "delete":
+                row = source.execute(f"SELECT * FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            if row is None:
+                replica_conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+            else:
+                replica_conn.execute(f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' * len(row))})", row)
+        replica_conn.commit()
+        replica_seq = changes[-1][0]
+
+# Місця в черзі бронювань у пам'яті: для кожної техніки відсортований
+# список ключів (-priority, reservation_time, id) — у тому ж порядку, в
+# якому process_queue_for_equipment видає техніку. Для спільної бази списки
+# оновлюються з change_log після кожної фіксації (вставка чи видалення
+# одного ключа), тож місце користувача — bisect за O(log n), а не
+# сортування всієї черги. Шарди журналу змін не мають: черга техніки
+# шарда читається з індексу при першому зверненні й скидається після
+# кожної фіксації шарда.
+queue_ranks = {}  # шард (None — спільна база) -> {"queues", "keys", "complete", "generation"}
+queue_ranks_lock = threading.Lock()
+queue_ranks_seq = 0
+
+def new_queue_index(complete):
+    # queues: equipment_id -> відсортовані ключі; keys: id бронювання -> (equipment_id, ключ)
+    return {"queues": {}, "keys": {}, "complete": complete, "generation": 0}
+
+def queue_key(reservation_id, reservation_time, priority):
+    return (-priority, reservation_time, reservation_id)
+
+def queue_index_add(index, reservation_id, equipment_id, reservation_time, priority):
+    queue_index_remove(index, reservation_id)
+    key = queue_key(reservation_id, reservation_time, priority)
+    bisect.insort(index["queues"].setdefault(equipment_id, []), key)
+    index["keys"][reservation_id] = (equipment_id, key)
+
+def queue_index_remove(index, reservation_id):
+    entry = index["keys"].pop(reservation_id, None)
+    if entry is None:
+        return
+    equipment_id, key = entry
+    keys = index["queues"][equipment_id]
+    del keys[bisect.bisect_left(keys, key)]
+    if not keys:
+        del index["queues"][equipment_id]
+
+def queue_index_rank(index, reservation_id):
+    # (місце з 1, довжина черги) або None, якщо бронювання немає в індексі
+    entry = index["keys"].get(reservation_id)
+    if entry is None:
+        return None
+    equipment_id, key = entry
+    keys = index["queues"][equipment_id]
+    return bisect.bisect_left(keys, key) + 1, len(keys)
+
+def init_queue_ranks():
+    global queue_ranks_seq
+    index = new_queue_index(True)
+    with db_lock:
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        seq = cursor.fetchone()[0]
+        cursor.execute("SELECT id, equipment_id, reservation_time, priority FROM reservations ORDER BY equipment_id, priority DESC, reservation_time, id")
+        for equipment_id, rows in itertools.groupby(cursor.fetchall(), key=lambda row: row[1]):
+            # Рядки вже відсортовані, тож список черги будується без вставок
+            keys = index["queues"][equipment_id] = []
+            for reservation_id, _, reservation_time, priority in rows:
+                key = queue_key(reservation_id, reservation_time, priority)
+                keys.append(key)
+                index["keys"][reservation_id] = (equipment_id, key)
+    with queue_ranks_lock:
+        queue_ranks[None] = index
+        queue_ranks_seq = seq
+
+def refresh_queue_ranks(source=None):
+    # Як і refresh_replica: одразу після фіксації, читає лише нові записи журналу
+    global queue_ranks_seq
+    source = source or conn
+    with queue_ranks_lock:
+        index = queue_ranks.get(None)
+        if index is None:
+            return
+        changes = source.execute(
+            "SELECT seq, row_id, op, data FROM change_log WHERE seq > ? AND table_name = 'reservations' ORDER BY seq",
+            (queue_ranks_seq,)
+        ).fetchall()
+        for seq, row_id, op, data in changes:
+            if op == "delete":
+                queue_index_remove(index, row_id)
+            else:
+                row = json.loads(data)
+                queue_index_add(index, row_id, row["equipment_id"], row["reservation_time"], row["priority"])
+            queue_ranks_seq = seq
+
+def invalidate_queue_ranks(faculty):
+    with queue_ranks_lock:
+        index = queue_ranks.get(faculty)
+        if index is not None:
+            fresh = queue_ranks[faculty] = new_queue_index(False)
+            fresh["generation"] = index["generation"] + 1
+
+def queue_positions(db, reservations):
+    # reservations: [(id бронювання, equipment_id)] -> {id: (місце, довжина черги)}
+    with queue_ranks_lock:
+        index = queue_ranks.setdefault(db["name"], new_queue_index(False))
+        generation = index["generation"]
+        missing = set() if index["complete"] else {equipment_id for _, equipment_id in reservations} - set(index["queues"])
+    for equipment_id in missing:
+        rows = db["read"]("SELECT id, reservation_time, priority FROM reservations WHERE equipment_id = ?", (equipment_id,))
+        with queue_ranks_lock:
+            index = queue_ranks[db["name"]]
+            if index["generation"] != generation:
+                break  # шард змінився під час читання: покажемо місця наступного разу
+            for reservation_id, reservation_time, priority in rows:
+                queue_index_add(index, reservation_id, equipment_id, reservation_time, priority)
+    with queue_ranks_lock:
+        index = queue_ranks[db["name"]]
+        positions = {}
+        for reservation_id, _ in reservations:
+            rank = queue_index_rank(index, reservation_id)
+            if rank:
+                positions[reservation_id] = rank
+        return positions
+
+def benchmark_queue_ranks(reservations=100_000, equipment=20, lookups=10_000, changes=10_000):
+    # Порівнює місце в черзі з індексу з повним відсортованим запитом на
+    # кожного глядача (як у process_queue_for_equipment) на тимчасовій базі
+    rng = random.Random(42)
+    bench = sqlite3.connect(":memory:")
+    results = {"reservations": reservations, "equipment": equipment}
+    try:
+        bench.execute("CREATE TABLE reservations (id INTEGER PRIMARY KEY, equipment_id INTEGER, reservation_time INTEGER, priority INTEGER)")
+        bench.execute("CREATE INDEX idx_reservations_queue ON reservations (equipment_id, priority DESC, reservation_time)")
+        start = int(time.time()) - 90 * 24 * 3600
+        rows = [(i, rng.randrange(equipment), start + rng.randrange(90 * 24 * 3600), rng.choice((0, 0, 1, 2)))
+                for i in range(1, reservations + 1)]
+        bench.executemany("INSERT INTO reservations VALUES (?, ?, ?, ?)", rows)
+
+        started = time.monotonic()
+        index = new_queue_index(True)
+        for reservation_id, equipment_id, reservation_time, priority in rows:
+            queue_index_add(index, reservation_id, equipment_id, reservation_time, priority)
+        results["build_s"] = time.monotonic() - started
+
+        sample = rng.sample(rows, min(lookups, reservations))
+        started = time.monotonic()
+        for row in sample:
+            queue_index_rank(index, row[0])
+        results["index_lookup_us"] = (time.monotonic() - started) * 1e6 / len(sample)
+
+        # Повний запит повільний, тож для нього менша вибірка
+        mismatches = 0
+        started = time.monotonic()
+        for row in sample[:200]:
+            queue = [item[0] for item in bench.execute(
+                "SELECT id FROM reservations WHERE equipment_id = ? ORDER BY priority DESC, reservation_time ASC, id",
+                (row[1],)
+            )]
+            if queue_index_rank(index, row[0]) != (queue.index(row[0]) + 1, len(queue)):
+                mismatches += 1
+        results["full_query_lookup_us"] = (time.monotonic() - started) * 1e6 / len(sample[:200])
+        results["mismatches"] = mismatches
+
+        # Потік змін: нові бронювання, скасування й видачі навпіл
+        next_id = reservations + 1
+        started = time.monotonic()
+        for _ in range(changes // 2):
+            queue_index_add(index, next_id, rng.randrange(equipment), start + rng.randrange(90 * 24 * 3600), rng.choice((0, 0, 1, 2)))
+            queue_index_remove(index, rng.randrange(1, next_id))
+            next_id += 1
+        results["change_us"] = (time.monotonic() - started) * 1e6 / (changes // 2 * 2)
+    finally:
+        bench.close()
+    return results
+
+# Кеш ETag для API: (ресурс, факультет) -> (data_version, epoch, версія).
+# Свої записи скидають його явно; записи інших процесів (set-status,
+# restore) помічає PRAGMA data_version окремого з'єднання — він змінюється
+# після фіксації будь-якого іншого з'єднання і не читає таблиць
+etag_cache = {}
+etag_lock = threading.Lock()
+etag_watchers = {}  # шлях бази -> з'єднання для PRAGMA data_version
+
+def invalidate_etags():
+    with etag_lock:
+        etag_cache.clear()
+
+def data_version(path):
+    # Викликати під etag_lock
+    watcher = etag_watchers.get(path)
+    if watcher is None:
+        watcher = etag_watchers[path] = sqlite3.connect(path, check_same_thread=False)
+    return watcher.execute("PRAGMA data_version").fetchone()[0]
+
+def commit_changes():
+    # Фіксує транзакцію спільного з'єднання, оновлює репліку і черги; викликати під db_lock
+    conn.commit()
+    invalidate_etags()
+    refresh_replica()
+    refresh_queue_ranks()
+
+def read_query(query, params=()):
+    # Запит лише на читання по таблицях REPLICA_TABLES (і equipment_details)
+    if replica_conn is not None:
+        with replica_lock:
+            return replica_conn.execute(query, params).fetchall()
+    with db_lock:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+init_replica()
+init_queue_ranks()
+
+# Платежі: запит лише ставить платіж у чергу pending_payments з ключем
+# ідемпотентності, а фоновий обробник авторизує його в платіжному шлюзі і
+# однією транзакцією активує підписку та пише лог оплати
+PAYMENT_GATEWAY_TIMEOUT = 10  # секунд на одну спробу авторизації
+PAYMENT_MAX_ATTEMPTS = 5
+PAYMENT_RETRY_DELAY = 2  # базова затримка між спробами, подвоюється з кожною спробою
+PAYMENT_BATCH_SIZE = 20
+PAYMENT_STUB_LATENCY = 0.5  # затримка заглушки шлюзу, секунд
+
+with db_lock:
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pending_payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT UNIQUE NOT NULL,
+        user_email TEXT NOT NULL,
+        amount TEXT NOT NULL,
+        card_token TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        gateway_reference TEXT,
+        error TEXT,
+        FOREIGN KEY (user_email) REFERENCES users(email)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pending_payments_due ON pending_payments (status, next_attempt_at)")
+    conn.commit()
+
+def stub_tokenizer(card_number, expiry_date, cvv, timeout):
+    # Локальна заглушка токенізації: справжній шлюз повертає непрозорий
+    # токен картки, а номер і CVV у базу не потрапляють
+    return f"stub_{uuid.uuid4().hex}_{card_number[-4:]}"
+
+def stub_gateway(payment, timeout):
+    # Локальна заглушка шлюзу для тестування: схвалює всі картки, крім тих,
+    # що закінчуються на 0000
+    if PAYMENT_STUB_LATENCY > timeout:
+        time.sleep(timeout)
+        raise TimeoutError("Тайм-аут платіжного шлюзу")
+    time.sleep(PAYMENT_STUB_LATENCY)
+    if payment["card_token"].endswith("0000"):
+        return {"approved": False, "reason": "Картку відхилено"}
+    return {"approved": True, "reference": f"STUB-{payment['idempotency_key'][:12]}"}
+
+# Токенізатор — функція (номер, термін, CVV, timeout) -> токен картки; викликається
+# у payment_executor до submit_payment, тож у черзі зберігається лише токен, а
+# потік обробника сторінки не чекає на шлюз. Справжній токенізатор має:
+# - сам обмежувати час виклику значенням timeout (тайм-аут HTTP-клієнта);
+# - повертати непрозорий рядок без номера картки (останні 4 цифри допустимі)
+#   і ніде не зберігати CVV;
+# - видавати токен, придатний для повторних спроб шлюзу, доки платіж не завершено;
+# - бути потокобезпечним: кілька платежів токенізуються паралельно;
+# - піднімати OSError (зокрема TimeoutError) для помилки зв'язку і
+#   ValueError для відхиленої картки.
+# Шлюз — функція (payment, timeout) -> {"approved": bool, "reference" | "reason": str};
+# тайм-аут має виконувати сам шлюз (тайм-аут сокета чи HTTP-клієнта), а не
+# покинутий потік. Ключ ідемпотентності передається шлюзу, тож повтор після
+# тайм-ауту не спише кошти двічі.
+card_tokenizer = stub_tokenizer
+payment_gateway = stub_gateway
+
+payment_wakeup = threading.Event()
+payment_worker = None
+payment_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="payment-tokenize")
+
+def submit_payment(idempotency_key, user_email, amount, card_token):
+    # Повертає False, якщо платіж з таким ключем уже прийнято (подвійне натискання)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db_lock:
+        cursor.execute("""
+            INSERT OR IGNORE INTO pending_payments (idempotency_key, user_email, amount, card_token, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (idempotency_key, user_email, amount, card_token, now, now))
+        created = cursor.rowcount == 1
+        conn.commit()
+    payment_wakeup.set()
+    return created
+
+def tokenize_and_submit(idempotency_key, user_email, amount, card_number, expiry_date, cvv):
+    # Виконується в payment_executor: (прийнято, повідомлення для користувача)
+    try:
+        card_token = card_tokenizer(card_number, expiry_date, cvv, PAYMENT_GATEWAY_TIMEOUT)
+    except ValueError as err:
+        return False, f"Картку відхилено: {err}"
+    except OSError:
+        return False, "Платіжний шлюз недоступний, спробуйте пізніше."
+    try:
+        if submit_payment(idempotency_key, user_email, amount, card_token):
+            return True, "Платіж прийнято! Підписку буде активовано після підтвердження банком."
+        return True, "Цей платіж уже обробляється."
+    except sqlite3.Error as err:
+        return False, f"Помилка: {str(err)}"
+
+def has_pending_payment(user_email):
+    with db_lock:
+        cursor.execute("SELECT 1 FROM pending_payments WHERE user_email = ? AND status = 'pending' LIMIT 1", (user_email,))
+        return cursor.fetchone() is not None
+
+def authorize_payment(payment):
+    return payment_gateway(payment, PAYMENT_GATEWAY_TIMEOUT)
+
+def complete_payment(payment, reference):
+    # Підписка, лог оплати та статус платежу фіксуються однією транзакцією
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db_lock:
+        try:
+            cursor.execute("""
+                UPDATE users SET subscription_status = TRUE,
+                    subscription_expires_at = MAX(COALESCE(subscription_expires_at, 0), ?) + ?
+                WHERE email = ?
+            """, (int(time.time()), SUBSCRIPTION_PERIOD, payment["user_email"]))
+            cursor.execute("INSERT INTO payment_logs (user_email, amount, payment_time) VALUES (?, ?, ?)",
+                           (payment["user_email"], payment["amount"], int(time.time())))
+            cursor.execute("UPDATE pending_payments SET status = 'completed', gateway_reference = ?, updated_at = ? WHERE id = ?",
+                           (reference, now, payment["id"]))
+            commit_changes()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+def fail_payment(payment, status, error):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db_lock:
+        cursor.execute("UPDATE pending_payments SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                       (status, error, now, payment["id"]))
+        conn.commit()
+
+def retry_payment(payment, error):
+    attempts = payment["attempts"] + 1
+    if attempts >= PAYMENT_MAX_ATTEMPTS:
+        fail_payment(payment, "failed", error)
+        return
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with db_lock:
+        cursor.execute("UPDATE pending_payments SET attempts = ?, next_attempt_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                       (attempts, time.time() + PAYMENT_RETRY_DELAY * 2 ** payment["attempts"], error, now, payment["id"]))
+        conn.commit()
+
+def process_pending_payments(batch_size=PAYMENT_BATCH_SIZE):
+    with db_lock:
+        cursor.execute("""
+            SELECT id, idempotency_key, user_email, amount, card_token, attempts
+            FROM pending_payments
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id LIMIT ?
+        """, (time.time(), batch_size))
+        rows = cursor.fetchall()
+    for row in rows:
+        payment = dict(zip(("id", "idempotency_key", "user_email", "amount", "card_token", "attempts"), row))
+        try:
+            result = authorize_payment(payment)  # Поза db_lock: затримки шлюзу нікого не блокують
+        except TimeoutError:
+            retry_payment(payment, "Тайм-аут платіжного шлюзу")
+            continue
+        except Exception as err:
+            retry_payment(payment, str(err))
+            continue
+        if result.get("approved"):
+            complete_payment(payment, result.get("reference"))
+        else:
+            fail_payment(payment, "declined", result.get("reason"))
+    return len(rows)
+
+def run_payment_worker():
+    while True:
+        payment_wakeup.wait(timeout=1)
+        payment_wakeup.clear()
+        acquire_db()
+        try:
+            while process_pending_payments() == PAYMENT_BATCH_SIZE:
+                pass
+        except sqlite3.Error:
+            pass  # Спробуємо знову на наступному колі
+        finally:
+            release_db()
+
+def start_payment_worker():
+    global payment_worker
+    if payment_worker is None:
+        payment_worker = threading.Thread(target=run_payment_worker, name="payment-worker", daemon=True)
+        payment_worker.start()
+
+# Пріоритет бронювання: викладач — 2, студент з підпискою — 1, інші — 0
+PRIORITY_SQL = "CASE WHEN u.role = 'teacher' THEN 2 WHEN u.role = 'student' AND u.subscription_status THEN 1 ELSE 0 END"
+
+def reservation_priority(user_role, subscribed):
+    if user_role == "teacher":
+        return 2
+    if user_role == "student" and subscribed:
+        return 1
+    return 0
+
+# Фонові задачі обслуговування: один потік-планувальник виконує їх по черзі
+# невеликими пакетами. Під час пікового навантаження задачі відкладаються,
+# а після помилки повторюються з експоненційною затримкою.
+SCHEDULER_TICK = 1  # секунд між перевірками черги задач
+SCHEDULER_JITTER = 0.2  # випадкове відхилення інтервалу, частка
+SCHEDULER_MAX_BACKOFF = 3600  # найбільша затримка після помилок, секунд
+SCHEDULER_PEAK_SESSIONS = 20  # стільки сесій, активних за останню хвилину, вважаємо піком
+SCHEDULER_PEAK_DEFER = 60  # на скільки відкласти задачу під час піку, секунд
+MAINTENANCE_BATCH = 500  # рядків за один прохід задачі
+
+SUBSCRIPTION_EXPIRY_INTERVAL = 5 * 60
+PRIORITY_RECOMPUTE_INTERVAL = 10 * 60
+RESERVATION_PRUNE_INTERVAL = 60 * 60
+RESERVATION_MAX_AGE = 30 * 24 * 3600  # бронювання, старші за це, вважаються застарілими
+
+scheduled_jobs = {}
+scheduler_lock = threading.Lock()
+scheduler_thread = None
+
+def jittered(seconds):
+    return seconds * random.uniform(1 - SCHEDULER_JITTER, 1 + SCHEDULER_JITTER)
+
+def schedule_job(name, func, interval, low_priority=True):
+    # func повертає кількість оброблених рядків; повний пакет означає, що
+    # роботи лишилося ще, і задача продовжиться на наступному такті
+    with scheduler_lock:
+        scheduled_jobs[name] = {
+            "name": name,
+            "func": func,
+            "interval": interval,
+            "low_priority": low_priority,
+            "next_run": time.time() + jittered(interval),
+            "runs": 0,
+            "errors": 0,
+            "failures": 0,
+            "deferrals": 0,
+            "total_time": 0.0,
+            "last_time": 0.0,
+            "max_time": 0.0,
+            "last_run": None,
+            "last_result": None,
+            "last_error": None,
+        }
+
+def is_peak_load():
+    deadline = time.time() - 60
+    with sessions_lock:
+        active = sum(1 for entry in sessions.values() if entry["last_activity"] >= deadline)
+    return active >= SCHEDULER_PEAK_SESSIONS
+
+def run_job(job):
+    started = time.monotonic()
+    acquire_db()
+    try:
+        result = job["func"]()
+        error = None
+    except Exception as err:
+        result = None
+        error = f"{type(err).__name__}: {err}"
+    finally:
+        release_db()
+    elapsed = time.monotonic() - started
+
+    now = time.time()
+    with scheduler_lock:
+        job["runs"] += 1
+        job["last_run"] = now
+        job["last_time"] = elapsed
+        job["total_time"] += elapsed
+        job["max_time"] = max(job["max_time"], elapsed)
+        job["last_result"] = result
+        if error is None:
+            job["failures"] = 0
+            batch_full = isinstance(result, int) and result >= MAINTENANCE_BATCH
+            job["next_run"] = now + (SCHEDULER_TICK if batch_full else jittered(job["interval"]))
+        else:
+            job["errors"] += 1
+            job["failures"] += 1
+            job["last_error"] = error
+            job["next_run"] = now + jittered(min(job["interval"] * 2 ** job["failures"], SCHEDULER_MAX_BACKOFF))
+    return result
+
+def run_scheduler():
+    while True:
+        time.sleep(SCHEDULER_TICK)
+        now = time.time()
+        with scheduler_lock:
+            due = [job for job in scheduled_jobs.values() if job["next_run"] <= now]
+        for job in sorted(due, key=lambda job: job["next_run"]):
+            if job["low_priority"] and is_peak_load():
+                with scheduler_lock:
+                    job["deferrals"] += 1
+                    job["next_run"] = time.time() + jittered(SCHEDULER_PEAK_DEFER)
+                continue
+            run_job(job)
+
+def start_scheduler():
+    global scheduler_thread
+    if scheduler_thread is None:
+        scheduler_thread = threading.Thread(target=run_scheduler, name="maintenance-scheduler", daemon=True)
+        scheduler_thread.start()
+
+def job_stats():
+    now = time.time()
+    with scheduler_lock:
+        return [
+            {
+                "name": job["name"],
+                "runs": job["runs"],
+                "errors": job["errors"],
+                "deferrals": job["deferrals"],
+                "last_time": job["last_time"],
+                "avg_time": job["total_time"] / job["runs"] if job["runs"] else 0.0,
+                "max_time": job["max_time"],
+                "next_in": max(0, job["next_run"] - now),
+                "last_error": job["last_error"],
+            } for job in scheduled_jobs.values()
+        ]
+
+def expire_subscriptions(batch_size=MAINTENANCE_BATCH):
+    # Користувачі є лише у спільній базі, шарди обходити не треба
+    with db_lock:
+        cursor.execute("""
+            UPDATE users SET subscription_status = FALSE
+            WHERE id IN (
+                SELECT id FROM users
+                WHERE subscription_expires_at <= ? AND subscription_status
+                LIMIT ?
+            )
+        """, (int(time.time()), batch_size))
+        expired = cursor.rowcount
+        commit_changes()
+    return expired
+
+def recompute_reservation_priorities(batch_size=MAINTENANCE_BATCH):
+    # Пріоритет фіксується при бронюванні; після завершення чи оформлення
+    # підписки черга має це враховувати
+    with db_lock:
+        cursor.execute(f"""
+            UPDATE reservations SET priority = (
+                SELECT {PRIORITY_SQL} FROM users u WHERE u.email = reservations.user_email
+            )
+            WHERE id IN (
+                SELECT r.id FROM reservations r JOIN users u ON u.email = r.user_email
+                WHERE r.priority != {PRIORITY_SQL}
+                LIMIT ?
+            )
+        """, (batch_size,))
+        updated = cursor.rowcount
+        commit_changes()
+    for faculty in FACULTIES:
+        updated += recompute_shard_priorities(get_shard(faculty), batch_size)
+    return updated
+
+def recompute_shard_priorities(shard, batch_size=MAINTENANCE_BATCH):
+    # Користувачі живуть лише у спільній базі, тож пріоритети для бронювань
+    # шарда рахуються тут і записуються окремими UPDATE по користувачах
+    rows = shard["read"]("SELECT DISTINCT user_email, priority FROM reservations")
+    emails = sorted({email for email, _ in rows})
+    current = {}
+    for start in range(0, len(emails), 500):
+        chunk = emails[start:start + 500]
+        for email, user_role, subscribed in read_query(
+            f"SELECT email, role, subscription_status FROM users WHERE email IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            current[email] = reservation_priority(user_role, subscribed)
+    stale = sorted({(email, current[email]) for email, priority in rows if email in current and current[email] != priority})
+    updated = 0
+    with shard["lock"]:
+        for email, priority in stale:
+            if updated >= batch_size:
+                break
+            shard["cursor"].execute("""
+                UPDATE reservations SET priority = ? WHERE id IN (
+                    SELECT id FROM reservations WHERE user_email = ? AND priority != ? LIMIT ?
+                )
+            """, (priority, email, priority, batch_size - updated))
+            updated += shard["cursor"].rowcount
+        shard["commit"]()
+    return updated
+
+def prune_stale_reservations(batch_size=MAINTENANCE_BATCH, max_age=RESERVATION_MAX_AGE):
+    # Видалення й сповіщення власників — одна транзакція, як і видача техніки;
+    # проходить спільну базу й усі шарди
+    cutoff = int(time.time() - max_age)
+    pruned = 0
+    for db in all_databases():
+        with db["lock"]:
+            try:
+                db["cursor"].execute("""
+                    SELECT r.id, r.user_email, r.equipment_id, e.name FROM reservations r
+                    LEFT JOIN equipment e ON e.id = r.equipment_id
+                    WHERE r.reservation_time < ? LIMIT ?
+                """, (cutoff, batch_size))
+                rows = db["cursor"].fetchall()
+                db["cursor"].executemany("DELETE FROM reservations WHERE id = ?", [(row[0],) for row in rows])
+                for reservation_id, user_email, equipment_id, name in rows:
+                    enqueue_notification(
+                        db["cursor"], user_email, "Бронювання скасовано",
+                        f"Ваше бронювання \"{name or equipment_id}\" (ID {equipment_id}) скасовано: воно чекало в черзі довше "
+                        f"{max_age // (24 * 3600)} днів. За потреби забронюйте техніку знову.",
+                        f"reservation-expired:{db['name'] or ''}:{reservation_id}"
+                    )
+                db["commit"]()
+            except sqlite3.Error:
+                db["cursor"].connection.rollback()
+                raise
+        pruned += len(rows)
+    if pruned:
+        notification_wakeup.set()
+    return pruned
+
+# Інвентаризація: відскановані серійні номери буферизуються у тимчасовій
+# таблиці й звіряються з equipment кількома запитами на множинах
+AUDIT_INSERT_BATCH = 5000
+AUDIT_REPORT_LIMIT = 200  # скільки рядків кожного розділу звіту показувати в інтерфейсі
+UPLOAD_DIR = "uploads"
+
+def parse_scans(lines, default_location=None):
+    # Рядок — це "серійний номер" або "серійний номер,кабінет" (CSV, роздільник , або ;)
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        fields = next(csv.reader([line], delimiter=";" if ";" in line else ","))
+        serial = fields[0].strip()
+        if not serial or serial.lower() in ("serial", "serial_number", "серійний номер"):
+            continue
+        location = fields[1].strip() if len(fields) > 1 and fields[1].strip() else default_location
+        yield serial, location
+
+def run_audit(scans, full=False):
+    # full=True — пропущеною вважається будь-яка техніка, якої немає серед сканів;
+    # інакше лише техніка з кабінетів, які потрапили в скани.
+    # Звірка лише читає equipment, тож іде через окреме з'єднання: скани
+    # пишуться в його тимчасову таблицю, а запити в режимі WAL читають
+    # узгоджений знімок. db_lock не береться зовсім, і великий файл сканів
+    # не затримує записи інших користувачів.
+    started = time.monotonic()
+    audit_id = uuid.uuid4().hex
+    scans = iter(scans)
+    report = {"scanned": 0}
+    audit_conn = sqlite3.connect(DB_PATH)
+    audit_cursor = audit_conn.cursor()
+    try:
+        audit_cursor.execute("CREATE TEMP TABLE audit_scans (audit_id TEXT NOT NULL, serial_number TEXT NOT NULL, location TEXT, location_key TEXT)")
+        audit_cursor.execute("CREATE INDEX temp.idx_audit_scans ON audit_scans (audit_id, serial_number)")
+        while True:
+            batch = [(audit_id, serial, location, lookup_key(location) if location else None)
+                     for serial, location in itertools.islice(scans, AUDIT_INSERT_BATCH)]
+            if not batch:
+                break
+            audit_cursor.executemany("INSERT INTO audit_scans (audit_id, serial_number, location, location_key) VALUES (?, ?, ?, ?)", batch)
+            report["scanned"] += len(batch)
+        audit_conn.commit()
+
+        scope = "" if full else """
+            AND l.name_key IN (SELECT location_key FROM audit_scans WHERE audit_id = :audit_id AND location_key IS NOT NULL)
+        """
+        audit_cursor.execute("BEGIN")  # Усі три розділи звіту — з одного знімка
+        audit_cursor.execute(f"""
+            SELECT e.id, e.name, e.serial_number, l.name FROM equipment e
+            LEFT JOIN locations l ON l.id = e.location_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM audit_scans s WHERE s.audit_id = :audit_id AND s.serial_number = e.serial_number
+            ) {scope}
+            ORDER BY l.name, e.serial_number
+        """, {"audit_id": audit_id})
+        report["missing"] = audit_cursor.fetchall()
+
+        audit_cursor.execute("""
+            SELECT s.serial_number, MIN(s.location) FROM audit_scans s
+            WHERE s.audit_id = :audit_id
+              AND NOT EXISTS (SELECT 1 FROM equipment e WHERE e.serial_number = s.serial_number)
+            GROUP BY s.serial_number
+            ORDER BY s.serial_number
+        """, {"audit_id": audit_id})
+        report["unexpected"] = audit_cursor.fetchall()
+
+        audit_cursor.execute("""
+            SELECT e.id, e.name, e.serial_number, l.name, MIN(s.location) FROM audit_scans s
+            JOIN equipment e ON e.serial_number = s.serial_number
+            LEFT JOIN locations l ON l.id = e.location_id
+            WHERE s.audit_id = :audit_id AND s.location_key IS NOT NULL AND s.location_key != COALESCE(l.name_key, '')
+            GROUP BY e.id
+            ORDER BY l.name, e.serial_number
+        """, {"audit_id": audit_id})
+        report["relocated"] = audit_cursor.fetchall()
+        audit_conn.rollback()
+    finally:
+        audit_conn.close()  # Тимчасова таблиця зникає разом зі з'єднанням
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return report
+
+# Сповіщення: повідомлення пишуться в notification_outbox тією ж транзакцією,
+# що й зміна, яку вони описують (transactional outbox), а фоновий обробник
+# пакетами доставляє їх у канали. Канал — функція messages -> {id: помилка або
+# None}; повтори з експоненційною затримкою, dedup_key не дає поставити те саме
+# повідомлення двічі і передається каналу для дедуплікації на боці отримувача.
+# За замовчуванням лише журнал у stderr; пошта й вебхук вмикаються явно,
+# напр. INVENTORY_NOTIFY_CHANNELS=email,webhook, щоб без налаштованого SMTP
+# кожне повідомлення не витрачало всі спроби на недоступний сервер
+NOTIFY_CHANNELS = [channel.strip() for channel in os.environ.get("INVENTORY_NOTIFY_CHANNELS", "log").split(",") if channel.strip()]
+NOTIFY_SMTP_HOST = os.environ.get("INVENTORY_SMTP_HOST", "localhost")
+NOTIFY_SMTP_PORT = int(os.environ.get("INVENTORY_SMTP_PORT", "1025"))  # локальна заглушка, напр. python -m aiosmtpd -n
+NOTIFY_SMTP_SENDER = "inventory@localhost"
+NOTIFY_WEBHOOK_URL = os.environ.get("INVENTORY_NOTIFY_WEBHOOK", "http://127.0.0.1:8081/notify")
+NOTIFY_TIMEOUT = 5  # секунд на з'єднання з каналом
+NOTIFY_BATCH_SIZE = 50
+NOTIFY_MAX_ATTEMPTS = 6
+NOTIFY_RETRY_DELAY = 5  # базова затримка між спробами, подвоюється з кожною спробою
+NOTIFY_POLL_INTERVAL = 5  # як часто перевіряти відкладені повтори, секунд
+NOTIFY_RETENTION = 7 * 24 * 3600  # скільки зберігати доставлені повідомлення
+NOTIFY_PRUNE_INTERVAL = 6 * 60 * 60
+
+OUTBOX_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dedup_key TEXT UNIQUE NOT NULL,
+        channel TEXT NOT NULL,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        sent_at INTEGER,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_notification_outbox_due ON notification_outbox (status, next_attempt_at);
+"""
+
+with db_lock:
+    cursor.executescript(OUTBOX_TABLE_SQL)
+    conn.commit()
+
+def smtp_channel(messages):
+    # Усі листи пакета йдуть одним SMTP-з'єднанням
+    errors = {}
+    with smtplib.SMTP(NOTIFY_SMTP_HOST, NOTIFY_SMTP_PORT, timeout=NOTIFY_TIMEOUT) as smtp:
+        for message in messages:
+            email = EmailMessage()
+            email["From"] = NOTIFY_SMTP_SENDER
+            email["To"] = message["recipient"]
+            email["Subject"] = message["subject"]
+            email["Message-ID"] = f"<{message['dedup_key']}@inventory>"
+            email.set_content(message["body"])
+            try:
+                smtp.send_message(email)
+                errors[message["id"]] = None
+            except smtplib.SMTPException as err:
+                errors[message["id"]] = str(err)
+    return errors
+
+def webhook_channel(messages):
+    # Один POST з усім пакетом; отримувач відсіює повтори за dedup_key
+    payload = json.dumps([
+        {key: message[key] for key in ("dedup_key", "recipient", "subject", "body")} for message in messages
+    ], ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(NOTIFY_WEBHOOK_URL, data=payload, method="POST",
+                                     headers={"Content-Type": "application/json; charset=utf-8"})
+    with urllib.request.urlopen(request, timeout=NOTIFY_TIMEOUT):
+        pass  # HTTPError (не 2xx) піднімається і позначає весь пакет до повтору
+    return {message["id"]: None for message in messages}
+
+def log_channel(messages):
+    # Канал за замовчуванням: повідомлення лише пишуться в stderr
+    for message in messages:
+        print(f"[сповіщення] {message['recipient']}: {message['subject']} — {message['body']}", file=sys.stderr)
+    return {message["id"]: None for message in messages}
+
+notification_channels = {"log": log_channel, "email": smtp_channel, "webhook": webhook_channel}
+
+notification_wakeup = threading.Event()
+notification_worker = None
+notification_metrics_lock = threading.Lock()
+notification_metrics = {"sent": 0, "retried": 0, "failed": 0, "batches": 0, "busy_seconds": 0.0, "last_batch": 0, "last_batch_ms": 0}
+
+def enqueue_notification(cur, recipient, subject, body, dedup_key):
+    # Викликати всередині транзакції, яку фіксує сам викликач
+    now = int(time.time())
+    for channel in NOTIFY_CHANNELS:
+        cur.execute("""
+            INSERT OR IGNORE INTO notification_outbox (dedup_key, channel, recipient, subject, body, next_attempt_at, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (f"{dedup_key}:{channel}", channel, recipient, subject, body, now, now))
+
+def deliver_notifications(messages):
+    errors = {}
+    messages = sorted(messages, key=lambda message: message["channel"])
+    for channel, group in itertools.groupby(messages, key=lambda message: message["channel"]):
+        group = list(group)
+        deliver = notification_channels.get(channel)
+        try:
+            if deliver is None:
+                raise KeyError(f"Невідомий канал: {channel}")
+            errors.update(deliver(group))
+        except Exception as err:
+            errors.update({message["id"]: str(err) or type(err).__name__ for message in group})
+    return errors
+
+def process_outbox(db, batch_size=NOTIFY_BATCH_SIZE):
+    now = int(time.time())
+    with db["lock"]:
+        db["cursor"].execute("""
+            SELECT id, dedup_key, channel, recipient, subject, body, attempts FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id LIMIT ?
+        """, (now, batch_size))
+        rows = db["cursor"].fetchall()
+    if not rows:
+        return 0
+    started = time.monotonic()
+    messages = [dict(zip(("id", "dedup_key", "channel", "recipient", "subject", "body", "attempts"), row)) for row in rows]
+    errors = deliver_notifications(messages)  # Поза замком: повільний канал нікого не блокує
+
+    now = int(time.time())
+    sent, retried, failed = [], [], []
+    for message in messages:
+        error = errors.get(message["id"], "Канал не підтвердив доставку")
+        if error is None:
+            sent.append((now, message["id"]))
+        elif message["attempts"] + 1 >= NOTIFY_MAX_ATTEMPTS:
+            failed.append((message["attempts"] + 1, error, message["id"]))
+        else:
+            retried.append((message["attempts"] + 1, now + NOTIFY_RETRY_DELAY * 2 ** message["attempts"], error, message["id"]))
+    with db["lock"]:
+        db["cursor"].executemany("UPDATE notification_outbox SET status = 'sent', sent_at = ?, error = NULL WHERE id = ?", sent)
+        db["cursor"].executemany("UPDATE notification_outbox SET status = 'failed', attempts = ?, error = ? WHERE id = ?", failed)
+        db["cursor"].executemany("UPDATE notification_outbox SET attempts = ?, next_attempt_at = ?, error = ? WHERE id = ?", retried)
+        db["commit"]()
+
+    elapsed = time.monotonic() - started
+    with notification_metrics_lock:
+        notification_metrics["sent"] += len(sent)
+        notification_metrics["retried"] += len(retried)
+        notification_metrics["failed"] += len(failed)
+        notification_metrics["batches"] += 1
+        notification_metrics["busy_seconds"] += elapsed
+        notification_metrics["last_batch"] = len(rows)
+        notification_metrics["last_batch_ms"] = int(elapsed * 1000)
+    return len(rows)
+
+def notification_stats():
+    with notification_metrics_lock:
+        stats = dict(notification_metrics)
+    stats["per_second"] = stats["sent"] / stats["busy_seconds"] if stats["busy_seconds"] else 0.0
+    stats["pending"] = 0
+    for db in all_databases():
+        with db["lock"]:
+            db["cursor"].execute("SELECT COUNT(*) FROM notification_outbox WHERE status = 'pending'")
+            stats["pending"] += db["cursor"].fetchone()[0]
+    return stats
+
+def prune_notification_outbox(batch_size=MAINTENANCE_BATCH):
+    cutoff = int(time.time()) - NOTIFY_RETENTION
+    removed = 0
+    for db in all_databases():
+        with db["lock"]:
+            db["cursor"].execute("""
+                DELETE FROM notification_outbox WHERE id IN (
+                    SELECT id FROM notification_outbox WHERE status = 'sent' AND sent_at < ? LIMIT ?
+                )
+            """, (cutoff, batch_size))
+            removed += db["cursor"].rowcount
+            db["commit"]()
+    return removed
+
+def run_notification_worker():
+    while True:
+        notification_wakeup.wait(timeout=NOTIFY_POLL_INTERVAL)
+        notification_wakeup.clear()
+        acquire_db()
+        try:
+            for db in all_databases():
+                while process_outbox(db) == NOTIFY_BATCH_SIZE:
+                    pass
+        except sqlite3.Error:
+            pass  # Спробуємо знову на наступному колі
+        finally:
+            release_db()
+
+def start_notification_worker():
+    global notification_worker
+    if notification_worker is None:
+        notification_worker = threading.Thread(target=run_notification_worker, name="notification-worker", daemon=True)
+        notification_worker.start()
+
+# Експорт звітів: задача виконується у фоновому пулі на окремому з'єднанні
+# лише для читання (у WAL воно не блокує записи), рядки читаються пакетами
+# і одразу пишуться у файл, тож пам'ять не залежить від розміру таблиці.
+# Готовий файл лежить у exports/<випадковий ключ>/ поза assets, тож Flet його
+# не віддає: завантажити його можна лише один раз через HTTP API за ключем,
+# який бачить тільки сесія адміністратора, що запустила експорт; після
+# завантаження файл видаляється. XLSX потребує openpyxl (є в requirements.txt).
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports")
+UI_HOST = os.environ.get("INVENTORY_UI_HOST", "192.168.1.7")  # адреса, на якій Flet віддає веб-інтерфейс
+EXPORT_URL = os.environ.get("INVENTORY_EXPORT_URL")  # адреса HTTP API для браузера, якщо API не видно за UI_HOST/API_HOST
+EXPORT_BATCH = 1000  # рядків за одне читання з курсора
+EXPORT_PROGRESS_INTERVAL = 0.5  # секунд між повідомленнями про прогрес
+EXPORT_TTL = 60 * 60  # скільки зберігати готові, але не завантажені файли
+EXPORT_PRUNE_INTERVAL = 60 * 60
+
+# звіт -> (назва, заголовки, запит, колонка часу для відбору за місяць,
+#          номери колонок з unix-часом, чи лежить таблиця в шардах)
+EXPORT_REPORTS = {
+    "users": ("Користувачі", ("ID", "Логін", "Роль", "Підписка", "Підписка до", "Факультет"),
+              "SELECT id, email, role, subscription_status, subscription_expires_at, faculty FROM users", None, (4,), False),
+    "login_logs": ("Логи входу", ("ID", "Логін", "Час входу", "Пристрій"),
+                   "SELECT id, email, login_time, device_info FROM login_logs", "login_time", (2,), True),
+    "payment_logs": ("Платежі", ("ID", "Логін", "Сума", "Час оплати"),
+                     "SELECT id, user_email, amount, payment_time FROM payment_logs", "payment_time", (3,), False),
+    "reservations": ("Бронювання", ("ID", "Логін", "ID техніки", "Назва", "Серійний номер", "Кабінет", "Час бронювання", "Пріоритет"),
+                     """SELECT r.id, r.user_email, r.equipment_id, e.name, e.serial_number, e.location, r.reservation_time, r.priority
+                        FROM reservations r LEFT JOIN equipment_details e ON e.id = r.equipment_id""", "r.reservation_time", (6,), True),
+}
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+
+export_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+export_jobs = {}
+export_jobs_lock = threading.Lock()
+
+def export_base_url():
+    # Посилання відкриває браузер користувача, тож адреса API має бути
+    # доступна з його машини. None — такої адреси немає (API лише на loopback)
+    if EXPORT_URL:
+        return EXPORT_URL.rstrip("/")
+    if API_HOST in ("", "0.0.0.0", "::"):
+        return f"http://{UI_HOST}:{API_PORT}"  # API слухає всі інтерфейси, зокрема той, де відкрито інтерфейс
+    try:
+        loopback = API_HOST == "localhost" or ipaddress.ip_address(API_HOST).is_loopback
+    except ValueError:
+        loopback = False
+    return None if loopback else f"http://{API_HOST}:{API_PORT}"
+
+def xlsx_available():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def month_range(month):
+    # "2026-09" -> [початок, кінець) місяця місцевого часу в unix-секундах
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+def export_rows(job, source):
+    # Генератор рядків звіту; по дорозі оновлює лічильник у задачі
+    _, _, query, time_column, ts_columns, _ = EXPORT_REPORTS[job["report"]]
+    params = ()
+    if job["month"] and time_column:
+        query += f" WHERE {time_column} >= ? AND {time_column} < ?"
+        params = month_range(job["month"])
+    job["total"] = source.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+    rows = source.execute(query + " ORDER BY 1", params)
+    last_report = 0
+    while True:
+        batch = rows.fetchmany(EXPORT_BATCH)
+        if not batch:
+            break
+        for row in batch:
+            yield [format_ts(value) if index in ts_columns else value for index, value in enumerate(row)]
+        job["rows"] += len(batch)
+        if time.monotonic() - last_report >= EXPORT_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            notify_export(job)
+
+def write_csv(path, headers, rows):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:  # BOM, щоб Excel розпізнав UTF-8
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+def write_xlsx(path, headers, rows, title):
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)  # Рядки пишуться потоком, без дерева клітинок у пам'яті
+    sheet = workbook.create_sheet(title[:31])
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def notify_export(job):
+    callback = job.get("on_progress")
+    if callback is not None:
+        try:
+            callback(export_job_info(job))
+        except Exception:
+            pass  # Сесія могла вже закритися; експорт від цього не залежить
+
+def export_job_info(job):
+    return {key: job[key] for key in ("id", "report", "format", "month", "status", "rows", "total", "url", "error", "created")}
+
+def run_export(job):
+    title, headers, _, _, _, _ = EXPORT_REPORTS[job["report"]]
+    token = uuid.uuid4().hex + uuid.uuid4().hex
+    filename = f"{job['report']}-{job['month'] or 'all'}.{job['format']}"
+    directory = os.path.join(EXPORT_DIR, token)
+    os.makedirs(directory, exist_ok=True)
+    partial = os.path.join(directory, filename + ".part")
+    job["status"] = "running"
+    notify_export(job)
+    source = sqlite3.connect(f"file:{job['path']}?mode=ro", uri=True)
+    try:
+        rows = export_rows(job, source)
+        if job["format"] == "xlsx":
+            write_xlsx(partial, headers, rows, title)
+        else:
+            write_csv(partial, headers, rows)
+        os.replace(partial, os.path.join(directory, filename))
+        job["file"] = os.path.join(directory, filename)
+        job["download_key"] = token
+        job["url"] = f"{export_base_url()}/exports/{token}"
+        job["status"] = "done"
+    except Exception as err:
+        job["status"] = "failed"
+        job["error"] = str(err)
+        shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        source.close()
+    notify_export(job)
+
+def submit_export(report, fmt="csv", month=None, path=DB_PATH, session_id=None, on_progress=None):
+    # ValueError для невідомого звіту, формату чи місяця; задача виконується у фоні
+    if report not in EXPORT_REPORTS or fmt not in EXPORT_FORMATS:
+        raise ValueError("Невідомий звіт або формат")
+    if fmt == "xlsx" and not xlsx_available():
+        raise ValueError("Для XLSX потрібен пакет openpyxl")
+    if not API_PORT:
+        raise ValueError("Файли звітів віддає HTTP API, а його вимкнено (INVENTORY_API_PORT=0)")
+    if export_base_url() is None:
+        raise ValueError(f"HTTP API слухає лише {API_HOST}, браузер не завантажить файл: задайте INVENTORY_EXPORT_URL або INVENTORY_API_HOST")
+    if month:
+        try:
+            month_range(month)
+        except ValueError:
+            raise ValueError("Місяць має бути у форматі РРРР-ММ")
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "report": report,
+        "format": fmt,
+        "month": month or None,
+        "path": path if EXPORT_REPORTS[report][5] else DB_PATH,
+        "session_id": session_id,
+        "on_progress": on_progress,
+        "status": "queued",
+        "rows": 0,
+        "total": None,
+        "url": None,
+        "file": None,
+        "download_key": None,
+        "error": None,
+        "created": time.time(),
+    }
+    with export_jobs_lock:
+        export_jobs[job["id"]] = job
+    export_executor.submit(run_export, job)
+    return export_job_info(job)
+
+def session_exports(session_id):
+    with export_jobs_lock:
+        return [export_job_info(job) for job in export_jobs.values() if job["session_id"] == session_id]
+
+def forget_session_exports(session_id):
+    # Закрита сесія більше не отримує прогрес; файли живуть до prune_exports
+    with export_jobs_lock:
+        for job in export_jobs.values():
+            if job["session_id"] == session_id:
+                job["on_progress"] = None
+
+def take_export(key):
+    # (шлях, ім'я файлу, формат) готового експорту за ключем завантаження або
+    # None. Ключ одноразовий: задача одразу позначається завантаженою, а файл
+    # видаляє той, хто його віддав (release_export).
+    with export_jobs_lock:
+        job = next((job for job in export_jobs.values() if job["download_key"] == key and job["status"] == "done"), None)
+        if job is None or not os.path.exists(job["file"]):
+            return None
+        job["status"] = "downloaded"
+        job["download_key"] = None
+    notify_export(job)
+    return job["file"], os.path.basename(job["file"]), job["format"]
+
+def release_export(path):
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+def prune_exports():
+    cutoff = time.time() - EXPORT_TTL
+    removed = 0
+    with export_jobs_lock:
+        for job_id in [job_id for job_id, job in export_jobs.items() if job["created"] < cutoff and job["status"] in ("done", "downloaded", "failed")]:
+            del export_jobs[job_id]
+    for directory in glob.glob(os.path.join(EXPORT_DIR, "*")):
+        if os.path.getmtime(directory) < cutoff:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+    return removed
+
+# Шардування за факультетами (необов'язкове): INVENTORY_FACULTIES="fit,econ,law"
+# вмикає режим, у якому техніка, бронювання та логи входу кожного факультету
+# живуть в окремому файлі shards/<факультет>.db зі своїм замком на запис і
+# пулом з'єднань для читання. Користувачі, платежі та службові таблиці
+# лишаються в inventory.db; журнал змін, репліка, інвентаризація та фонові
+# задачі працюють лише з нею.
+FACULTIES = [faculty.strip() for faculty in os.environ.get("INVENTORY_FACULTIES", "").split(",") if faculty.strip()]
+SHARD_DIR = "shards"
+SHARD_POOL_SIZE = 4  # з'єднань для читання на кожен шард
+
+shards = {}
+shards_lock = threading.Lock()
+shard_executor = ThreadPoolExecutor(max_workers=max(1, len(FACULTIES)), thread_name_prefix="shard-query")
+
+# У шардах немає журналу змін, тому версії таблиць для ETag ведуть тригери
+SHARD_VERSIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS shard_table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+""" + "".join(f"""
+    CREATE TRIGGER IF NOT EXISTS shard_version_{table}_{op} AFTER {op.upper()} ON {table} BEGIN
+        INSERT INTO shard_table_versions (table_name, version) VALUES ('{table}', 1)
+        ON CONFLICT (table_name) DO UPDATE SET version = version + 1;
+    END;
+""" for table in ("equipment", "reservations", "locations", "people") for op in ("insert", "update", "delete"))
+
+def create_shard_schema(shard_conn):
+    shard_conn.executescript(LOOKUP_TABLES_SQL)
+    shard_conn.execute(EQUIPMENT_TABLE_SQL)
+    try:
+        shard_conn.execute(EQUIPMENT_VERSION_SQL)
+    except sqlite3.OperationalError:
+        pass  # Колонка вже існує
+    shard_conn.executescript(EQUIPMENT_INDEXES_SQL + EQUIPMENT_VIEW_SQL + TRIGRAM_TABLE_SQL)
+    for table in ("login_logs", "reservations"):
+        shard_conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({TIMESTAMP_COLUMNS[table][2]})")
+    shard_conn.execute("CREATE INDEX IF NOT EXISTS idx_login_logs_time ON login_logs (login_time)")
+    shard_conn.execute("CREATE INDEX IF NOT EXISTS idx_reservations_time ON reservations (reservation_time)")
+    shard_conn.execute("CREATE INDEX IF NOT EXISTS idx_reservations_queue ON reservations (equipment_id, priority DESC, reservation_time)")
+    history_exists = shard_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reservation_history'").fetchone()
+    shard_conn.executescript(RESERVATION_HISTORY_SQL)
+    if not history_exists:
+        shard_conn.execute("""
+            INSERT INTO reservation_history (reservation_id, equipment_id, user_email, event, reservation_time, event_time)
+            SELECT id, equipment_id, user_email, 'request', reservation_time, reservation_time FROM reservations
+            WHERE typeof(reservation_time) = 'integer' ORDER BY id
+        """)
+    shard_conn.executescript(OUTBOX_TABLE_SQL)
+    shard_conn.execute(STATS_TABLE_SQL)
+    shard_conn.executescript(STATS_INVENTORY_TRIGGERS_SQL)
+    fill_group_stats(shard_conn.cursor())
+    shard_conn.executescript(DATA_EPOCH_SQL + SHARD_VERSIONS_SQL)
+    shard_conn.commit()
+
+def shard_read(shard, query, params=()):
+    reader = shard["pool"].get()
+    try:
+        return reader.execute(query, params).fetchall()
+    finally:
+        shard["pool"].put(reader)
+
+def get_shard(faculty):
+    with shards_lock:
+        shard = shards.get(faculty)
+        if shard is not None:
+            return shard
+        if faculty not in FACULTIES:
+            raise KeyError(f"Невідомий факультет: {faculty}")
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        path = os.path.join(SHARD_DIR, f"{faculty}.db")
+        writer = sqlite3.connect(path, check_same_thread=False)
+        writer.execute("PRAGMA journal_mode = WAL")  # Читачі з пулу не чекають на записи
+        create_shard_schema(writer)
+        pool = queue.Queue()
+        for _ in range(SHARD_POOL_SIZE):
+            pool.put(sqlite3.connect(path, check_same_thread=False))
+        shard = {
+            "name": faculty,
+            "path": path,
+            "lock": threading.Lock(),
+            "cursor": writer.cursor(),
+            "commit": lambda: (writer.commit(), invalidate_etags(), invalidate_queue_ranks(faculty)),
+            "pool": pool,
+        }
+        shard["read"] = lambda query, params=(): shard_read(shard, query, params)
+        shards[faculty] = shard
+        return shard
+
+def primary_db():
+    # Той самий інтерфейс, що й у шарда, для спільної бази
+    return {"name": None, "path": DB_PATH, "lock": db_lock, "cursor": cursor, "commit": commit_changes, "read": read_query}
+
+def all_databases():
+    # Спільна база й усі шарди: по них проходять задачі обслуговування та сповіщення
+    return [primary_db()] + [get_shard(faculty) for faculty in FACULTIES]
+
+def faculty_db(faculty):
+    if FACULTIES and faculty in FACULTIES:
+        return get_shard(faculty)
+    return primary_db()
+
+def scatter_gather(query, params=()):
+    # Виконує запит на всіх шардах паралельно: {факультет: рядки}
+    futures = {faculty: shard_executor.submit(shard_read, get_shard(faculty), query, params) for faculty in FACULTIES}
+    return {faculty: future.result() for faculty, future in futures.items()}
+
+def faculty_report():
+    since = int(time.time()) - 7 * 24 * 3600
+    counters = scatter_gather("""
+        SELECT kind, key, value FROM stats_counters
+        WHERE kind = 'total' OR (kind = 'status' AND key = 'Потрібен ремонт')
+    """)
+    logins = scatter_gather("SELECT COUNT(*) FROM login_logs WHERE login_time >= ?", (since,))
+    report = []
+    for faculty in FACULTIES:
+        values = {(kind, key): value for kind, key, value in counters[faculty]}
+        report.append({
+            "faculty": faculty,
+            "equipment": values.get(("total", "equipment"), 0),
+            "broken": values.get(("status", "Потрібен ремонт"), 0),
+            "reservations": values.get(("total", "reservations"), 0),
+            "logins_week": logins[faculty][0][0],
+        })
+    return report
+
+def initialize_equipment_data():
+    with db_lock:
+        cursor.execute("SELECT COUNT(*) FROM equipment")
+        count = cursor.fetchone()[0]
+        if count == 0:  # Додаємо записи лише якщо таблиця порожня
+            equipment_data = [
+                ("Ноутбук Dell", "SN001", "Кабінет 101", "Іванов І.Б", "Справна"),
+                ("Принтер HP", "SN002", "Кабінет 102", "Петров Б.Б", "Потрібен ремонт"),
+                ("Проектор Epson", "SN003", "Кабінет 103", "Сидорова К.Г", "Справна"),
+                ("Монітор LG", "SN004", "Кабінет 104", "Коваленко О.А", "Справна"),
+                ("Сканер Canon", "SN005", "Кабінет 105", "Григоренко С.Р", "Потрібен ремонт"),
+                ("Комп'ютер Lenovo", "SN006", "Кабінет 106", "Лисенко Р.Н", "Справна")
+            ]
+            for row in equipment_data:
+                insert_equipment(cursor, *row)
+            commit_changes()
+
+# Редагування техніки з оптимістичним блокуванням: рядок equipment має
+# version, і зміна проходить, лише якщо версія не змінилася з моменту читання
+# (compare-and-swap). Запис іде не через спільне з'єднання під db_lock, а через
+# окреме з'єднання потоку з коротким busy-таймаутом: конкурентна зміна одразу
+# отримує конфлікт або sqlite3.OperationalError, а не чекає в черзі.
+EDIT_BUSY_TIMEOUT = 0.5  # секунд
+EQUIPMENT_STATUSES = ("Справна", "Потрібен ремонт", "Списана")
+EDIT_POOL_SIZE = 4  # з'єднань на файл бази для редагувань і читань без db_lock
+
+# Обмежений пул на кожен файл бази: з'єднання відкриваються за потреби і
+# повертаються в пул, тож потоки обробників Flet не накопичують відкритих
+# з'єднань і читачів WAL
+edit_pools = {}
+edit_pools_lock = threading.Lock()
+
+def acquire_edit_connection(path):
+    with edit_pools_lock:
+        pool = edit_pools.get(path)
+        if pool is None:
+            pool = edit_pools[path] = queue.Queue()
+            for _ in range(EDIT_POOL_SIZE):
+                pool.put(None)
+    edit_conn = pool.get()
+    if edit_conn is None:
+        try:
+            edit_conn = sqlite3.connect(path, timeout=EDIT_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        except sqlite3.Error:
+            pool.put(None)
+            raise
+    return edit_conn
+
+def release_edit_connection(path, edit_conn):
+    edit_pools[path].put(edit_conn)
+
+def begin_edit(db):
+    path = db.get("path", DB_PATH)
+    edit_conn = acquire_edit_connection(path)
+    try:
+        edit_conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.Error:
+        release_edit_connection(path, edit_conn)
+        raise
+    return edit_conn
+
+def finish_edit(db, edit_conn, commit):
+    # Завершує транзакцію й повертає з'єднання в пул
+    try:
+        try:
+            edit_conn.execute("COMMIT" if commit else "ROLLBACK")
+        except sqlite3.Error:
+            if edit_conn.in_transaction:
+                edit_conn.execute("ROLLBACK")
+            raise
+        if not commit:
+            return
+        invalidate_etags()
+        if db["name"] is None:
+            refresh_replica(edit_conn)
+            refresh_queue_ranks(edit_conn)
+        else:
+            invalidate_queue_ranks(db["name"])
+    finally:
+        release_edit_connection(db.get("path", DB_PATH), edit_conn)
+
+def update_equipment(db, equipment_id, version, status, location, responsible):
+    # Нова версія запису або None, якщо його вже змінили чи видалили
+    edit_conn = begin_edit(db)
+    try:
+        edit_cursor = edit_conn.cursor()
+        location_id = lookup_id(edit_cursor, "locations", location)
+        responsible_id = lookup_id(edit_cursor, "people", responsible)
+        edit_cursor.execute("""
+            UPDATE equipment SET status = ?, location_id = ?, responsible_id = ?, version = version + 1
+            WHERE id = ? AND version = ?
+        """, (status, location_id, responsible_id, equipment_id, version))
+        updated = edit_cursor.rowcount == 1
+    except BaseException:
+        finish_edit(db, edit_conn, False)
+        raise
+    finish_edit(db, edit_conn, updated)
+    return version + 1 if updated else None
+
+def update_status_batch(db, versions, status):
+    # versions: {id: прочитана версія}; одна транзакція на всю партію.
+    # Повертає (оновлені id, id, які встигли змінити інші)
+    updated, conflicts = [], []
+    edit_conn = begin_edit(db)
+    try:
+        edit_cursor = edit_conn.cursor()
+        for equipment_id, version in versions.items():
+            edit_cursor.execute("UPDATE equipment SET status = ?, version = version + 1 WHERE id = ? AND version = ?",
+                                (status, equipment_id, version))
+            (updated if edit_cursor.rowcount == 1 else conflicts).append(equipment_id)
+    except BaseException:
+        finish_edit(db, edit_conn, False)
+        raise
+    finish_edit(db, edit_conn, bool(updated))
+    return updated, conflicts
+
+# HTTP JSON API лише для читання для кіосків і панелі обліку активів, поруч
+# із Flet-застосунком: GET /api/<ресурс>?after=<id>&limit=<n>&fields=a,b
+# [&<поле>=<значення>...][&faculty=<факультет>]. Пагінація за ключем id,
+# відповідь стискається gzip, а ETag з версії таблиці в базі дає 304 на
+# If-None-Match без читання самих даних.
+API_HOST = os.environ.get("INVENTORY_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("INVENTORY_API_PORT", "8090"))  # 0 — не запускати
+API_TOKEN = os.environ.get("INVENTORY_API_TOKEN")  # якщо задано, потрібен заголовок Authorization: Bearer <токен>
+API_PRIVATE_RESOURCES = ("reservations", "people")  # персональні дані: без токена недоступні
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_GZIP_MIN_BYTES = 1024
+API_MAX_BODY = 64 * 1024  # найбільше тіло POST-запиту, байт
+
+# ресурс -> (джерело, таблиці, від яких залежить ETag, дозволені поля)
+API_RESOURCES = {
+    "equipment": ("equipment_details", ("equipment", "locations", "people"),
+                  ("id", "name", "serial_number", "location", "responsible", "status", "location_id", "responsible_id", "version")),
+    "reservations": ("reservations", ("reservations",), ("id", "equipment_id", "user_email", "reservation_time", "priority")),
+    "locations": ("locations", ("locations",), ("id", "name")),
+    "people": ("people", ("people",), ("id", "name")),
+}
+
+api_server = None
+
+# Сесії кіосків: користувач входить на кіоску своїм паролем і отримує токен,
+# яким підписує /api/changes та POST /api/reservations — сервер бере email
+# з токена, а не з запиту. У базі зберігається лише хеш токена. Ключ
+# кожного повтору бронювання запам'ятовується разом із результатом.
+KIOSK_TOKEN_TTL = 30 * 24 * 3600  # скільки діє вхід на кіоску
+KIOSK_REQUEST_TTL = 30 * 24 * 3600  # скільки пам'ятати ключі запитів кіосків
+KIOSK_PRUNE_INTERVAL = 24 * 3600
+
+KIOSK_TABLES_SQL = """
+    CREATE TABLE IF NOT EXISTS kiosk_tokens (
+        token_hash TEXT PRIMARY KEY,
+        email TEXT NOT NULL,
+        expires_at INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS kiosk_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT UNIQUE NOT NULL,
+        user_email TEXT NOT NULL,
+        result TEXT,
+        created_at INTEGER NOT NULL
+    );
+"""
+
+with db_lock:
+    cursor.executescript(KIOSK_TABLES_SQL)
+    conn.commit()
+
+def kiosk_token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def kiosk_login_token(email, password):
+    # Новий токен кіоску або None, якщо email чи пароль неправильні
+    rows = read_query("SELECT password FROM users WHERE email = ?", (email,))
+    if not rows or not bcrypt.checkpw(password.encode('utf-8'), rows[0][0].encode('utf-8')):
+        return None
+    token = uuid.uuid4().hex + uuid.uuid4().hex
+    with db_lock:
+        cursor.execute("INSERT INTO kiosk_tokens (token_hash, email, expires_at) VALUES (?, ?, ?)",
+                       (kiosk_token_hash(token), email, int(time.time()) + KIOSK_TOKEN_TTL))
+        conn.commit()
+    return token
+
+def kiosk_token_email(token):
+    with db_lock:
+        cursor.execute("SELECT email FROM kiosk_tokens WHERE token_hash = ? AND expires_at > ?",
+                       (kiosk_token_hash(token), int(time.time())))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def revoke_kiosk_token(token):
+    with db_lock:
+        cursor.execute("DELETE FROM kiosk_tokens WHERE token_hash = ?", (kiosk_token_hash(token),))
+        conn.commit()
+
+def prune_kiosk_sessions():
+    now = int(time.time())
+    with db_lock:
+        cursor.execute("DELETE FROM kiosk_tokens WHERE expires_at <= ?", (now,))
+        removed = cursor.rowcount
+        cursor.execute("DELETE FROM kiosk_requests WHERE created_at < ?", (now - KIOSK_REQUEST_TTL,))
+        removed += cursor.rowcount
+        conn.commit()
+    return removed
+
+def api_etag(resource, faculty, params):
+    # Версія читається з бази: для спільної бази — найбільший seq журналу
+    # змін кожної таблиці та водяний знак ущільнення, для шарда — лічильники
+    # тригерів. Результат кешується до наступної фіксації (etag_cache), тож
+    # повторні умовні GET не виконують запитів.
+    tables = API_RESOURCES[resource][1]
+    shard = get_shard(faculty) if faculty in FACULTIES else None
+    with etag_lock:
+        current = data_version(shard["path"] if shard else DB_PATH)
+        cached = etag_cache.get((resource, faculty))
+        if cached is not None and cached[0] == current:
+            epoch, version = cached[1:]
+        else:
+            if shard:
+                row = shard["read"](
+                    "SELECT (SELECT epoch FROM data_epoch)"
+                    + "".join(", (SELECT version FROM shard_table_versions WHERE table_name = ?)" for _ in tables), tables
+                )[0]
+            else:
+                reader = acquire_edit_connection(DB_PATH)
+                try:
+                    row = reader.execute(
+                        "SELECT (SELECT epoch FROM data_epoch), (SELECT MAX(seq) FROM change_log_purged)"
+                        + "".join(", (SELECT MAX(seq) FROM change_log WHERE table_name = ?)" for _ in tables), tables
+                    ).fetchone()
+                finally:
+                    release_edit_connection(DB_PATH, reader)
+            # data_version узято до запиту: фіксація між ними лише змусить перерахувати ще раз
+            epoch, version = row[0], ".".join(str(value or 0) for value in row[1:])
+            etag_cache[(resource, faculty)] = (current, epoch, version)
+    query = urllib.parse.urlencode(sorted(params.items()))
+    return f'W/"{epoch}-{faculty or ""}-{version}-{zlib.crc32(query.encode("utf-8")):08x}"'
+
+def api_page(resource, params, faculty=None):
+    # ValueError для некоректних параметрів (відповідь 400)
+    source, _, fields = API_RESOURCES[resource]
+    params = dict(params)
+    selected = [field for field in params.pop("fields", ",".join(fields)).split(",") if field]
+    unknown = [field for field in selected + list(params) if field not in fields + ("after", "limit")]
+    if unknown:
+        raise ValueError(f"Невідомі поля: {', '.join(unknown)}")
+    after = int(params.pop("after", 0))
+    limit = int(params.pop("limit", API_PAGE_SIZE))
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ValueError(f"limit має бути від 1 до {API_MAX_PAGE_SIZE}")
+    columns = selected if "id" in selected else ["id"] + selected
+    filters = "".join(f" AND {field} = ?" for field in params)
+    rows = faculty_db(faculty)["read"](
+        f"SELECT {', '.join(columns)} FROM {source} WHERE id > ?{filters} ORDER BY id LIMIT ?",
+        (after, *params.values(), limit + 1)
+    )
+    items = [{field: value for field, value in zip(columns, row) if field in selected} for row in rows[:limit]]
+    return {"items": items, "next_after": rows[limit - 1][0] if len(rows) > limit else None}
+
+def api_changes(params, email):
+    # Дельта для кіоску: зміни техніки та бронювань користувача email після
+    # seq since. Читання йде за первинним ключем журналу, тож вартість
+    # залежить від кількості змін, а не від розміру таблиць. reset — кіоск
+    # відстав далі за ущільнення (або базу відновлено з копії) і має
+    # скинути кеш та прочитати журнал з нуля.
+    unknown = [name for name in params if name not in ("since", "limit")]
+    if unknown:
+        raise ValueError(f"Невідомі параметри: {', '.join(unknown)}")
+    since = int(params.get("since", 0))
+    limit = int(params.get("limit", API_PAGE_SIZE))
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ValueError(f"limit має бути від 1 до {API_MAX_PAGE_SIZE}")
+    with db_lock:
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        last_seq = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log_purged")
+        purged = cursor.fetchone()[0]
+        reset = since > last_seq or 0 < since < purged
+        if reset:
+            since = 0
+        cursor.execute("""
+            SELECT seq, table_name, row_id, op, data FROM change_log
+            WHERE seq > ? AND (table_name = 'equipment'
+                               OR (table_name = 'reservations' AND json_extract(data, '$.user_email') = ?))
+            ORDER BY seq LIMIT ?
+        """, (since, email, limit + 1))
+        rows = cursor.fetchall()
+    changes = [{"seq": row[0], "table": row[1], "row_id": row[2], "op": row[3], "data": json.loads(row[4]) if row[4] else None}
+               for row in rows[:limit]]
+    # Без наступної сторінки кіоск запам'ятовує last_seq і не перечитує
+    # зміни інших таблиць, що лишилися позаду
+    next_since = changes[-1]["seq"] if len(rows) > limit else last_seq
+    return {"changes": changes, "next_since": next_since, "more": len(rows) > limit, "reset": reset}
+
+def replay_reservation(email, key, equipment_id, equipment_version):
+    # Бронювання, збережене кіоском офлайн. Кіоск працює зі спільною базою;
+    # конфлікт — техніку видалено, списано або змінено після того, як її
+    # побачив користувач. Повтор із тим самим ключем (кіоск не дочекався
+    # відповіді) повертає початковий результат; інший запит на вже
+    # заброньовану техніку дає duplicate.
+    with db_lock:
+        try:
+            cursor.execute("INSERT OR IGNORE INTO kiosk_requests (idempotency_key, user_email, created_at) VALUES (?, ?, ?)",
+                           (key, email, int(time.time())))
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT user_email, result FROM kiosk_requests WHERE idempotency_key = ?", (key,))
+                owner, result = cursor.fetchone()
+                if owner != email:
+                    return {"status": "rejected", "reason": "Ключ запиту вже використано"}
+                return json.loads(result)
+            result = apply_replayed_reservation(email, equipment_id, equipment_version)
+            cursor.execute("UPDATE kiosk_requests SET result = ? WHERE idempotency_key = ?",
+                           (json.dumps(result, ensure_ascii=False), key))
+            commit_changes()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return result
+
+def apply_replayed_reservation(email, equipment_id, equipment_version):
+    # Викликати під db_lock; транзакцію фіксує replay_reservation
+    cursor.execute("SELECT role, subscription_status, faculty FROM users WHERE email = ?", (email,))
+    row = cursor.fetchone()
+    if row is None or row[0] not in ("student", "teacher"):
+        return {"status": "rejected", "reason": "Бронювати можуть лише студенти та викладачі"}
+    user_role, subscribed, faculty = row
+    if FACULTIES and faculty in FACULTIES:
+        return {"status": "rejected", "reason": "Кіоск не обслуговує бази факультетів"}
+    cursor.execute("SELECT id FROM reservations WHERE equipment_id = ? AND user_email = ?", (equipment_id, email))
+    existing = cursor.fetchone()
+    if existing:
+        return {"status": "duplicate", "id": existing[0]}
+    cursor.execute("SELECT status, version FROM equipment WHERE id = ?", (equipment_id,))
+    equipment = cursor.fetchone()
+    if equipment is None:
+        return {"status": "conflict", "reason": "Обладнання видалено"}
+    if equipment[0] == "Списана":
+        return {"status": "conflict", "reason": "Обладнання списано"}
+    if equipment[1] != equipment_version:
+        return {"status": "conflict", "reason": f"Обладнання змінилося після синхронізації (стан: {equipment[0]})"}
+    cursor.execute("""
+        INSERT INTO reservations (equipment_id, user_email, reservation_time, priority)
+        VALUES (?, ?, ?, ?)
+    """, (equipment_id, email, int(time.time()), reservation_priority(user_role, subscribed)))
+    return {"status": "created", "id": cursor.lastrowid}
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    server_version = "InventoryAPI/1.0"
+
+    def send_json(self, status, payload, etag=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        gzipped = len(body) >= API_GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_export(self, key):
+        export = take_export(key)
+        if export is None:
+            self.send_json(404, {"error": "Файл не знайдено: його вже завантажили або строк зберігання минув"})
+            return
+        path, filename, fmt = export
+        try:
+            with open(path, "rb") as f:
+                self.send_response(200)
+                self.send_header("Content-Type", EXPORT_CONTENT_TYPES[fmt])
+                self.send_header("Content-Length", str(os.path.getsize(path)))
+                self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
+        finally:
+            release_export(path)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "exports":
+            # Ключ завантаження сам є обліковими даними: браузер не надсилає токен API
+            self.send_export(parts[1])
+            return
+        if len(parts) != 2 or parts[0] != "api" or parts[1] not in API_RESOURCES and parts[1] != "changes":
+            self.send_json(404, {"error": "Не знайдено"})
+            return
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if parts[1] == "changes":
+            session = self.kiosk_session()
+            if session is None:
+                return
+            try:
+                payload = api_changes(params, session[1])
+            except ValueError as err:
+                self.send_json(400, {"error": str(err)})
+                return
+            self.send_json(200, payload)
+            return
+        if not API_TOKEN and parts[1] in API_PRIVATE_RESOURCES:
+            self.send_json(403, {"error": "Ресурс вимкнено: не задано INVENTORY_API_TOKEN"})
+            return
+        if API_TOKEN and self.headers.get("Authorization") != f"Bearer {API_TOKEN}":
+            self.send_json(401, {"error": "Потрібна авторизація"})
+            return
+        faculty = params.pop("faculty", None)
+        if faculty is not None and faculty not in FACULTIES:
+            self.send_json(400, {"error": f"Невідомий факультет: {faculty}"})
+            return
+
+        # ETag рахується до читання: якщо дані зміняться посеред запиту,
+        # клієнт просто отримає їх ще раз, а не застарілу відповідь з новим ETag
+        etag = api_etag(parts[1], faculty, params)
+        if_none_match = [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]
+        if etag in if_none_match or "*" in if_none_match:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        try:
+            payload = api_page(parts[1], params, faculty)
+        except ValueError as err:
+            self.send_json(400, {"error": str(err)})
+            return
+        self.send_json(200, payload, etag)
+
+    def kiosk_session(self):
+        # (токен, email) сесії кіоску з заголовка Authorization або None з відповіддю 401
+        header = self.headers.get("Authorization", "")
+        token = header[len("Bearer "):] if header.startswith("Bearer ") else None
+        email = kiosk_token_email(token) if token else None
+        if email is None:
+            self.send_json(401, {"error": "Потрібен вхід на кіоску"})
+            return None
+        return token, email
+
+    def do_POST(self):
+        # Запис через API — лише вхід і вихід на кіоску та повтор його
+        # офлайн-бронювань від імені користувача, якому виданий токен
+        path = self.path.rstrip("/")
+        if path not in ("/api/kiosk/login", "/api/kiosk/logout", "/api/reservations"):
+            self.send_json(404, {"error": "Не знайдено"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if not 0 < length <= API_MAX_BODY:
+                raise ValueError("Некоректний розмір запиту")
+            body = json.loads(self.rfile.read(length))
+            if path == "/api/kiosk/login":
+                email = str(body["email"])
+                token = kiosk_login_token(email, str(body["password"]))
+                if token is None:
+                    self.send_json(401, {"error": "Неправильний email або пароль"})
+                else:
+                    self.send_json(200, {"token": token, "email": email})
+                return
+            session = self.kiosk_session()
+            if session is None:
+                return
+            if path == "/api/kiosk/logout":
+                revoke_kiosk_token(session[0])
+                self.send_json(200, {"status": "ok"})
+                return
+            result = replay_reservation(session[1], str(body["key"]), int(body["equipment_id"]), int(body["equipment_version"]))
+        except (ValueError, KeyError, TypeError) as err:
+            self.send_json(400, {"error": f"Некоректний запит: {err}"})
+            return
+        except sqlite3.Error as err:
+            self.send_json(503, {"error": str(err)})
+            return
+        self.send_json(201 if result["status"] == "created" else 200, result)
+
+    def log_message(self, format, *args):
+        pass  # Журнал запитів не потрібен
+
+def start_api_server():
+    global api_server
+    if api_server is None and API_PORT:
+        api_server = ThreadingHTTPServer((API_HOST, API_PORT), ApiRequestHandler)
+        api_server.daemon_threads = True
+        threading.Thread(target=api_server.serve_forever, name="api-server", daemon=True).start()
+        if export_base_url() is None:
+            print(f"Увага: HTTP API слухає лише {API_HOST}, тож експорт звітів вимкнено: "
+                  f"задайте INVENTORY_EXPORT_URL (адресу API для браузера) або INVENTORY_API_HOST", file=sys.stderr)
+
+# Лічильник користувачів спільного з'єднання (сесії, фонові задачі). Саме
+# з'єднання відкривається один раз і ніколи не переприв'язується: conn і
+# cursor, які інші функції беруть за іменем, завжди вказують на живий об'єкт,
+# навіть поки остання сесія закривається або перша відкривається. Закрита
+# вкладка лише зменшує лічильник, а з'єднання закривається при виході процесу.
+db_refcount = 0
+
+def acquire_db():
+    global db_refcount
+    with db_lock:
+        db_refcount += 1
+
+def release_db():
+    global db_refcount
+    with db_lock:
+        db_refcount = max(0, db_refcount - 1)
+
+def close_db():
+    with db_lock:
+        conn.close()
+
+atexit.register(close_db)
+
+def current_rss():
+    # Resident set size процесу в байтах (0, якщо платформа не дає змоги дізнатися)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+# Реєстр живих сесій: session_id -> словник з часом останньої активності,
+# RSS на момент старту та колбеком для звільнення ресурсів сесії
+SESSION_IDLE_TIMEOUT = 30 * 60  # секунд без активності до виселення
+SESSION_SWEEP_INTERVAL = 60  # як часто перевіряти неактивні сесії
+UPDATE_FRAME_INTERVAL = 0.05  # секунд: усі зміни сторінки за цей час ідуть клієнту одним page.update()
+
+sessions = {}
+sessions_lock = threading.Lock()
+page_update_totals = {"requested": 0, "flushed": 0}  # за весь час роботи, разом із закритими сесіями
+baseline_rss = current_rss()
+session_sweeper = None
+
+def register_session(session_id, on_evict):
+    with sessions_lock:
+        if session_id in sessions:
+            return sessions[session_id]
+        now = time.time()
+        entry = {
+            "id": session_id,
+            "email": None,
+            "started": now,
+            "last_activity": now,
+            "rss_at_start": current_rss(),
+            "update_requests": 0,
+            "update_flushes": 0,
+            "on_evict": on_evict,
+        }
+        sessions[session_id] = entry
+    acquire_db()
+    start_session_sweeper()
+    return entry
+
+def unregister_session(session_id):
+    with sessions_lock:
+        entry = sessions.pop(session_id, None)
+    if entry is not None:
+        release_db()
+    return entry
+
+def touch_session(session_id, email=None):
+    with sessions_lock:
+        entry = sessions.get(session_id)
+        if entry is None:
+            return False
+        entry["last_activity"] = time.time()
+        if email is not None:
+            entry["email"] = email
+    return True
+
+def record_page_updates(session_id, requested=0, flushed=0):
+    # Скільки оновлень сторінки запитали обробники і скільки реально пішло клієнту
+    with sessions_lock:
+        page_update_totals["requested"] += requested
+        page_update_totals["flushed"] += flushed
+        entry = sessions.get(session_id)
+        if entry is not None:
+            entry["update_requests"] += requested
+            entry["update_flushes"] += flushed
+
+def evict_idle_sessions(timeout=SESSION_IDLE_TIMEOUT):
+    deadline = time.time() - timeout
+    with sessions_lock:
+        idle = [sid for sid, entry in sessions.items() if entry["last_activity"] < deadline]
+    evicted = 0
+    for session_id in idle:
+        entry = unregister_session(session_id)
+        if entry is None:
+            continue
+        try:
+            entry["on_evict"]()
+        except Exception:
+            pass  # Сторінка могла вже від'єднатися
+        evicted += 1
+    return evicted
+
+def sweep_sessions():
+    global session_sweeper
+    evict_idle_sessions()
+    with sessions_lock:
+        if not sessions:
+            session_sweeper = None
+            return
+        session_sweeper = threading.Timer(SESSION_SWEEP_INTERVAL, sweep_sessions)
+        session_sweeper.daemon = True
+        session_sweeper.start()
+
+def start_session_sweeper():
+    global session_sweeper
+    with sessions_lock:
+        if session_sweeper is not None:
+            return
+        session_sweeper = threading.Timer(SESSION_SWEEP_INTERVAL, sweep_sessions)
+        session_sweeper.daemon = True
+        session_sweeper.start()
+
+def session_stats():
+    now = time.time()
+    rss = current_rss()
+    with sessions_lock:
+        entries = [dict(entry) for entry in sessions.values()]
+        totals = dict(page_update_totals)
+    count = len(entries)
+    return {
+        "count": count,
+        "rss": rss,
+        "baseline_rss": baseline_rss,
+        # Приріст RSS усього процесу від старту (разом із кешами, фоновими
+        # задачами й закритими сесіями), поділений на кількість живих сесій:
+        # загальнопроцесне середнє, а не пам'ять окремої сесії
+        "process_rss_growth_avg": (rss - baseline_rss) / count if count else 0,
+        "update_requests": totals["requested"],
+        "update_flushes": totals["flushed"],
+        "updates_saved": totals["requested"] - totals["flushed"],
+        "sessions": [
+            {
+                "id": entry["id"],
+                "email": entry["email"],
+                "idle": now - entry["last_activity"],
+                "age": now - entry["started"],
+                "rss_at_start": entry["rss_at_start"],
+                "update_requests": entry["update_requests"],
+                "updates_saved": entry["update_requests"] - entry["update_flushes"],
+            } for entry in entries
+        ],
+    }
+
+# Екран «Користувачі та логи» читає сторінками за ключем: сесія тримає лише
+# показані рядки видимого розділу, а не повні таблиці користувачів і логів
+USERS_LOGS_PAGE_SIZE = 50
+
+def users_page(after_id=0, limit=USERS_LOGS_PAGE_SIZE):
+    return read_query("SELECT id, email, password, role, subscription_status FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                      (after_id, limit))
+
+def login_logs_page(before=None, limit=USERS_LOGS_PAGE_SIZE):
+    # Найсвіжіші першими; before — (login_time, id) останнього показаного рядка.
+    # Шарди читаються тим самим запитом за індексом часу, сторінки зливаються.
+    query = "SELECT login_time, id, email, device_info FROM login_logs"
+    params = ()
+    if before is not None:
+        query += " WHERE login_time < ? OR (login_time = ? AND id < ?)"
+        params = (before[0], before[0], before[1])
+    query += " ORDER BY login_time DESC, id DESC LIMIT ?"
+    params += (limit,)
+    with db_lock:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    if FACULTIES:
+        for faculty_rows in scatter_gather(query, params).values():
+            rows.extend(faculty_rows)
+        rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+    return rows[:limit]
+
+def payment_logs_page(before_id=None, limit=USERS_LOGS_PAGE_SIZE):
+    with db_lock:
+        cursor.execute("SELECT id, user_email, amount, payment_time FROM payment_logs WHERE id < ? ORDER BY id DESC LIMIT ?",
+                       (before_id if before_id is not None else 2 ** 63 - 1, limit))
+        return cursor.fetchall()
+
+def main(page: ft.Page):
+    page.title = "Облік техніки"
+    page.window_min_width = 500
+    page.horizontal_alignment = 'center'
+    page.vertical_alignment = 'center'
+    page.theme_mode = 'white'
+    page.padding = 20
+
+    role = None
+    current_email = None
+    current_faculty = None  # Шард, з яким працює сесія (None — спільна база)
+    equipment = []
+    payment_key = None  # Ключ ідемпотентності відкритої форми оплати
+    confirmed_duplicate = None  # (назва, кабінет), додавання якої підтверджено попри схожі записи
+    export_views = {}  # id задачі експорту -> елементи її рядка на екрані експорту
+
+    # Button styling
+    bg_color = "white"
+    hover_color = "red"
+
+    # Input fields
+    email_field = ft.TextField(hint_text='Логін', width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    password_field = ft.TextField(hint_text='Пароль', password=True, can_reveal_password=True, width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    confirm_password_field = ft.TextField(hint_text='Підтвердіть пароль', password=True, can_reveal_password=True, width=300, color='white', border_color='white', hint_style=ft.TextStyle(color='white'))
+    role_dropdown = ft.Dropdown(
+        width=300,
+        hint_text="Роль",
+        options=[
+            ft.dropdown.Option("student", "Студент"),
+            ft.dropdown.Option("teacher", "Викладач"),
+        ],
+        border_color='white',
+        hint_style=ft.TextStyle(color='white'),
+        text_style=ft.TextStyle(color='white')
+    )
+
+    faculty_dropdown = ft.Dropdown(
+        width=300,
+        hint_text="Факультет",
+        options=[ft.dropdown.Option(faculty) for faculty in FACULTIES],
+        visible=bool(FACULTIES),
+        border_color='white',
+        hint_style=ft.TextStyle(color='white'),
+        text_style=ft.TextStyle(color='white')
+    )
+
+    # Store previous sizes for comparison
+    prev_btn_width = None
+    prev_btn_height = None
+
+    # List to store active timers
+    active_timers = []
+
+    # Flags to control timers
+    stop_timers = threading.Event()
+
+    # Відкладене оновлення сторінки (див. request_update)
+    update_lock = threading.Lock()
+    update_timer = None
+
+    def on_hover(e):
+        e.control.bgcolor = hover_color if e.data == "true" else bg_color
+        e.control.update()
+
+    # Containers for UI elements
+    text_login = ft.Container(ft.Text(value='Увійти в систему', size=25, weight='bold', color='white'), margin=ft.margin.only(left=100))
+    text_register = ft.Container(ft.Text(value='Реєстрація', size=25, weight='bold', color='white'), margin=ft.margin.only(left=150))
+    login_input = ft.Container(content=email_field, margin=ft.margin.only(left=50))
+    senha_input = ft.Container(content=password_field, margin=ft.margin.only(left=50))
+    confirm_senha_input = ft.Container(content=confirm_password_field, margin=ft.margin.only(left=50))
+    role_input = ft.Container(content=role_dropdown, margin=ft.margin.only(left=50))
+    faculty_input = ft.Container(content=faculty_dropdown, margin=ft.margin.only(left=50), visible=bool(FACULTIES))
+
+    btn_login = ft.Container(
+        ft.ElevatedButton(text='Увійти', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: login(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+        margin=ft.margin.only(left=100)
+    )
+    btn_register = ft.Container(
+        ft.ElevatedButton(text='Зареєструватися', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: register(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+        margin=ft.margin.only(left=100)
+    )
+    btn_to_register = ft.Container(
+        ft.ElevatedButton(text='Реєстрація', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: show_register(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+        margin=ft.margin.only(left=100)
+    )
+    btn_to_login = ft.Container(
+        ft.ElevatedButton(text='Увійти', width=200, height=50, bgcolor=bg_color, on_hover=on_hover, on_click=lambda e: show_login(e), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+        margin=ft.margin.only(left=100)
+    )
+
+    # Dynamic time text
+    time_text = ft.Text(value="", size=12, italic=True, color='white')
+
+    # Login layout
+    login_layout = ft.Container(
+        content=ft.Stack([
+            ft.Image(src="https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg", fit=ft.ImageFit.COVER, width=600, height=600),
+            ft.Column(
+                spacing=30,
+                alignment='center',
+                controls=[
+                    text_login,
+                    login_input,
+                    senha_input,
+                    btn_login,
+                    btn_to_register,
+                    time_text
+                ]
+            )
+        ]),
+        width=400,
+        height=400,
+        border_radius=20,
+        shadow=ft.BoxShadow(blur_radius=5, color='red')
+    )
+
+    # Register layout
+    register_layout = ft.Container(
+        content=ft.Stack([
+            ft.Image(src="https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg", fit=ft.ImageFit.COVER, width=750, height=700),
+            ft.Column(
+                spacing=25,
+                alignment='center',
+                controls=[
+                    text_register,
+                    login_input,
+                    senha_input,
+                    confirm_senha_input,
+                    role_input,
+                    faculty_input,
+                    btn_register,
+                    btn_to_login,
+                    time_text
+                ]
+            )
+        ]),
+        width=400,
+        height=500,
+        border_radius=20,
+        shadow=ft.BoxShadow(blur_radius=5, color='red')
+    )
+
+    content_container = ft.Column()
+    # Один FilePicker на сторінку: екран інвентаризації лише підміняє його
+    # обробники, тож повторні відвідини не додають нових елементів в оверлей
+    file_picker = ft.FilePicker()
+    page.overlay.append(file_picker)
+    # Так само один снекбар: show_snackbar міняє його текст і відкриває через
+    # request_update, а не page.open, який відправив би окреме оновлення
+    snack_bar = ft.SnackBar(ft.Text("", color='white'))
+    page.overlay.append(snack_bar)
+
+    def mark_active():
+        # Будь-яка дія користувача продовжує життя сесії; після виселення
+        # сесія реєструється знову
+        if not touch_session(page.session_id, current_email):
+            register_session(page.session_id, evict_session)
+            touch_session(page.session_id, current_email)
+
+    def evict_session():
+        nonlocal role, current_email
+        stop_monitors()
+        role = None
+        current_email = None
+        content_container.controls.clear()  # Звільняємо таблиці та форми попередніх екранів
+        content_container.controls.append(login_layout)
+        email_field.value = ""
+        password_field.value = ""
+        try:
+            request_update()
+        except RuntimeError:
+            pass  # Handle case where page is no longer accessible
+
+    def request_update():
+        # Замість page.update(): позначає сторінку зміненою, а flush_updates
+        # відправляє клієнту всі зміни за UPDATE_FRAME_INTERVAL одним оновленням —
+        # снекбар, перебудову екрана і тік годинника в межах однієї дії
+        nonlocal update_timer
+        record_page_updates(page.session_id, requested=1)
+        with update_lock:
+            if update_timer is not None:
+                return
+            update_timer = threading.Timer(UPDATE_FRAME_INTERVAL, flush_updates)
+            update_timer.daemon = True
+            update_timer.start()
+
+    def flush_updates():
+        nonlocal update_timer
+        with update_lock:
+            update_timer = None
+        record_page_updates(page.session_id, flushed=1)
+        try:
+            page.update()
+        except RuntimeError:
+            pass  # Handle case where page is no longer accessible
+
+    def show_snackbar(message, bgcolor=None, duration=3000):
+        mark_active()
+        if not stop_timers.is_set():
+            snack_bar.content.value = message
+            snack_bar.bgcolor = bgcolor
+            snack_bar.duration = duration
+            snack_bar.open = True
+            request_update()
+
+    def update_time():
+        if stop_timers.is_set():
+            return
+        current_time = datetime.now().strftime("Дата і час: %H:%M EEST, %A, %d %B %Y")
+        time_text.value = current_time
+        if not stop_timers.is_set():
+            try:
+                request_update()
+                timer = threading.Timer(1, update_time)
+                active_timers.append(timer)
+                timer.start()
+            except RuntimeError:
+                pass  # Handle case where page is no longer accessible
+
+    def check_button_size():
+        nonlocal prev_btn_width, prev_btn_height
+        if stop_timers.is_set():
+            return
+        current_btn = btn_login.content
+        current_width = current_btn.width
+        current_height = current_btn.height
+
+        if prev_btn_width is not None and prev_btn_height is not None:
+            if current_width != prev_btn_width or current_height != prev_btn_height:
+                show_snackbar(f"Розмір кнопки змінився! Новий розмір: {current_width}x{current_height}")
+
+        prev_btn_width = current_width
+        prev_btn_height = current_height
+        if not stop_timers.is_set():
+            try:
+                timer = threading.Timer(1, check_button_size)
+                active_timers.append(timer)
+                timer.start()
+            except RuntimeError:
+                pass  # Handle case where page is no longer accessible
+
+    def start_monitors():
+        mark_active()
+        stop_timers.clear()  # Reset the stop flag
+        update_time()
+        check_button_size()
+
+    def stop_monitors():
+        stop_timers.set()  # Signal timers to stop
+        for timer in active_timers:
+            timer.cancel()  # Cancel all active timers
+        active_timers.clear()  # Clear the list of timers
+
+    def cleanup():
+        stop_monitors()
+        forget_session_exports(page.session_id)
+        unregister_session(page.session_id)  # З'єднання закриється лише разом з останньою сесією
+
+    def show_login(e):
+        stop_monitors()  # Stop any existing timers
+        content_container.controls.clear()
+        content_container.controls.append(login_layout)
+        start_monitors()
+        email_field.value = ""
+        password_field.value = ""
+        request_update()
+
+    def show_register(e):
+        stop_monitors()  # Stop any existing timers
+        content_container.controls.clear()
+        content_container.controls.append(register_layout)
+        start_monitors()
+        email_field.value = ""
+        password_field.value = ""
+        confirm_password_field.value = ""
+        role_dropdown.value = None
+        faculty_dropdown.value = None
+        request_update()
+
+    def register(e):
+        email = email_field.value
+        password = password_field.value
+        confirm_password = confirm_password_field.value
+        selected_role = role_dropdown.value
+        selected_faculty = faculty_dropdown.value
+
+        if not all([email, password, confirm_password, selected_role]) or (FACULTIES and not selected_faculty):
+            show_snackbar("Заповніть усі поля!", bgcolor="red_400")
+            return
+
+        if password != confirm_password:
+            show_snackbar("Паролі не збігаються!", bgcolor="red_400")
+            return
+
+        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        
+        try:
+            with db_lock:
+                cursor.execute("INSERT INTO users (email, password, role, subscription_status, faculty) VALUES (?, ?, ?, ?, ?)",
+                              (email, hashed_password, selected_role, False, selected_faculty))
+                commit_changes()
+            show_snackbar("Реєстрація успішна!")
+            show_login(e)
+        except sqlite3.IntegrityError:
+            show_snackbar("Цей email вже зареєстровано!", bgcolor="red_400")
+
+    def session_db():
+        # Шард факультету користувача (або обраного адміністратором) чи спільна база
+        return faculty_db(current_faculty)
+
+    def login(e):
+        nonlocal role, current_email, current_faculty
+        email = email_field.value
+        password = password_field.value
+
+        if not email or not password:
+            show_snackbar("Введіть email і пароль!", bgcolor="red_400")
+            return
+
+        rows = read_query("SELECT password, role, faculty FROM users WHERE email = ?", (email,))
+        user = rows[0] if rows else None
+
+        if user and bcrypt.checkpw(password.encode('utf-8'), user[0].encode('utf-8')):
+            role = user[1]
+            current_email = email
+            current_faculty = user[2]
+            login_time = int(time.time())
+            device_info = "Unknown Device"
+            db = session_db()
+            with db["lock"]:
+                db["cursor"].execute("INSERT INTO login_logs (email, login_time, device_info) VALUES (?, ?, ?)",
+                                     (email, login_time, device_info))
+                db["commit"]()
+            show_snackbar(f"Увійшли як {role}!")
+            show_main_menu(e)
+        elif email == "admin" and password == "admin":
+            role = "admin"
+            current_email = "admin"
+            current_faculty = None
+            login_time = int(time.time())
+            device_info = "Unknown Device"
+            with db_lock:
+                cursor.execute("INSERT INTO login_logs (email, login_time, device_info) VALUES (?, ?, ?)",
+                              ("admin", login_time, device_info))
+                commit_changes()
+            show_snackbar("Увійшли як адміністратор!")
+            show_main_menu(e)
+        else:
+            email_field.value = ""
+            password_field.value = ""
+            show_snackbar("Неправильний email або пароль!", bgcolor="red_400")
+
+    def show_main_menu(e):
+        stop_monitors()  # Stop any existing timers
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=400, height=500) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    scroll=ft.ScrollMode.AUTO,
+                    controls=[
+                        ft.Text("Облік техніки", size=24, weight="bold", text_align='center', color='white'),
+                        ft.Dropdown(
+                            width=300,
+                            label="Факультет",
+                            value=current_faculty or "",
+                            options=[ft.dropdown.Option("", "Спільна база")] + [ft.dropdown.Option(faculty) for faculty in FACULTIES],
+                            on_change=select_faculty,
+                            visible=role == "admin" and bool(FACULTIES),
+                            border_color='white',
+                            label_style=ft.TextStyle(color='white'),
+                            text_style=ft.TextStyle(color='white')
+                        ),
+                        ft.ElevatedButton("Додати запис", on_click=show_add_equipment, visible=role in ["teacher", "admin"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Редагувати запис", on_click=show_edit_equipment, visible=role in ["teacher", "admin"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Показати всі записи", on_click=show_list_equipment, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Техніка за кабінетами", on_click=show_grouped_equipment, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Бронювати техніку", on_click=show_reserve_equipment, visible=role in ["student", "teacher"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Переглянути бронювання", on_click=show_reservations, visible=role in ["student", "teacher", "admin"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Обробити чергу бронювань", on_click=process_reservation_queue, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Оформити підписку", on_click=show_subscription_payment, visible=role == "student", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Видалити запис", on_click=show_delete_equipment, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Переглянути користувачів та логи", on_click=show_users_and_logs, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Експорт звітів", on_click=show_exports, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Інвентаризація", on_click=show_audit, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Звіт по факультетах", on_click=show_faculty_report, visible=role == "admin" and bool(FACULTIES), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Статистика", on_click=show_statistics, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Резервні копії", on_click=show_backups, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Фонові задачі", on_click=show_jobs, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Активні сесії", on_click=show_sessions, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Вийти", on_click=logout, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        time_text
+                    ]
+                )
+            ]),
+            width=400,
+            height=500,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+        start_monitors()
+        request_update()
+
+    def select_faculty(e):
+        nonlocal current_faculty
+        if role != "admin":
+            return
+        current_faculty = e.control.value or None
+        show_snackbar(f"Працюємо з базою: {current_faculty or 'спільна'}")
+
+    def show_add_equipment(e):
+        if role not in ["teacher", "admin"]:
+            show_snackbar("Студенти не можуть додавати записи!")
+            return
+
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        # Dropdown for equipment status
+        status_dropdown = ft.Dropdown(
+            label="Стан",
+            width=500,
+            options=[
+                ft.dropdown.Option("Справна", "Справна"),
+                ft.dropdown.Option("Потрібен ремонт", "Потрібен ремонт"),
+                ft.dropdown.Option("Списана", "Списана"),
+            ],
+            border_color='white',
+            label_style=ft.TextStyle(color='white'),
+            text_style=ft.TextStyle(color='white')
+        )
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=500, height=550) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    controls=[
+                        ft.Text("Додати техніку", size=24, weight="bold", color='white'),
+                        ft.TextField(label="Назва пристрою", autofocus=True, color='white', label_style=ft.TextStyle(color='white')),
+                        ft.TextField(label="Серійний номер", color='white', label_style=ft.TextStyle(color='white')),
+                        ft.TextField(label="Кабінет", color='white', label_style=ft.TextStyle(color='white')),
+                        ft.TextField(label="Відповідальний", color='white', label_style=ft.TextStyle(color='white')),
+                        status_dropdown,
+                        ft.ElevatedButton("Додати", on_click=add_equipment, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        time_text
+                    ]
+                )
+            ]),
+            width=500,
+            height=550,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+        start_monitors()
+        request_update()
+
+    def add_equipment(e):
+        # Adjust indices to account for the new dropdown
+        fields = content_container.controls[0].content.controls[1].controls[1:5]  # TextFields: name, serial, location, responsible
+        status_dropdown = content_container.controls[0].content.controls[1].controls[5]  # Dropdown for status
+        if not all(field.value for field in fields) or not status_dropdown.value:
+            show_snackbar("Заповніть усі поля!")
             return
-        current_btn = btn_login.content
-        current_width = current_btn.width
-        current_height = current_btn.height
 
-        if prev_btn_width is not None and prev_btn_height is not None:
-            if current_width != prev_btn_width or current_height != prev_btn_height:
-                show_snackbar(f"Розмір кнопки змінився! Новий розмір: {current_width}x{current_height}")
+        nonlocal confirmed_duplicate
+        name, serial, location, responsible = [field.value for field in fields]
+        status = status_dropdown.value
+        db = session_db()
+        duplicates = similar_equipment(db, name, location, limit=3)
+        if duplicates and confirmed_duplicate != (name, location):
+            confirmed_duplicate = (name, location)
+            candidates = "; ".join(f"ID {row[0]} «{row[1]}», SN {row[2]} ({score:.0%})" for score, row in duplicates)
+            show_snackbar(f"Можливий дублікат у цьому кабінеті: {candidates}. Натисніть «Додати» ще раз, щоб підтвердити.", duration=8000)
+            return
+        confirmed_duplicate = None
+        try:
+            with db["lock"]:
+                try:
+                    insert_equipment(db["cursor"], name, serial, location, responsible, status)
+                except sqlite3.IntegrityError:
+                    db["cursor"].connection.rollback()  # Разом із довідниками та триграмами
+                    raise
+                db["commit"]()
+            show_snackbar("Техніку додано успішно!")
+            show_main_menu(e)
+        except sqlite3.IntegrityError:
+            show_snackbar("Серійний номер уже існує!")
 
-        prev_btn_width = current_width
-        prev_btn_height = current_height
-        if not stop_timers.is_set():
+    def show_edit_equipment(e):
+        if role not in ["teacher", "admin"]:
+            show_snackbar("Тільки викладач або адміністратор може редагувати записи!")
+            return
+
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        db = session_db()
+        versions = {}  # id -> версія на момент читання
+        page_starts = [0]  # after_id кожної відкритої сторінки, як у show_grouped_equipment
+        next_start = [None]
+        page_text = ft.Text("", color='white')
+
+        equipment_dropdown = ft.Dropdown(label="Техніка", width=400)
+        status_dropdown = ft.Dropdown(label="Стан", width=250)
+        location_input = ft.TextField(label="Кабінет", width=300, color='white')
+        responsible_input = ft.TextField(label="Відповідальний", width=300, color='white')
+        batch_list = ft.ListView(width=650, height=200)
+        batch_status_dropdown = ft.Dropdown(
+            label="Новий стан",
+            options=[ft.dropdown.Option(status, status) for status in EQUIPMENT_STATUSES],
+            width=250
+        )
+
+        def load_rows(selected=None):
+            # У списку та прапорцях лише поточна сторінка (ключ id > after_id)
+            rows = equipment_page(db["read"], None, None, page_starts[-1], EQUIPMENT_PAGE_SIZE + 1)
+            next_start[0] = rows[EQUIPMENT_PAGE_SIZE - 1][0] if len(rows) > EQUIPMENT_PAGE_SIZE else None
+            rows = rows[:EQUIPMENT_PAGE_SIZE]
+            page_text.value = f"Сторінка {len(page_starts)}"
+            versions.clear()
+            versions.update({row[0]: row[8] for row in rows})
+            equipment_dropdown.options = [ft.dropdown.Option(str(row[0]), f"{row[0]} — {row[1]} ({row[2]})") for row in rows]
+            batch_list.controls = [
+                ft.Checkbox(label=f"{row[0]} — {row[1]} ({row[2]}), {row[5]}", data=row[0], label_style=ft.TextStyle(color='white'))
+                for row in rows
+            ]
+            equipment_dropdown.value = selected
+            fill_fields(rows)
+
+        def fill_fields(rows=None):
+            if rows is None:
+                rows = db["read"]("SELECT * FROM equipment_details WHERE id = ?", (int(equipment_dropdown.value),))
+            row = next((row for row in rows if str(row[0]) == equipment_dropdown.value), None)
+            if row is None:
+                equipment_dropdown.value = None
+                status_dropdown.value = location_input.value = responsible_input.value = None
+                return
+            statuses = EQUIPMENT_STATUSES if row[5] in EQUIPMENT_STATUSES else (row[5],) + EQUIPMENT_STATUSES
+            status_dropdown.options = [ft.dropdown.Option(status, status) for status in statuses]
+            status_dropdown.value = row[5]
+            location_input.value = row[3]
+            responsible_input.value = row[4]
+            versions[row[0]] = row[8]
+
+        def on_select(e):
+            fill_fields()
+            request_update()
+
+        def on_next(e):
+            if next_start[0] is not None:
+                page_starts.append(next_start[0])
+                load_rows()
+                request_update()
+
+        def on_prev(e):
+            if len(page_starts) > 1:
+                page_starts.pop()
+                load_rows()
+                request_update()
+
+        def on_save(e):
+            if not equipment_dropdown.value or not status_dropdown.value:
+                show_snackbar("Оберіть техніку та стан!")
+                return
+            equipment_id = int(equipment_dropdown.value)
             try:
-                timer = threading.Timer(1, check_button_size)
-                active_timers.append(timer)
-                timer.start()
-            except RuntimeError:
-                pass  # Handle case where page is no longer accessible
+                version = update_equipment(db, equipment_id, versions[equipment_id], status_dropdown.value,
+                                           location_input.value, responsible_input.value)
+            except sqlite3.OperationalError:
+                show_snackbar("База зайнята іншим записом, спробуйте ще раз.")
+                return
+            if version is None:
+                load_rows(equipment_dropdown.value)
+                show_snackbar("Запис щойно змінив інший користувач — дані оновлено, перевірте їх і збережіть ще раз.")
+                return
+            load_rows(equipment_dropdown.value)
+            show_snackbar("Зміни збережено!")
 
-    def start_monitors():
-        stop_timers.clear()  # Reset the stop flag
-        update_time()
-        check_button_size()
+        def on_select_all(e):
+            checked = not all(checkbox.value for checkbox in batch_list.controls)
+            for checkbox in batch_list.controls:
+                checkbox.value = checked
+            request_update()
+
+        def on_batch(e):
+            selected = [checkbox.data for checkbox in batch_list.controls if checkbox.value]
+            if not selected or not batch_status_dropdown.value:
+                show_snackbar("Оберіть записи та новий стан!")
+                return
+            try:
+                updated, conflicts = update_status_batch(db, {equipment_id: versions[equipment_id] for equipment_id in selected},
+                                                         batch_status_dropdown.value)
+            except sqlite3.OperationalError:
+                show_snackbar("База зайнята іншим записом, спробуйте ще раз.")
+                return
+            load_rows(equipment_dropdown.value)
+            if conflicts:
+                show_snackbar(f"Оновлено {len(updated)}; {len(conflicts)} записів змінили інші користувачі: {', '.join(map(str, conflicts))}")
+            else:
+                show_snackbar(f"Оновлено {len(updated)} записів.")
+
+        equipment_dropdown.on_change = on_select
+        load_rows()
+
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=750) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=15,
+                    alignment='center',
+                    scroll=ft.ScrollMode.AUTO,
+                    controls=[
+                        ft.Text("Редагувати техніку", size=24, weight="bold", color='white'),
+                        ft.Row([
+                            ft.ElevatedButton("Попередня", on_click=on_prev, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                            page_text,
+                            ft.ElevatedButton("Наступна", on_click=on_next, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ]),
+                        equipment_dropdown,
+                        ft.Row([status_dropdown, location_input, responsible_input], wrap=True),
+                        ft.ElevatedButton("Зберегти", on_click=on_save, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.Text("Масова зміна стану", size=18, weight="bold", color='white', visible=role == "admin"),
+                        ft.Column([
+                            batch_list,
+                            ft.Row([
+                                batch_status_dropdown,
+                                ft.ElevatedButton("Вибрати всі", on_click=on_select_all, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                                ft.ElevatedButton("Застосувати до вибраних", on_click=on_batch, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                            ]),
+                        ], visible=role == "admin"),
+                        ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        time_text
+                    ]
+                )
+            ]),
+            width=800,
+            height=750,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+        start_monitors()
+        request_update()
+
+    def show_list_equipment(e):
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        db = session_db()
+        search_field = ft.TextField(label="Пошук за назвою", width=400, color='white', label_style=ft.TextStyle(color='white'))
+        rows_view = ft.Column()
+
+        def show_rows(rows, empty_text="Список порожній."):
+            rows_view.controls.clear()
+            if not rows:
+                rows_view.controls.append(ft.Text(empty_text, color='white'))
+            for row in rows:
+                rows_view.controls.append(
+                    ft.Text(f"ID: {row[0]}, Назва: {row[1]}, SN: {row[2]}, Кабінет: {row[3]}, Відповідальний: {row[4]}, Стан: {row[5]}", color='white')
+                )
+
+        def on_search(e):
+            if search_field.value and search_field.value.strip():
+                show_rows([row for _, row in similar_equipment(db, search_field.value, containment=True)], "Нічого не знайдено.")
+            else:
+                show_rows(db["read"]("SELECT * FROM equipment_details"))
+            request_update()
+
+        def on_duplicates(e):
+            # Звіт рахується у фоновому виконавці звітів, як і експорт, а не в обробнику події
+            duplicates_button.disabled = True
+            rows_view.controls.clear()
+            rows_view.controls.append(ft.Text("Пошук дублікатів…", color='white'))
+            request_update()
+            export_executor.submit(find_duplicates)
+
+        def find_duplicates():
+            started = time.monotonic()
+            try:
+                pairs = duplicate_report(db)
+            except sqlite3.Error as err:
+                show_snackbar(f"Помилка: {str(err)}", bgcolor="red_400")
+                pairs = None
+            duplicates_button.disabled = False
+            if pairs is not None:
+                rows_view.controls.clear()
+                rows_view.controls.append(ft.Text(f"Можливих дублікатів: {len(pairs)} (пошук {(time.monotonic() - started) * 1000:.0f} мс)", color='white'))
+                for score, first, second in pairs[:AUDIT_REPORT_LIMIT]:
+                    rows_view.controls.append(ft.Text(
+                        f"{score:.0%}: ID {first[0]} «{first[1]}» (SN {first[2]}) та ID {second[0]} «{second[1]}» (SN {second[2]}), кабінет {first[3]}",
+                        color='white'
+                    ))
+            request_update()
+
+        duplicates_button = ft.ElevatedButton("Дублікати", on_click=on_duplicates, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')))
+
+        search_field.on_submit = on_search
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=450) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    scroll=ft.ScrollMode.AUTO,
+                    controls=[
+                        ft.Text("Перелік техніки", size=24, weight="bold", color='white'),
+                        ft.Row([
+                            search_field,
+                            ft.ElevatedButton("Шукати", on_click=on_search, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                            duplicates_button,
+                        ]),
+                        rows_view
+                    ]
+                )
+            ]),
+            width=800,
+            height=450,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+        show_rows(db["read"]("SELECT * FROM equipment_details"))
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(time_text)
+        start_monitors()
+        request_update()
+
+    def show_grouped_equipment(e):
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        db = session_db()
+        page_starts = [0]
+        next_start = [None]
+
+        grouping_dropdown = ft.Dropdown(
+            label="Групувати",
+            value="location",
+            options=[ft.dropdown.Option("location", "За кабінетами"), ft.dropdown.Option("responsible", "За відповідальними")],
+            width=250
+        )
+        group_dropdown = ft.Dropdown(label="Група", width=350)
+        rows_view = ft.ListView(auto_scroll=False, width=750, height=250)
+        page_text = ft.Text("", color='white')
+
+        def load_page():
+            rows_view.controls.clear()
+            if not group_dropdown.value:
+                page_text.value = ""
+                request_update()
+                return
+            rows = equipment_page(db["read"], grouping_dropdown.value, int(group_dropdown.value),
+                                 page_starts[-1], EQUIPMENT_PAGE_SIZE + 1)
+            next_start[0] = rows[EQUIPMENT_PAGE_SIZE - 1][0] if len(rows) > EQUIPMENT_PAGE_SIZE else None
+            for row in rows[:EQUIPMENT_PAGE_SIZE]:
+                rows_view.controls.append(
+                    ft.Text(f"ID: {row[0]}, Назва: {row[1]}, SN: {row[2]}, Кабінет: {row[3]}, Відповідальний: {row[4]}, Стан: {row[5]}", color='white')
+                )
+            page_text.value = f"Сторінка {len(page_starts)}"
+            request_update()
+
+        def load_groups(e=None):
+            groups = equipment_groups(db, grouping_dropdown.value)
+            group_dropdown.options = [ft.dropdown.Option(str(group_id), f"{name} ({count})") for group_id, name, count in groups]
+            group_dropdown.value = str(groups[0][0]) if groups else None
+            page_starts[:] = [0]
+            load_page()
+
+        def on_group_change(e):
+            page_starts[:] = [0]
+            load_page()
+
+        def on_next(e):
+            if next_start[0] is not None:
+                page_starts.append(next_start[0])
+                load_page()
+
+        def on_prev(e):
+            if len(page_starts) > 1:
+                page_starts.pop()
+                load_page()
+
+        grouping_dropdown.on_change = load_groups
+        group_dropdown.on_change = on_group_change
+
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=550) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    controls=[
+                        ft.Text("Техніка за кабінетами та відповідальними", size=24, weight="bold", color='white'),
+                        ft.Row([grouping_dropdown, group_dropdown]),
+                        rows_view,
+                        ft.Row([
+                            ft.ElevatedButton("Попередня", on_click=on_prev, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                            page_text,
+                            ft.ElevatedButton("Наступна", on_click=on_next, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ]),
+                        ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        time_text
+                    ]
+                )
+            ]),
+            width=800,
+            height=550,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+        start_monitors()
+        load_groups()
+
+    def show_delete_equipment(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може видаляти записи!")
+            return
+
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=850, height=600) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    controls=[
+                        ft.Text("Видалити техніку", size=24, weight="bold", text_align='center', color='white')
+                    ]
+                )
+            ]),
+            width=850,
+            height=600,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+
+        rows = session_db()["read"]("SELECT * FROM equipment_details")
+
+        if not rows:
+            layout.content.controls[1].controls.append(ft.Text("Список порожній.", color='white'))
+        else:
+            data_table = ft.DataTable(
+                columns=[
+                    ft.DataColumn(ft.Text("ID", color='white')),
+                    ft.DataColumn(ft.Text("Назва", color='white')),
+                    ft.DataColumn(ft.Text("Серійний номер", color='white')),
+                    ft.DataColumn(ft.Text("Кабінет", color='white')),
+                    ft.DataColumn(ft.Text("Відповідальний", color='white')),
+                    ft.DataColumn(ft.Text("Стан", color='white')),
+                    ft.DataColumn(ft.Text("Дія", color='white')),
+                ],
+                rows=[
+                    ft.DataRow(
+                        cells=[
+                            ft.DataCell(ft.Text(str(row[0]), color='white')),
+                            ft.DataCell(ft.Text(row[1], color='white')),
+                            ft.DataCell(ft.Text(row[2], color='white')),
+                            ft.DataCell(ft.Text(row[3], color='white')),
+                            ft.DataCell(ft.Text(row[4], color='white')),
+                            ft.DataCell(ft.Text(row[5], color='white')),
+                            ft.DataCell(
+                                ft.ElevatedButton(
+                                    text="Видалити",
+                                    on_click=lambda e, serial=row[2]: delete_equipment(serial),
+                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))
+                                )
+                            ),
+                        ]
+                    ) for row in rows
+                ]
+            )
+            layout.content.controls[1].controls.append(
+                ft.ListView(
+                    controls=[data_table],
+                    auto_scroll=True,
+                    width=800,
+                    height=400
+                )
+            )
+
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(time_text)
+        start_monitors()
+        request_update()
+
+    def delete_equipment(serial):
+        db = session_db()
+        with db["lock"]:
+            db["cursor"].execute("DELETE FROM equipment WHERE serial_number = ?", (serial,))
+            db["commit"]()
+            rowcount = db["cursor"].rowcount
+        if rowcount:
+            show_snackbar("Видалено!")
+        else:
+            show_snackbar("Пристрій не знайдено!")
+        show_delete_equipment(None)
+
+    def show_users_and_logs(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може переглядати користувачів та логи!")
+            return
+
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+
+        # Ініціалізація контейнерів перед додаванням до controls
+        user_section = ft.Container(visible=False)
+        login_logs_section = ft.Container(visible=False)
+        payment_logs_section = ft.Container(visible=False)
 
-    def stop_monitors():
-        stop_timers.set()  # Signal timers to stop
-        for timer in active_timers:
-            timer.cancel()  # Cancel all active timers
-        active_timers.clear()  # Clear the list of timers
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=650, height=500) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    horizontal_alignment='center',
+                    controls=[
+                        ft.Text("Користувачі та логи", size=24, weight="bold", text_align='center', color='white'),
+                        ft.Row(
+                            alignment=ft.MainAxisAlignment.CENTER,
+                            controls=[
+                                ft.ElevatedButton(
+                                    text="Зареєстровані користувачі",
+                                    on_click=lambda e: show_section("users"),
+                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
+                                    width=200
+                                ),
+                                ft.ElevatedButton(
+                                    text="Логи входу",
+                                    on_click=lambda e: show_section("login_logs"),
+                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
+                                    width=200
+                                ),
+                                ft.ElevatedButton(
+                                    text="Логи платежів",
+                                    on_click=lambda e: show_section("payment_logs"),
+                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
+                                    width=200
+                                )
+                            ],
+                            spacing=10
+                        ),
+                        user_section,
+                        login_logs_section,
+                        payment_logs_section
+                    ]
+                )
+            ]),
+            width=650,
+            height=500,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
 
-    def cleanup():
-        stop_monitors()
-        with db_lock:
-            conn.close()
+        sections = {"users": user_section, "login_logs": login_logs_section, "payment_logs": payment_logs_section}
+        cell = lambda value: ft.DataCell(ft.Text(value, text_align='center', color='white'))
 
-    def show_login(e):
-        stop_monitors()  # Stop any existing timers
-        content_container.controls.clear()
-        content_container.controls.append(login_layout)
-        start_monitors()
-        email_field.value = ""
-        password_field.value = ""
-        page.update()
+        def user_row(user):
+            return ft.DataRow(cells=[
+                cell(user[1]),
+                cell(user[2][:5] if user[2] else ""),
+                cell(user[3]),
+                cell("Активна" if user[4] else "Відсутня"),
+                ft.DataCell(ft.ElevatedButton(
+                    text="Видалити",
+                    on_click=lambda e, email=user[1]: delete_user(email),
+                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))
+                )),
+            ])
 
-    def show_register(e):
-        stop_monitors()  # Stop any existing timers
-        content_container.controls.clear()
-        content_container.controls.append(register_layout)
-        start_monitors()
-        email_field.value = ""
-        password_field.value = ""
-        confirm_password_field.value = ""
-        role_dropdown.value = None
-        page.update()
+        # розділ -> (заголовок, текст для порожнього розділу, колонки,
+        #           сторінка за курсором, курсор після рядка, рядок таблиці)
+        section_specs = {
+            "users": ("Зареєстровані користувачі", "Немає зареєстрованих користувачів.",
+                      ("Email", "Пароль (хеш)", "Роль", "Статус підписки", "Дія"),
+                      lambda cursor_key: users_page(cursor_key or 0), lambda row: row[0], user_row),
+            "login_logs": ("Логи входу", "Немає логів входу.", ("Email", "Час входу", "Пристрій"),
+                           login_logs_page, lambda row: (row[0], row[1]),
+                           lambda log: ft.DataRow(cells=[cell(log[2]), cell(format_ts(log[0])), cell(log[3])])),
+            "payment_logs": ("Логи платежів", "Немає логів платежів.", ("Email", "Сума", "Час оплати"),
+                             payment_logs_page, lambda row: row[0],
+                             lambda payment: ft.DataRow(cells=[cell(payment[1]), cell(payment[2]), cell(format_ts(payment[3]))])),
+        }
 
-    def register(e):
-        email = email_field.value
-        password = password_field.value
-        confirm_password = confirm_password_field.value
-        selected_role = role_dropdown.value
+        def show_section(section):
+            # Таблиці прихованих розділів звільняються, видимий читає першу сторінку
+            title, empty_text, columns, fetch, cursor_of, make_row = section_specs[section]
+            for name, container in sections.items():
+                container.visible = name == section
+                if name != section:
+                    container.content = None
+            rows = fetch(None)
+            if not rows:
+                sections[section].content = ft.Text(empty_text, text_align='center', color='white')
+                if not stop_timers.is_set():
+                    request_update()
+                return
+            table = ft.DataTable(
+                columns=[ft.DataColumn(ft.Text(column, text_align='center', color='white')) for column in columns],
+                rows=[make_row(row) for row in rows],
+                column_spacing=10,
+            )
+            page_cursor = [cursor_of(rows[-1])]
+            more_button = ft.ElevatedButton("Показати ще", visible=len(rows) == USERS_LOGS_PAGE_SIZE,
+                                            style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')))
 
-        if not all([email, password, confirm_password, selected_role]):
-            show_snackbar("Заповніть усі поля!", bgcolor="red_400")
-            return
+            def show_more(e):
+                next_rows = fetch(page_cursor[0])
+                table.rows.extend(make_row(row) for row in next_rows)
+                if next_rows:
+                    page_cursor[0] = cursor_of(next_rows[-1])
+                more_button.visible = len(next_rows) == USERS_LOGS_PAGE_SIZE
+                request_update()
 
-        if password != confirm_password:
-            show_snackbar("Паролі не збігаються!", bgcolor="red_400")
-            return
+            more_button.on_click = show_more
+            sections[section].content = ft.Column([
+                ft.Text(title, size=18, weight="bold", text_align='center', color='white'),
+                ft.ListView(controls=[table, more_button], width=500, height=200)
+            ])
+            if not stop_timers.is_set():
+                request_update()
 
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
-        try:
-            with db_lock:
-                cursor.execute("INSERT INTO users (email, password, role, subscription_status) VALUES (?, ?, ?, ?)",
-                              (email, hashed_password, selected_role, False))
-                conn.commit()
-            show_snackbar("Реєстрація успішна!")
-            show_login(e)
-        except sqlite3.IntegrityError:
-            show_snackbar("Цей email вже зареєстровано!", bgcolor="red_400")
+        # Show users section by default
+        show_section("users")
 
-    def login(e):
-        nonlocal role, current_email
-        email = email_field.value
-        password = password_field.value
+        layout.content.controls[1].controls.append(
+            ft.Container(
+                content=ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                alignment=ft.alignment.center
+            )
+        )
+        layout.content.controls[1].controls.append(
+            ft.Container(
+                content=time_text,
+                alignment=ft.alignment.center
+            )
+        )
+        start_monitors()
+        request_update()
 
-        if not email or not password:
-            show_snackbar("Введіть email і пароль!", bgcolor="red_400")
+    def delete_user(email):
+        if email == "admin":
+            show_snackbar("Ви не можете видалити свій акаунт!", bgcolor="red_400")
             return
 
-        with db_lock:
-            cursor.execute("SELECT password, role FROM users WHERE email = ?", (email,))
-            user = cursor.fetchone()
+        faculty = read_query("SELECT faculty FROM users WHERE email = ?", (email,))
+        if faculty and faculty[0][0] in FACULTIES:
+            shard = get_shard(faculty[0][0])
+            with shard["lock"]:
+                shard["cursor"].execute("DELETE FROM login_logs WHERE email = ?", (email,))
+                shard["cursor"].execute("DELETE FROM reservations WHERE user_email = ?", (email,))
+                shard["commit"]()
 
-        if user and bcrypt.checkpw(password.encode('utf-8'), user[0].encode('utf-8')):
-            role = user[1]
-            current_email = email
-            login_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            device_info = "Unknown Device"
-            with db_lock:
-                cursor.execute("INSERT INTO login_logs (email, login_time, device_info) VALUES (?, ?, ?)",
-                              (email, login_time, device_info))
-                conn.commit()
-            show_snackbar(f"Увійшли як {role}!")
-            show_main_menu(e)
-        elif email == "admin" and password == "admin":
-            role = "admin"
-            current_email = "admin"
-            login_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            device_info = "Unknown Device"
-            with db_lock:
-                cursor.execute("INSERT INTO login_logs (email, login_time, device_info) VALUES (?, ?, ?)",
-                              ("admin", login_time, device_info))
-                conn.commit()
-            show_snackbar("Увійшли як адміністратор!")
-            show_main_menu(e)
+        with db_lock:
+            cursor.execute("DELETE FROM login_logs WHERE email = ?", (email,))
+            cursor.execute("DELETE FROM reservations WHERE user_email = ?", (email,))
+            cursor.execute("DELETE FROM payment_logs WHERE user_email = ?", (email,))
+            cursor.execute("DELETE FROM users WHERE email = ?", (email,))
+            commit_changes()
+            rowcount = cursor.rowcount
+        if rowcount:
+            show_snackbar("Акаунт видалено!")
         else:
-            email_field.value = ""
-            password_field.value = ""
-            show_snackbar("Неправильний email або пароль!", bgcolor="red_400")
+            show_snackbar("Користувача не знайдено!")
+        show_users_and_logs(None)
 
-    def show_main_menu(e):
-        stop_monitors()  # Stop any existing timers
+    def show_faculty_report(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може переглядати звіти!")
+            return
+
+        stop_monitors()
         content_container.controls.clear()
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
         layout = ft.Container(
             content=ft.Stack([
-                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=400, height=500) if background_image else ft.Container(),
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=700, height=500) if background_image else ft.Container(),
                 ft.Column(
                     spacing=20,
                     alignment='center',
                     controls=[
-                        ft.Text("Облік техніки", size=24, weight="bold", text_align='center', color='white'),
-                        ft.ElevatedButton("Додати запис", on_click=show_add_equipment, visible=role in ["teacher", "admin"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Показати всі записи", on_click=show_list_equipment, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Бронювати техніку", on_click=show_reserve_equipment, visible=role in ["student", "teacher"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Переглянути бронювання", on_click=show_reservations, visible=role in ["student", "teacher", "admin"], style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Обробити чергу бронювань", on_click=process_reservation_queue, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Оформити підписку", on_click=show_subscription_payment, visible=role == "student", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Видалити запис", on_click=show_delete_equipment, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Переглянути користувачів та логи", on_click=show_users_and_logs, visible=role == "admin", style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        ft.ElevatedButton("Вийти", on_click=logout, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                        time_text
+                        ft.Text("Звіт по факультетах", size=24, weight="bold", color='white')
                     ]
                 )
             ]),
-            width=400,
+            width=700,
             height=500,
             border_radius=20,
             shadow=ft.BoxShadow(blur_radius=5, color='red')
         )
         content_container.controls.append(layout)
+
+        started = time.monotonic()
+        report = faculty_report()
+        elapsed = (time.monotonic() - started) * 1000
+        data_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("Факультет", color='white')),
+                ft.DataColumn(ft.Text("Техніки", color='white')),
+                ft.DataColumn(ft.Text("Потребує ремонту", color='white')),
+                ft.DataColumn(ft.Text("Бронювань", color='white')),
+                ft.DataColumn(ft.Text("Входів за тиждень", color='white')),
+            ],
+            rows=[
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(row["faculty"], color='white')),
+                        ft.DataCell(ft.Text(str(row["equipment"]), color='white')),
+                        ft.DataCell(ft.Text(str(row["broken"]), color='white')),
+                        ft.DataCell(ft.Text(str(row["reservations"]), color='white')),
+                        ft.DataCell(ft.Text(str(row["logins_week"]), color='white')),
+                    ]
+                ) for row in report
+            ]
+        )
+        layout.content.controls[1].controls.append(
+            ft.ListView(
+                controls=[data_table],
+                auto_scroll=True,
+                width=650,
+                height=300
+            )
+        )
+        layout.content.controls[1].controls.append(ft.Text(f"Зібрано з {len(report)} баз за {elapsed:.0f} мс", color='white'))
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(time_text)
         start_monitors()
-        page.update()
+        request_update()
 
-    def show_add_equipment(e):
-        if role not in ["teacher", "admin"]:
-            show_snackbar("Студенти не можуть додавати записи!")
+    def show_audit(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може проводити інвентаризацію!")
             return
 
         stop_monitors()
         content_container.controls.clear()
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
-        # Dropdown for equipment status
-        status_dropdown = ft.Dropdown(
-            label="Стан",
-            width=500,
-            options=[
-                ft.dropdown.Option("Справна", "Справна"),
-                ft.dropdown.Option("Потрібен ремонт", "Потрібен ремонт"),
-                ft.dropdown.Option("Списана", "Списана"),
-            ],
-            border_color='white',
-            label_style=ft.TextStyle(color='white'),
-            text_style=ft.TextStyle(color='white')
-        )
+        uploaded_scans = []
+
+        location_field = ft.TextField(label="Кабінет, що перевіряється", color='white', label_style=ft.TextStyle(color='white'))
+        scans_field = ft.TextField(label="Серійні номери (по одному в рядку, можна \"номер,кабінет\")", multiline=True, min_lines=4, max_lines=6, color='white', label_style=ft.TextStyle(color='white'))
+        full_checkbox = ft.Checkbox(label="Повна інвентаризація (усі кабінети)", label_style=ft.TextStyle(color='white'))
+        upload_text = ft.Text("", color='white')
+        report_view = ft.ListView(width=700, height=200)
+
+        def load_scans_file(path):
+            with open(path, encoding="utf-8-sig") as f:
+                uploaded_scans.extend(f.read().splitlines())
+            upload_text.value = f"Завантажено рядків з файлу: {len(uploaded_scans)}"
+            request_update()
+
+        def on_pick(e):
+            if not e.files:
+                return
+            picked = e.files[0]
+            if picked.path:
+                load_scans_file(picked.path)
+            else:
+                file_picker.upload([ft.FilePickerUploadFile(picked.name, upload_url=page.get_upload_url(picked.name, 600))])
+
+        def on_upload(e):
+            if e.error:
+                show_snackbar(f"Помилка завантаження: {e.error}", bgcolor="red_400")
+            elif e.progress == 1.0:
+                path = os.path.join(UPLOAD_DIR, os.path.basename(e.file_name))
+                try:
+                    load_scans_file(path)
+                finally:
+                    os.remove(path)
+
+        file_picker.on_result = on_pick
+        file_picker.on_upload = on_upload
+
+        def on_reconcile(e):
+            lines = itertools.chain(uploaded_scans, (scans_field.value or "").splitlines())
+            report = run_audit(parse_scans(lines, location_field.value.strip() or None), full=full_checkbox.value)
+            report_view.controls.clear()
+            report_view.controls.append(ft.Text(
+                f"Скановано: {report['scanned']} за {report['duration_ms']} мс. Пропущено: {len(report['missing'])}, "
+                f"зайвих: {len(report['unexpected'])}, переміщено: {len(report['relocated'])}", color='white', weight="bold"))
+            for row in report["missing"][:AUDIT_REPORT_LIMIT]:
+                report_view.controls.append(ft.Text(f"Відсутня: {row[1]} (SN: {row[2]}), очікувалась у {row[3]}", color='white'))
+            for row in report["unexpected"][:AUDIT_REPORT_LIMIT]:
+                report_view.controls.append(ft.Text(f"Невідома: SN {row[0]} у {row[1] or '-'}", color='white'))
+            for row in report["relocated"][:AUDIT_REPORT_LIMIT]:
+                report_view.controls.append(ft.Text(f"Переміщена: {row[1]} (SN: {row[2]}) з {row[3]} до {row[4]}", color='white'))
+            uploaded_scans.clear()
+            upload_text.value = ""
+            request_update()
+
         layout = ft.Container(
             content=ft.Stack([
-                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=500, height=550) if background_image else ft.Container(),
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=750, height=700) if background_image else ft.Container(),
                 ft.Column(
-                    spacing=20,
+                    spacing=15,
                     alignment='center',
                     controls=[
-                        ft.Text("Додати техніку", size=24, weight="bold", color='white'),
-                        ft.TextField(label="Назва пристрою", autofocus=True, color='white', label_style=ft.TextStyle(color='white')),
-                        ft.TextField(label="Серійний номер", color='white', label_style=ft.TextStyle(color='white')),
-                        ft.TextField(label="Кабінет", color='white', label_style=ft.TextStyle(color='white')),
-                        ft.TextField(label="Відповідальний", color='white', label_style=ft.TextStyle(color='white')),
-                        status_dropdown,
-                        ft.ElevatedButton("Додати", on_click=add_equipment, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        ft.Text("Інвентаризація", size=24, weight="bold", color='white'),
+                        location_field,
+                        scans_field,
+                        ft.Row([
+                            ft.ElevatedButton("Завантажити файл", on_click=lambda e: file_picker.pick_files(allowed_extensions=["txt", "csv"]), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                            upload_text
+                        ]),
+                        full_checkbox,
+                        ft.ElevatedButton("Звірити", on_click=on_reconcile, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        report_view,
                         ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
                         time_text
                     ]
                 )
             ]),
-            width=500,
-            height=550,
+            width=750,
+            height=700,
             border_radius=20,
             shadow=ft.BoxShadow(blur_radius=5, color='red')
         )
         content_container.controls.append(layout)
         start_monitors()
-        page.update()
+        request_update()
 
-    def add_equipment(e):
-        # Adjust indices to account for the new dropdown
-        fields = content_container.controls[0].content.controls[1].controls[1:5]  # TextFields: name, serial, location, responsible
-        status_dropdown = content_container.controls[0].content.controls[1].controls[5]  # Dropdown for status
-        if not all(field.value for field in fields) or not status_dropdown.value:
-            show_snackbar("Заповніть усі поля!")
+    def show_statistics(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може переглядати статистику!")
             return
 
-        name, serial, location, responsible = [field.value for field in fields]
-        status = status_dropdown.value
-        try:
-            with db_lock:
-                cursor.execute("INSERT INTO equipment (name, serial_number, location, responsible, status) VALUES (?, ?, ?, ?, ?)",
-                               (name, serial, location, responsible, status))
-                conn.commit()
-            show_snackbar("Техніку додано успішно!")
-            show_main_menu(e)
-        except sqlite3.IntegrityError:
-            show_snackbar("Серійний номер уже існує!")
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=650, height=550) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=15,
+                    alignment='center',
+                    controls=[
+                        ft.Text("Статистика", size=24, weight="bold", color='white')
+                    ]
+                )
+            ]),
+            width=650,
+            height=550,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
+
+        stats = load_stats()
+        totals = stats.get("total", {})
+        statuses = stats.get("status", {})
+        locations = stats.get("location", {})
+        reservations = stats.get("reservations", {})
+
+        top_ids = list(reservations)[:10]
+        rows = read_query(f"SELECT id, name FROM equipment WHERE id IN ({','.join('?' * len(top_ids))})", top_ids)
+        names = {str(row[0]): row[1] for row in rows}
+
+        lines = [
+            f"Техніки: {totals.get('equipment', 0)}, з них потребує ремонту: {statuses.get('Потрібен ремонт', 0)}",
+            f"Користувачів: {totals.get('users', 0)}, з активною підпискою: {totals.get('subscribers', 0)}",
+            f"Бронювань у черзі: {totals.get('reservations', 0)}",
+            "За станом: " + (", ".join(f"{key or '-'}: {value}" for key, value in statuses.items()) or "-"),
+            "За кабінетами: " + (", ".join(f"{key or '-'}: {value}" for key, value in locations.items()) or "-"),
+            "Найбільше бронювань: " + (", ".join(f"{names.get(key, key)}: {value}" for key, value in list(reservations.items())[:10]) or "-"),
+            "Входів за тиждень: " + (", ".join(
+                f"{datetime.fromtimestamp(bucket).strftime('%d.%m')}: {count}"
+                for bucket, count in count_events_by_bucket("logins", time.time() - 7 * 24 * 3600, time.time(), "day")
+            ) or "-"),
+        ]
+        layout.content.controls[1].controls.append(
+            ft.ListView(
+                controls=[ft.Text(line, color='white') for line in lines],
+                width=600,
+                height=300
+            )
+        )
+
+        def on_rebuild(e):
+            rebuild_stats()
+            show_snackbar("Статистику перераховано!")
+            show_statistics(e)
+
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Перерахувати", on_click=on_rebuild, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(time_text)
+        start_monitors()
+        request_update()
+
+    def show_backups(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може керувати резервними копіями!")
+            return
 
-    def show_list_equipment(e):
         stop_monitors()
         content_container.controls.clear()
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
         layout = ft.Container(
             content=ft.Stack([
-                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=450) if background_image else ft.Container(),
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=750, height=500) if background_image else ft.Container(),
                 ft.Column(
                     spacing=20,
                     alignment='center',
                     controls=[
-                        ft.Text("Перелік техніки", size=24, weight="bold", color='white')
+                        ft.Text("Резервні копії", size=24, weight="bold", color='white')
                     ]
                 )
             ]),
-            width=800,
-            height=450,
+            width=750,
+            height=500,
             border_radius=20,
             shadow=ft.BoxShadow(blur_radius=5, color='red')
         )
         content_container.controls.append(layout)
+
         with db_lock:
-            cursor.execute("SELECT * FROM equipment")
+            cursor.execute("SELECT created_at, duration_ms, bytes, compressed_bytes, status FROM backup_logs ORDER BY id DESC LIMIT 20")
             rows = cursor.fetchall()
+
         if not rows:
-            layout.content.controls[1].controls.append(ft.Text("Список порожній.", color='white'))
+            layout.content.controls[1].controls.append(ft.Text("Резервних копій ще немає.", color='white'))
         else:
-            for row in rows:
-                layout.content.controls[1].controls.append(
-                    ft.Text(f"ID: {row[0]}, Назва: {row[1]}, SN: {row[2]}, Кабінет: {row[3]}, Відповідальний: {row[4]}, Стан: {row[5]}", color='white')
+            data_table = ft.DataTable(
+                columns=[
+                    ft.DataColumn(ft.Text("Час", color='white')),
+                    ft.DataColumn(ft.Text("Тривалість, мс", color='white')),
+                    ft.DataColumn(ft.Text("Розмір, КБ", color='white')),
+                    ft.DataColumn(ft.Text("Стиснено, КБ", color='white')),
+                    ft.DataColumn(ft.Text("Перевірка", color='white')),
+                ],
+                rows=[
+                    ft.DataRow(
+                        cells=[
+                            ft.DataCell(ft.Text(format_ts(row[0]), color='white')),
+                            ft.DataCell(ft.Text(str(row[1]), color='white')),
+                            ft.DataCell(ft.Text(str(row[2] // 1024), color='white')),
+                            ft.DataCell(ft.Text(str(row[3] // 1024), color='white')),
+                            ft.DataCell(ft.Text(row[4], color='white')),
+                        ]
+                    ) for row in rows
+                ]
+            )
+            layout.content.controls[1].controls.append(
+                ft.ListView(
+                    controls=[data_table],
+                    auto_scroll=True,
+                    width=700,
+                    height=300
                 )
+            )
+
+        def run_backup():
+            report = backup_database()
+            if report["status"] == "ok":
+                show_snackbar(f"Копію створено за {report['duration_ms']} мс ({report['bytes'] // 1024} КБ)")
+            else:
+                show_snackbar(f"Помилка резервного копіювання: {report['status']}", bgcolor="red_400")
+
+        def on_backup(e):
+            show_snackbar("Резервне копіювання розпочато...")
+            threading.Thread(target=run_backup, daemon=True).start()  # Не тримаємо обробник події на час копіювання
+
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Створити копію", on_click=on_backup, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
         layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
         layout.content.controls[1].controls.append(time_text)
         start_monitors()
-        page.update()
+        request_update()
 
-    def show_delete_equipment(e):
+    def show_jobs(e):
         if role != "admin":
-            show_snackbar("Тільки адміністратор може видаляти записи!")
+            show_snackbar("Тільки адміністратор може переглядати фонові задачі!")
             return
 
         stop_monitors()
@@ -514,303 +4848,229 @@ def main(page: ft.Page):
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
         layout = ft.Container(
             content=ft.Stack([
-                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=850, height=600) if background_image else ft.Container(),
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=500) if background_image else ft.Container(),
                 ft.Column(
                     spacing=20,
                     alignment='center',
                     controls=[
-                        ft.Text("Видалити техніку", size=24, weight="bold", text_align='center', color='white')
+                        ft.Text("Фонові задачі", size=24, weight="bold", color='white')
                     ]
                 )
             ]),
-            width=850,
-            height=600,
+            width=800,
+            height=500,
             border_radius=20,
             shadow=ft.BoxShadow(blur_radius=5, color='red')
         )
         content_container.controls.append(layout)
 
-        with db_lock:
-            cursor.execute("SELECT * FROM equipment")
-            rows = cursor.fetchall()
-
-        if not rows:
-            layout.content.controls[1].controls.append(ft.Text("Список порожній.", color='white'))
+        jobs = job_stats()
+        if not jobs:
+            layout.content.controls[1].controls.append(ft.Text("Планувальник не запущено.", color='white'))
         else:
             data_table = ft.DataTable(
                 columns=[
-                    ft.DataColumn(ft.Text("ID", color='white')),
-                    ft.DataColumn(ft.Text("Назва", color='white')),
-                    ft.DataColumn(ft.Text("Серійний номер", color='white')),
-                    ft.DataColumn(ft.Text("Кабінет", color='white')),
-                    ft.DataColumn(ft.Text("Відповідальний", color='white')),
-                    ft.DataColumn(ft.Text("Стан", color='white')),
-                    ft.DataColumn(ft.Text("Дія", color='white')),
+                    ft.DataColumn(ft.Text("Задача", color='white')),
+                    ft.DataColumn(ft.Text("Запусків", color='white')),
+                    ft.DataColumn(ft.Text("Помилок", color='white')),
+                    ft.DataColumn(ft.Text("Відкладено", color='white')),
+                    ft.DataColumn(ft.Text("Середній час, мс", color='white')),
+                    ft.DataColumn(ft.Text("Макс. час, мс", color='white')),
+                    ft.DataColumn(ft.Text("Наступний запуск, с", color='white')),
                 ],
                 rows=[
                     ft.DataRow(
                         cells=[
-                            ft.DataCell(ft.Text(str(row[0]), color='white')),
-                            ft.DataCell(ft.Text(row[1], color='white')),
-                            ft.DataCell(ft.Text(row[2], color='white')),
-                            ft.DataCell(ft.Text(row[3], color='white')),
-                            ft.DataCell(ft.Text(row[4], color='white')),
-                            ft.DataCell(ft.Text(row[5], color='white')),
-                            ft.DataCell(
-                                ft.ElevatedButton(
-                                    text="Видалити",
-                                    on_click=lambda e, serial=row[2]: delete_equipment(serial),
-                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))
-                                )
-                            ),
+                            ft.DataCell(ft.Text(job["name"], color='white', tooltip=job["last_error"])),
+                            ft.DataCell(ft.Text(str(job["runs"]), color='white')),
+                            ft.DataCell(ft.Text(str(job["errors"]), color='white')),
+                            ft.DataCell(ft.Text(str(job["deferrals"]), color='white')),
+                            ft.DataCell(ft.Text(f"{job['avg_time'] * 1000:.1f}", color='white')),
+                            ft.DataCell(ft.Text(f"{job['max_time'] * 1000:.1f}", color='white')),
+                            ft.DataCell(ft.Text(str(int(job["next_in"])), color='white')),
                         ]
-                    ) for row in rows
+                    ) for job in jobs
                 ]
             )
             layout.content.controls[1].controls.append(
                 ft.ListView(
                     controls=[data_table],
                     auto_scroll=True,
-                    width=800,
-                    height=400
+                    width=750,
+                    height=300
                 )
             )
 
+        notifications = notification_stats()
+        layout.content.controls[1].controls.append(ft.Text(
+            f"Сповіщення: надіслано {notifications['sent']}, в черзі {notifications['pending']}, "
+            f"повторів {notifications['retried']}, не доставлено {notifications['failed']}, "
+            f"пакетів {notifications['batches']} (останній {notifications['last_batch']} за {notifications['last_batch_ms']} мс), "
+            f"{notifications['per_second']:.1f} повідомлень/с",
+            color='white'
+        ))
         layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
         layout.content.controls[1].controls.append(time_text)
         start_monitors()
-        page.update()
+        request_update()
 
-    def delete_equipment(serial):
-        with db_lock:
-            cursor.execute("DELETE FROM equipment WHERE serial_number = ?", (serial,))
-            conn.commit()
-            rowcount = cursor.rowcount
-        if rowcount:
-            show_snackbar("Видалено!")
-        else:
-            show_snackbar("Пристрій не знайдено!")
-        show_delete_equipment(None)
+    def update_export_view(view, job):
+        bar, status_text, download_button = view
+        statuses = {"queued": "у черзі", "running": "виконується", "done": "готово", "downloaded": "завантажено", "failed": "помилка"}
+        bar.value = job["rows"] / job["total"] if job["total"] else (1 if job["status"] in ("done", "downloaded") else None)
+        progress = f"{job['rows']}/{job['total']}" if job["total"] is not None else str(job["rows"])
+        status_text.value = f"{statuses[job['status']]}, рядків {progress}" + (f": {job['error']}" if job["error"] else "")
+        download_button.visible = job["status"] == "done"
+        download_button.data = job["url"]
 
-    def show_users_and_logs(e):
+    def on_export_progress(job):
+        # Викликається з потоку експорту
+        view = export_views.get(job["id"])
+        if view is not None:
+            update_export_view(view, job)
+            request_update()
+
+    def show_exports(e):
         if role != "admin":
-            show_snackbar("Тільки адміністратор може переглядати користувачів та логи!")
+            show_snackbar("Тільки адміністратор може експортувати звіти!")
             return
 
         stop_monitors()
         content_container.controls.clear()
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        report_dropdown = ft.Dropdown(
+            label="Звіт",
+            options=[ft.dropdown.Option(report, spec[0]) for report, spec in EXPORT_REPORTS.items()],
+            value="login_logs",
+            width=220
+        )
+        format_dropdown = ft.Dropdown(
+            label="Формат",
+            options=[ft.dropdown.Option(fmt, fmt.upper(), disabled=fmt == "xlsx" and not xlsx_available()) for fmt in EXPORT_FORMATS],
+            value="csv",
+            width=140
+        )
+        month_field = ft.TextField(label="Місяць (РРРР-ММ)", value=datetime.now().strftime("%Y-%m"), width=180, color='white', label_style=ft.TextStyle(color='white'))
+        jobs_column = ft.Column()
 
-        # Ініціалізація контейнерів перед додаванням до controls
-        user_section = ft.Container(visible=False)
-        login_logs_section = ft.Container(visible=False)
-        payment_logs_section = ft.Container(visible=False)
+        def add_job_row(job):
+            bar = ft.ProgressBar(width=200)
+            status_text = ft.Text("", color='white')
+            download_button = ft.ElevatedButton("Завантажити", on_click=lambda e: page.launch_url(e.control.data), style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')))
+            export_views[job["id"]] = (bar, status_text, download_button)
+            update_export_view(export_views[job["id"]], job)
+            label = f"{EXPORT_REPORTS[job['report']][0]} {job['month'] or ''} ({job['format'].upper()})"
+            jobs_column.controls.insert(0, ft.Row([ft.Text(label, color='white', width=220), bar, status_text, download_button]))
+
+        def on_export(e):
+            month = (month_field.value or "").strip() or None
+            try:
+                job = submit_export(report_dropdown.value, format_dropdown.value, month, session_db()["path"],
+                                    page.session_id, on_export_progress)
+            except ValueError as err:
+                show_snackbar(f"Не вдалося почати експорт: {err}")
+                return
+            add_job_row(job)
+            request_update()
+
+        export_views.clear()
+        for job in sorted(session_exports(page.session_id), key=lambda job: job["created"]):
+            add_job_row(job)
 
         layout = ft.Container(
             content=ft.Stack([
-                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=650, height=500) if background_image else ft.Container(),
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=800, height=500) if background_image else ft.Container(),
                 ft.Column(
                     spacing=20,
                     alignment='center',
-                    horizontal_alignment='center',
+                    scroll=ft.ScrollMode.AUTO,
                     controls=[
-                        ft.Text("Користувачі та логи", size=24, weight="bold", text_align='center', color='white'),
-                        ft.Row(
-                            alignment=ft.MainAxisAlignment.CENTER,
-                            controls=[
-                                ft.ElevatedButton(
-                                    text="Зареєстровані користувачі",
-                                    on_click=lambda e: show_section("users"),
-                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
-                                    width=200
-                                ),
-                                ft.ElevatedButton(
-                                    text="Логи входу",
-                                    on_click=lambda e: show_section("login_logs"),
-                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
-                                    width=200
-                                ),
-                                ft.ElevatedButton(
-                                    text="Логи платежів",
-                                    on_click=lambda e: show_section("payment_logs"),
-                                    style=ft.ButtonStyle(text_style=ft.TextStyle(color='black')),
-                                    width=200
-                                )
-                            ],
-                            spacing=10
-                        ),
-                        user_section,
-                        login_logs_section,
-                        payment_logs_section
+                        ft.Text("Експорт звітів", size=24, weight="bold", color='white'),
+                        ft.Row([report_dropdown, format_dropdown, month_field]),
+                        ft.ElevatedButton("Експортувати", on_click=on_export, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        jobs_column,
+                        ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
+                        time_text
                     ]
                 )
             ]),
-            width=650,
+            width=800,
             height=500,
             border_radius=20,
             shadow=ft.BoxShadow(blur_radius=5, color='red')
         )
         content_container.controls.append(layout)
+        start_monitors()
+        request_update()
 
-        # Fetch all users
-        with db_lock:
-            cursor.execute("SELECT email, password, role, subscription_status FROM users")
-            users = cursor.fetchall()
-
-        # Fetch all login logs
-        with db_lock:
-            cursor.execute("SELECT email, login_time, device_info FROM login_logs")
-            logs = cursor.fetchall()
-
-        # Fetch all payment logs
-        with db_lock:
-            cursor.execute("SELECT user_email, amount, payment_time FROM payment_logs")
-            payments = cursor.fetchall()
+    def show_sessions(e):
+        if role != "admin":
+            show_snackbar("Тільки адміністратор може переглядати сесії!")
+            return
 
-        def show_section(section):
-            nonlocal user_section, login_logs_section, payment_logs_section
-            user_section.visible = section == "users"
-            login_logs_section.visible = section == "login_logs"
-            payment_logs_section.visible = section == "payment_logs"
-
-            if section == "users" and users:
-                user_table = ft.DataTable(
-                    columns=[
-                        ft.DataColumn(ft.Text("Email", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Пароль (хеш)", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Роль", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Статус підписки", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Дія", text_align='center', color='white')),
-                    ],
-                    rows=[
-                        ft.DataRow(
-                            cells=[
-                                ft.DataCell(ft.Text(user[0], text_align='center', color='white')),
-                                ft.DataCell(ft.Text(user[1][:5] if user[1] else "", text_align='center', color='white')),
-                                ft.DataCell(ft.Text(user[2], text_align='center', color='white')),
-                                ft.DataCell(ft.Text("Активна" if user[3] else "Відсутня", text_align='center', color='white')),
-                                ft.DataCell(
-                                    ft.ElevatedButton(
-                                        text="Видалити",
-                                        on_click=lambda e, email=user[0]: delete_user(email),
-                                        style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))
-                                    )
-                                ),
-                            ]
-                        ) for user in users
-                    ],
-                    column_spacing=10,
-                )
-                user_section.content = ft.Column([
-                    ft.Text("Зареєстровані користувачі", size=18, weight="bold", text_align='center', color='white'),
-                    ft.ListView(
-                        controls=[user_table],
-                        auto_scroll=True,
-                        width=500,
-                        height=200
-                    )
-                ])
-            elif section == "users" and not users:
-                user_section.content = ft.Text("Немає зареєстрованих користувачів.", text_align='center', color='white')
-
-            if section == "login_logs" and logs:
-                log_table = ft.DataTable(
-                    columns=[
-                        ft.DataColumn(ft.Text("Email", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Час входу", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Пристрій", text_align='center', color='white')),
-                    ],
-                    rows=[
-                        ft.DataRow(
-                            cells=[
-                                ft.DataCell(ft.Text(log[0], text_align='center', color='white')),
-                                ft.DataCell(ft.Text(log[1], text_align='center', color='white')),
-                                ft.DataCell(ft.Text(log[2], text_align='center', color='white')),
-                            ]
-                        ) for log in logs
-                    ],
-                    column_spacing=10,
-                )
-                login_logs_section.content = ft.Column([
-                    ft.Text("Логи входу", size=18, weight="bold", text_align='center', color='white'),
-                    ft.ListView(
-                        controls=[log_table],
-                        auto_scroll=True,
-                        width=500,
-                        height=200
-                    )
-                ])
-            elif section == "login_logs" and not logs:
-                login_logs_section.content = ft.Text("Немає логів входу.", text_align='center', color='white')
-
-            if section == "payment_logs" and payments:
-                payment_table = ft.DataTable(
-                    columns=[
-                        ft.DataColumn(ft.Text("Email", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Сума", text_align='center', color='white')),
-                        ft.DataColumn(ft.Text("Час оплати", text_align='center', color='white')),
-                    ],
-                    rows=[
-                        ft.DataRow(
-                            cells=[
-                                ft.DataCell(ft.Text(payment[0], text_align='center', color='white')),
-                                ft.DataCell(ft.Text(payment[1], text_align='center', color='white')),
-                                ft.DataCell(ft.Text(payment[2], text_align='center', color='white')),
-                            ]
-                        ) for payment in payments
-                    ],
-                    column_spacing=10,
+        stop_monitors()
+        content_container.controls.clear()
+        background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
+        layout = ft.Container(
+            content=ft.Stack([
+                ft.Image(src=background_image, fit=ft.ImageFit.COVER, width=650, height=500) if background_image else ft.Container(),
+                ft.Column(
+                    spacing=20,
+                    alignment='center',
+                    controls=[
+                        ft.Text("Активні сесії", size=24, weight="bold", color='white')
+                    ]
                 )
-                payment_logs_section.content = ft.Column([
-                    ft.Text("Логи платежів", size=18, weight="bold", text_align='center', color='white'),
-                    ft.ListView(
-                        controls=[payment_table],
-                        auto_scroll=True,
-                        width=500,
-                        height=200
-                    )
-                ])
-            elif section == "payment_logs" and not payments:
-                payment_logs_section.content = ft.Text("Немає логів платежів.", text_align='center', color='white')
-
-            if not stop_timers.is_set():
-                page.update()
-
-        # Show users section by default
-        show_section("users")
+            ]),
+            width=650,
+            height=500,
+            border_radius=20,
+            shadow=ft.BoxShadow(blur_radius=5, color='red')
+        )
+        content_container.controls.append(layout)
 
+        stats = session_stats()
+        mb = 1024 * 1024
         layout.content.controls[1].controls.append(
-            ft.Container(
-                content=ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))),
-                alignment=ft.alignment.center
-            )
+            ft.Text(f"Сесій: {stats['count']}, RSS процесу: {stats['rss'] / mb:.1f} МБ, "
+                    f"приріст RSS процесу від старту / кількість сесій (загальнопроцесне середнє): {stats['process_rss_growth_avg'] / mb:.2f} МБ", color='white')
         )
         layout.content.controls[1].controls.append(
-            ft.Container(
-                content=time_text,
-                alignment=ft.alignment.center
+            ft.Text(f"Оновлень сторінки: запитано {stats['update_requests']}, відправлено {stats['update_flushes']}, "
+                    f"зекономлено {stats['updates_saved']}", color='white')
+        )
+        data_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("Сесія", color='white')),
+                ft.DataColumn(ft.Text("Користувач", color='white')),
+                ft.DataColumn(ft.Text("Неактивна, с", color='white')),
+                ft.DataColumn(ft.Text("RSS на старті, МБ", color='white')),
+                ft.DataColumn(ft.Text("Оновлень / зекономлено", color='white')),
+            ],
+            rows=[
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(str(session["id"])[:8], color='white')),
+                        ft.DataCell(ft.Text(session["email"] or "-", color='white')),
+                        ft.DataCell(ft.Text(str(int(session["idle"])), color='white')),
+                        ft.DataCell(ft.Text(f"{session['rss_at_start'] / mb:.1f}", color='white')),
+                        ft.DataCell(ft.Text(f"{session['update_requests']} / {session['updates_saved']}", color='white')),
+                    ]
+                ) for session in stats["sessions"]
+            ]
+        )
+        layout.content.controls[1].controls.append(
+            ft.ListView(
+                controls=[data_table],
+                auto_scroll=True,
+                width=600,
+                height=300
             )
         )
+        layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
+        layout.content.controls[1].controls.append(time_text)
         start_monitors()
-        page.update()
-
-    def delete_user(email):
-        if email == "admin":
-            show_snackbar("Ви не можете видалити свій акаунт!", bgcolor="red_400")
-            return
-        
-        with db_lock:
-            cursor.execute("DELETE FROM login_logs WHERE email = ?", (email,))
-            cursor.execute("DELETE FROM reservations WHERE user_email = ?", (email,))
-            cursor.execute("DELETE FROM payment_logs WHERE user_email = ?", (email,))
-            cursor.execute("DELETE FROM users WHERE email = ?", (email,))
-            conn.commit()
-            rowcount = cursor.rowcount
-        if rowcount:
-            show_snackbar("Акаунт видалено!")
-        else:
-            show_snackbar("Користувача не знайдено!")
-        show_users_and_logs(None)
+        request_update()
 
     def show_reserve_equipment(e):
         if role not in ["student", "teacher"]:
@@ -842,7 +5102,7 @@ def main(page: ft.Page):
         )
         content_container.controls.append(layout)
         start_monitors()
-        page.update()
+        request_update()
 
     def reserve_equipment(e):
         if role not in ["student", "teacher"]:
@@ -850,37 +5110,34 @@ def main(page: ft.Page):
             return
 
         equipment_id_field = content_container.controls[0].content.controls[1].controls[1].value
-        reservation_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        reservation_time = int(time.time())
 
         if not equipment_id_field:
             show_snackbar("Введіть ID обладнання!")
             return
 
-        with db_lock:
-            cursor.execute("SELECT id FROM equipment WHERE id = ?", (equipment_id_field,))
-            equipment_exists = cursor.fetchone()
+        db = session_db()
+        equipment_exists = db["read"]("SELECT id FROM equipment WHERE id = ?", (equipment_id_field,))
 
         if not equipment_exists:
             show_snackbar("Обладнання не знайдено!")
             return
 
-        priority = 0
-        if role == "teacher":
-            priority = 2
-        elif role == "student":
-            with db_lock:
-                cursor.execute("SELECT subscription_status FROM users WHERE email = ?", (current_email,))
-                subscription_status = cursor.fetchone()[0]
-            priority = 1 if subscription_status else 0
+        subscription_status = False
+        if role == "student":
+            subscription_status = read_query("SELECT subscription_status FROM users WHERE email = ?", (current_email,))[0][0]
+        priority = reservation_priority(role, subscription_status)
 
         try:
-            with db_lock:
-                cursor.execute("""
+            with db["lock"]:
+                db["cursor"].execute("""
                     INSERT INTO reservations (equipment_id, user_email, reservation_time, priority)
                     VALUES (?, ?, ?, ?)
                 """, (equipment_id_field, current_email, reservation_time, priority))
-                conn.commit()
-            show_snackbar("Бронювання створено!")
+                reservation_id = db["cursor"].lastrowid
+                db["commit"]()
+            position = queue_positions(db, [(reservation_id, equipment_exists[0][0])]).get(reservation_id)
+            show_snackbar(f"Бронювання створено! Місце в черзі: {position[0]} з {position[1]}" if position else "Бронювання створено!")
             show_main_menu(e)
         except sqlite3.Error as err:
             show_snackbar(f"Помилка: {str(err)}")
@@ -907,16 +5164,17 @@ def main(page: ft.Page):
         )
         content_container.controls.append(layout)
 
-        with db_lock:
-            if role == "admin":
-                cursor.execute("SELECT r.id, r.equipment_id, r.user_email, r.reservation_time, r.priority, e.name FROM reservations r JOIN equipment e ON r.equipment_id = e.id")
-            else:
-                cursor.execute("SELECT r.id, r.equipment_id, r.user_email, r.reservation_time, r.priority, e.name FROM reservations r JOIN equipment e ON r.equipment_id = e.id WHERE r.user_email = ?", (current_email,))
-            rows = cursor.fetchall()
+        db = session_db()
+        read = db["read"]
+        if role == "admin":
+            rows = read("SELECT r.id, r.equipment_id, r.user_email, r.reservation_time, r.priority, e.name FROM reservations r JOIN equipment e ON r.equipment_id = e.id")
+        else:
+            rows = read("SELECT r.id, r.equipment_id, r.user_email, r.reservation_time, r.priority, e.name FROM reservations r JOIN equipment e ON r.equipment_id = e.id WHERE r.user_email = ?", (current_email,))
 
         if not rows:
             layout.content.controls[1].controls.append(ft.Text("Немає бронювань.", color='white'))
         else:
+            positions = queue_positions(db, [(row[0], row[1]) for row in rows])
             data_table = ft.DataTable(
                 columns=[
                     ft.DataColumn(ft.Text("ID", color='white')),
@@ -924,6 +5182,7 @@ def main(page: ft.Page):
                     ft.DataColumn(ft.Text("Користувач", color='white')),
                     ft.DataColumn(ft.Text("Час бронювання", color='white')),
                     ft.DataColumn(ft.Text("Пріоритет", color='white')),
+                    ft.DataColumn(ft.Text("Місце в черзі", color='white')),
                     ft.DataColumn(ft.Text("Дія", color='white')),
                 ],
                 rows=[
@@ -932,8 +5191,9 @@ def main(page: ft.Page):
                             ft.DataCell(ft.Text(str(row[0]), color='white')),
                             ft.DataCell(ft.Text(row[5], color='white')),
                             ft.DataCell(ft.Text(row[2], color='white')),
-                            ft.DataCell(ft.Text(row[3], color='white')),
+                            ft.DataCell(ft.Text(format_ts(row[3]), color='white')),
                             ft.DataCell(ft.Text(str(row[4]), color='white')),
+                            ft.DataCell(ft.Text(f"{positions[row[0]][0]} з {positions[row[0]][1]}" if row[0] in positions else "—", color='white')),
                             ft.DataCell(
                                 ft.ElevatedButton(
                                     text="Скасувати",
@@ -958,13 +5218,14 @@ def main(page: ft.Page):
         layout.content.controls[1].controls.append(ft.ElevatedButton("Назад", on_click=show_main_menu, style=ft.ButtonStyle(text_style=ft.TextStyle(color='black'))))
         layout.content.controls[1].controls.append(time_text)
         start_monitors()
-        page.update()
+        request_update()
 
     def cancel_reservation(res_id):
-        with db_lock:
-            cursor.execute("DELETE FROM reservations WHERE id = ?", (res_id,))
-            conn.commit()
-            rowcount = cursor.rowcount
+        db = session_db()
+        with db["lock"]:
+            db["cursor"].execute("DELETE FROM reservations WHERE id = ?", (res_id,))
+            db["commit"]()
+            rowcount = db["cursor"].rowcount
         if rowcount:
             show_snackbar("Бронювання скасовано!")
         else:
@@ -1001,7 +5262,7 @@ def main(page: ft.Page):
         )
         content_container.controls.append(layout)
         start_monitors()
-        page.update()
+        request_update()
 
     def process_queue_for_equipment(e):
         equipment_id = content_container.controls[0].content.controls[1].controls[1].value
@@ -1009,30 +5270,45 @@ def main(page: ft.Page):
             show_snackbar("Введіть ID обладнання!")
             return
 
-        with db_lock:
-            cursor.execute("SELECT id FROM equipment WHERE id = ?", (equipment_id,))
-            equipment_exists = cursor.fetchone()
+        db = session_db()
+        equipment_exists = db["read"]("SELECT id, name FROM equipment WHERE id = ?", (equipment_id,))
 
         if not equipment_exists:
             show_snackbar("Обладнання не знайдено!")
             return
 
-        with db_lock:
-            cursor.execute("""
-                SELECT user_email, reservation_time, priority
-                FROM reservations
-                WHERE equipment_id = ?
-                ORDER BY priority DESC, reservation_time ASC
-            """, (equipment_id,))
-            reservations = cursor.fetchall()
-
-        if reservations:
-            selected_user = reservations[0][0]
-            show_snackbar(f"Техніку заброньовано для {selected_user}!")
-            with db_lock:
-                cursor.execute("DELETE FROM reservations WHERE user_email = ? AND equipment_id = ?",
-                              (selected_user, equipment_id))
-                conn.commit()
+        # Вибір, видалення бронювання і сповіщення — одна транзакція
+        try:
+            with db["lock"]:
+                try:
+                    db["cursor"].execute("""
+                        SELECT id, user_email, reservation_time
+                        FROM reservations
+                        WHERE equipment_id = ?
+                        ORDER BY priority DESC, reservation_time ASC, id
+                        LIMIT 1
+                    """, (equipment_id,))
+                    selected = db["cursor"].fetchone()
+                    if selected:
+                        reservation_id, selected_user, reservation_time = selected
+                        record_dispatch(db["cursor"], reservation_id)
+                        db["cursor"].execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+                        enqueue_notification(
+                            db["cursor"], selected_user, "Заброньована техніка доступна",
+                            f"Вашу чергу на \"{equipment_exists[0][1]}\" (ID {equipment_exists[0][0]}) оброблено: техніку закріплено за вами.",
+                            f"reservation:{equipment_exists[0][0]}:{selected_user}:{reservation_time}"
+                        )
+                        db["commit"]()
+                except sqlite3.Error:
+                    db["cursor"].connection.rollback()
+                    raise
+        except sqlite3.Error as err:
+            show_snackbar(f"Помилка: {str(err)}", bgcolor="red_400")
+            return
+
+        if selected:
+            notification_wakeup.set()
+            show_snackbar(f"Техніку заброньовано для {selected_user}! Користувача буде сповіщено.")
         else:
             show_snackbar("Немає бронювань для цього обладнання.")
         show_main_menu(e)
@@ -1042,13 +5318,16 @@ def main(page: ft.Page):
             show_snackbar("Тільки студенти можуть оформлювати підписку!")
             return
 
-        with db_lock:
-            cursor.execute("SELECT subscription_status FROM users WHERE email = ?", (current_email,))
-            subscription_status = cursor.fetchone()[0]
+        nonlocal payment_key
+        subscription_status = read_query("SELECT subscription_status FROM users WHERE email = ?", (current_email,))[0][0]
         if subscription_status:
             show_snackbar("У вас уже є активна підписка!")
             return
+        if has_pending_payment(current_email):
+            show_snackbar("Ваш платіж ще обробляється!")
+            return
 
+        payment_key = uuid.uuid4().hex
         stop_monitors()
         content_container.controls.clear()
         background_image = "https://st.depositphotos.com/1000350/2282/i/450/depositphotos_22823894-stock-photo-dark-concrete-texture.jpg" if role in ["student", "teacher", "admin"] else ""
@@ -1077,7 +5356,7 @@ def main(page: ft.Page):
         )
         content_container.controls.append(layout)
         start_monitors()
-        page.update()
+        request_update()
 
     def process_payment(e):
         card_number = content_container.controls[0].content.controls[1].controls[1].value
@@ -1103,20 +5382,16 @@ def main(page: ft.Page):
             show_snackbar("Неправильний CVV!", bgcolor="red_400")
             return
 
-        try:
-            with db_lock:
-                cursor.execute("UPDATE users SET subscription_status = TRUE WHERE email = ?", (current_email,))
-                conn.commit()
-
-                payment_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                cursor.execute("INSERT INTO payment_logs (user_email, amount, payment_time) VALUES (?, ?, ?)",
-                              (current_email, amount, payment_time))
-                conn.commit()
+        # Токенізація йде у фоні: результат приходить снекбаром через request_update
+        def on_tokenized(future):
+            accepted, message = future.result()
+            show_snackbar(message, bgcolor=None if accepted else "red_400")
+            if accepted and not stop_timers.is_set():
+                show_main_menu(None)
 
-            show_snackbar("Оплата успішна! Підписка активована.")
-            show_main_menu(e)
-        except sqlite3.Error as err:
-            show_snackbar(f"Помилка: {str(err)}", bgcolor="red_400")
+        show_snackbar("Перевіряємо картку...")
+        payment_executor.submit(tokenize_and_submit, payment_key, current_email, amount,
+                                card_number, expiry_date, cvv).add_done_callback(on_tokenized)
 
     def validate_luhn(card_number):
         digits = [int(d) for d in card_number]
@@ -1135,11 +5410,313 @@ def main(page: ft.Page):
         show_login(e)
 
     # Initial screen
+    register_session(page.session_id, evict_session)
     initialize_equipment_data()  # Додаємо початкові дані про техніку
     content_container.controls.append(login_layout)
     page.add(content_container)
     start_monitors()
     page.on_close = cleanup  # Cleanup on app close
-    page.update()
+    request_update()
+
+# Офлайн-симулятор політик черги бронювань: попит (reservation_history або
+# синтетичний) завантажується в масиви NumPy і програється потактово. На
+# кожному такті для кожної техніки обслуговується стільки заявок, скільки
+# було видач у цей такт, у порядку, який задає політика. NumPy потрібен
+# лише симулятору: pip install numpy.
+QUEUE_CLASSES = ("студент", "студент з підпискою", "викладач")  # індекс = reservation_priority()
+QUEUE_TICK = 3600  # секунд на такт
+QUEUE_AGING_PERIOD = 24 * 3600  # за стільки очікування aging додає +1 до пріоритету
+
+# Політика — функція (klass, waited) -> оцінка; більша оцінка обслуговується
+# раніше, рівні — за часом заявки
+QUEUE_POLICIES = {
+    "current": lambda klass, waited: klass * 1.0,  # ORDER BY priority DESC, reservation_time, id
+    "fifo": lambda klass, waited: klass * 0.0,
+    "aging": lambda klass, waited: klass + waited / QUEUE_AGING_PERIOD,
+}
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Для симулятора потрібен numpy: pip install numpy")
+    return numpy
+
+def history_demand(tick=QUEUE_TICK):
+    # Заявки й видачі — з reservation_history спільної бази та шардів;
+    # скасовані й прострочені бронювання видачами не вважаються.
+    # Клас користувача береться з його поточних ролі та підписки.
+    np = import_numpy()
+    with db_lock:
+        cursor.execute("SELECT email, role, subscription_status FROM users")
+        classes = {email: reservation_priority(user_role, subscribed) for email, user_role, subscribed in cursor.fetchall()}
+    arrivals, dispatches, equipment_index = [], [], {}
+    for db in all_databases():
+        with db["lock"]:
+            db["cursor"].execute("""
+                SELECT event, equipment_id, user_email, reservation_time, event_time FROM reservation_history
+                WHERE event IN ('request', 'dispatch') AND typeof(reservation_time) = 'integer'
+                ORDER BY id
+            """)
+            rows = db["cursor"].fetchall()
+        for event, equipment_id, email, reservation_time, event_time in rows:
+            # id техніки в шардах перетинаються, тож ключ — пара (база, id)
+            index = equipment_index.setdefault((db["name"], equipment_id), len(equipment_index))
+            if event == "request":
+                arrivals.append((reservation_time, index, classes.get(email, 0)))
+            else:
+                dispatches.append((event_time, index))
+    if not arrivals:
+        raise RuntimeError("В історії немає бронювань")
+    arrival = np.array([row[0] for row in arrivals], dtype=np.int64)
+    start = int(arrival.min())
+    end = max(int(arrival.max()), max((row[0] for row in dispatches), default=start)) + 1
+    ticks = (end - start) // tick + 1
+    capacity = np.zeros((ticks, len(equipment_index)), dtype=np.int32)
+    if dispatches:
+        dispatch_tick = (np.array([row[0] for row in dispatches], dtype=np.int64) - start) // tick
+        np.add.at(capacity, (dispatch_tick, np.array([row[1] for row in dispatches], dtype=np.int64)), 1)
+    return {
+        "arrival": arrival,
+        "equipment": np.array([row[1] for row in arrivals], dtype=np.int64),
+        "klass": np.array([row[2] for row in arrivals], dtype=np.int8),
+        "capacity": capacity,
+        "start": start,
+        "tick": tick,
+    }
+
+def synthetic_demand(events, equipment=500, days=120, load=0.9, mix=(0.6, 0.25, 0.15), seed=0, tick=QUEUE_TICK):
+    # Семестр заявок: популярність техніки спадає за степеневим законом,
+    # пропускна здатність кожної одиниці — пуассонівська з навантаженням load
+    np = import_numpy()
+    rng = np.random.default_rng(seed)
+    ticks = days * 24 * 3600 // tick
+    weights = 1.0 / np.arange(1, equipment + 1) ** 0.8
+    demand_equipment = rng.choice(equipment, events, p=weights / weights.sum())
+    service_rate = np.bincount(demand_equipment, minlength=equipment) / ticks / load
+    return {
+        "arrival": rng.integers(0, ticks * tick, events, dtype=np.int64),
+        "equipment": demand_equipment,
+        "klass": rng.choice(len(QUEUE_CLASSES), events, p=mix).astype(np.int8),
+        "capacity": rng.poisson(service_rate, size=(ticks, equipment)).astype(np.int32),
+        "start": 0,
+        "tick": tick,
+    }
+
+def simulate_queue(demand, policy):
+    # Час очікування кожної заявки в секундах (-1 — не обслужена до кінця симуляції)
+    np = import_numpy()
+    arrival, equipment, klass = demand["arrival"], demand["equipment"], demand["klass"]
+    capacity, start, tick = demand["capacity"], demand["start"], demand["tick"]
+    order = np.argsort(arrival, kind="stable")
+    arrived_by_tick = np.searchsorted((arrival[order] - start) // tick, np.arange(1, len(capacity) + 1))
+    wait = np.full(len(arrival), -1, dtype=np.int64)
+    waiting = np.empty(0, dtype=np.int64)
+    arrived = 0
+    for t, slots in enumerate(capacity):
+        if arrived_by_tick[t] > arrived:
+            waiting = np.concatenate((waiting, order[arrived:arrived_by_tick[t]]))
+            arrived = arrived_by_tick[t]
+        if not waiting.size:
+            continue
+        has_slot = slots[equipment[waiting]] > 0
+        if not has_slot.any():
+            continue
+        candidates = waiting[has_slot]
+        now = start + (t + 1) * tick
+        score = policy(klass[candidates], now - arrival[candidates])
+        ranked = candidates[np.lexsort((arrival[candidates], -score, equipment[candidates]))]
+        ranked_equipment = equipment[ranked]
+        group_start = np.flatnonzero(np.r_[True, ranked_equipment[1:] != ranked_equipment[:-1]])
+        rank = np.arange(ranked.size) - np.repeat(group_start, np.diff(np.r_[group_start, ranked.size]))
+        served = rank < slots[ranked_equipment]
+        wait[ranked[served]] = now - arrival[ranked[served]]
+        waiting = np.concatenate((waiting[~has_slot], ranked[~served]))
+    return wait
+
+def queue_report(demand, wait):
+    # Розподіл очікування (години) і справедливість за класами користувачів
+    np = import_numpy()
+    report = {"classes": []}
+    means = []
+    for klass, name in enumerate(QUEUE_CLASSES):
+        in_class = demand["klass"] == klass
+        waits = wait[in_class & (wait >= 0)] / 3600
+        row = {"class": name, "requests": int(in_class.sum()), "served": int(waits.size),
+               "unserved": int((in_class & (wait < 0)).sum())}
+        if waits.size:
+            p50, p90, p99 = np.percentile(waits, [50, 90, 99])
+            row.update(mean=float(waits.mean()), p50=float(p50), p90=float(p90), p99=float(p99))
+            means.append(waits.mean())
+        report["classes"].append(row)
+    # Індекс Джейна за середнім очікуванням класів: 1 — однакове для всіх
+    means = np.array(means)
+    report["jain"] = float(means.sum() ** 2 / (len(means) * (means ** 2).sum())) if means.size and means.any() else 1.0
+    return report
+
+# Службові команди: python app.py <команда>
+def cli_simulate_queue(args):
+    # python app.py simulate-queue [--synthetic N] [--policies current,fifo,aging] [--equipment N] [--days N] [--load X] [--tick SEC]
+    options = {"--synthetic": None, "--policies": ",".join(QUEUE_POLICIES), "--equipment": "500", "--days": "120", "--load": "0.9", "--tick": str(QUEUE_TICK)}
+    for flag, value in zip(args[::2], args[1::2]):
+        if flag not in options:
+            print(f"Невідомий параметр: {flag}")
+            return
+        options[flag] = value
+    policies = options["--policies"].split(",")
+    unknown = [name for name in policies if name not in QUEUE_POLICIES]
+    if unknown:
+        print(f"Невідомі політики: {', '.join(unknown)}; доступні: {', '.join(QUEUE_POLICIES)}")
+        return
+    started = time.monotonic()
+    try:
+        if options["--synthetic"]:
+            demand = synthetic_demand(int(options["--synthetic"]), int(options["--equipment"]), int(options["--days"]),
+                                      float(options["--load"]), tick=int(options["--tick"]))
+        else:
+            demand = history_demand(int(options["--tick"]))
+    except RuntimeError as err:
+        print(err)
+        return
+    print(f"Заявок: {len(demand['arrival'])}, техніки: {demand['capacity'].shape[1]}, тактів: {demand['capacity'].shape[0]}, "
+          f"підготовка {time.monotonic() - started:.1f} с")
+    for name in policies:
+        started = time.monotonic()
+        report = queue_report(demand, simulate_queue(demand, QUEUE_POLICIES[name]))
+        print(f"\n{name}: {time.monotonic() - started:.1f} с, індекс Джейна {report['jain']:.3f}")
+        print("клас\tзаявок\tобслужено\tне обслужено\tсереднє, год\tp50\tp90\tp99")
+        for row in report["classes"]:
+            stats = "\t".join(f"{row[key]:.1f}" for key in ("mean", "p50", "p90", "p99")) if "mean" in row else "-\t-\t-\t-"
+            print(f"{row['class']}\t{row['requests']}\t{row['served']}\t{row['unserved']}\t{stats}")
+
+def cli_rebuild_stats(args):
+    rebuild_stats()
+    for kind, values in load_stats().items():
+        for key, value in values.items():
+            print(f"{kind}\t{key}\t{value}")
+
+def cli_changes(args):
+    # python app.py changes [since_seq] [batch_size] — зміни у форматі JSON Lines
+    since_seq = int(args[0]) if args else 0
+    batch_size = int(args[1]) if len(args) > 1 else 500
+    if change_log_gap(since_seq):
+        print(f"Журнал ущільнено після seq {since_seq}: зміни видаються з нуля", file=sys.stderr)
+        since_seq = 0
+    for batch in stream_changes(since_seq, batch_size):
+        for change in batch:
+            print(json.dumps(change, ensure_ascii=False))
+
+def cli_compact_changes(args):
+    print(f"Видалено записів журналу: {compact_change_log()}")
+
+def cli_backup(args):
+    report = backup_database()
+    print(f"{report['status']}: {report['path']}, {report['duration_ms']} мс, "
+          f"{report['pages']} сторінок, {report['bytes']} -> {report['compressed_bytes']} байт")
+
+def cli_restore(args):
+    if not args:
+        print("Використання: python app.py restore <файл.db.gz>")
+        return
+    restore_backup(args[0])
+    print("Базу відновлено.")
+
+def cli_set_status(args):
+    # python app.py set-status <стан> <id> [<id> ...]
+    if len(args) < 2 or not all(arg.isdigit() for arg in args[1:]):
+        print(f"Використання: python app.py set-status <{'|'.join(EQUIPMENT_STATUSES)}> <id> [<id> ...]")
+        return
+    ids = [int(arg) for arg in args[1:]]
+    rows = read_query(f"SELECT id, version FROM equipment WHERE id IN ({','.join('?' * len(ids))})", ids)
+    updated, conflicts = update_status_batch(primary_db(), dict(rows), args[0])
+    missing = sorted(set(ids) - {row[0] for row in rows})
+    print(f"Оновлено: {len(updated)}, конфліктів: {len(conflicts)}, не знайдено: {len(missing)}")
+
+def cli_dedup_report(args):
+    # python app.py dedup-report [поріг] [факультет]
+    threshold = float(args[0]) if args else DUPLICATE_SIMILARITY
+    db = faculty_db(args[1] if len(args) > 1 else None)
+    started = time.monotonic()
+    pairs = duplicate_report(db, threshold)
+    for score, first, second in pairs:
+        print(f"{score:.2f}\t{first[0]}\t{first[1]}\t{second[0]}\t{second[1]}\t{first[3]}")
+    print(f"Пар: {len(pairs)}, {(time.monotonic() - started) * 1000:.0f} мс")
+
+def cli_run_job(args):
+    jobs = {
+        "expire_subscriptions": expire_subscriptions,
+        "recompute_priorities": recompute_reservation_priorities,
+        "prune_reservations": prune_stale_reservations,
+        "compact_change_log": compact_change_log,
+        "prune_notifications": prune_notification_outbox,
+        "prune_exports": prune_exports,
+    }
+    if not args or args[0] not in jobs:
+        print(f"Використання: python app.py run-job <{'|'.join(jobs)}>")
+        return
+    print(f"Оброблено: {jobs[args[0]]()}")
+
+def cli_audit(args):
+    # python app.py audit <файл> [кабінет] [--full]
+    if not args:
+        print("Використання: python app.py audit <файл.csv> [кабінет] [--full]")
+        return
+    full = "--full" in args
+    args = [arg for arg in args if arg != "--full"]
+    with open(args[0], encoding="utf-8-sig") as f:
+        report = run_audit(parse_scans(f, args[1] if len(args) > 1 else None), full=full)
+    print(f"Скановано: {report['scanned']}, пропущено: {len(report['missing'])}, "
+          f"зайвих: {len(report['unexpected'])}, переміщено: {len(report['relocated'])}, {report['duration_ms']} мс")
+    for row in report["missing"]:
+        print(f"missing\t{row[2]}\t{row[1]}\t{row[3]}")
+    for row in report["unexpected"]:
+        print(f"unexpected\t{row[0]}\t\t{row[1] or ''}")
+    for row in report["relocated"]:
+        print(f"relocated\t{row[2]}\t{row[1]}\t{row[3]} -> {row[4]}")
+
+def cli_bench_queue_ranks(args):
+    # python app.py bench-queue-ranks [кількість бронювань] [кількість техніки]
+    results = benchmark_queue_ranks(int(args[0]) if args else 100_000, int(args[1]) if len(args) > 1 else 20)
+    for key, value in results.items():
+        print(f"{key}\t{value:.3f}" if isinstance(value, float) else f"{key}\t{value}")
+
+def cli_bench_timestamps(args):
+    # python app.py bench-timestamps [кількість рядків]
+    results = benchmark_time_queries(int(args[0]) if args else 10_000_000)
+    for key, value in results.items():
+        print(f"{key}\t{value:.3f}" if isinstance(value, float) else f"{key}\t{value}")
+
+cli_commands = {
+    "bench-timestamps": cli_bench_timestamps,
+    "bench-queue-ranks": cli_bench_queue_ranks,
+    "audit": cli_audit,
+    "run-job": cli_run_job,
+    "backup": cli_backup,
+    "restore": cli_restore,
+    "set-status": cli_set_status,
+    "dedup-report": cli_dedup_report,
+    "simulate-queue": cli_simulate_queue,
+    "rebuild-stats": cli_rebuild_stats,
+    "changes": cli_changes,
+    "compact-changes": cli_compact_changes,
+}
 
-ft.app(target=main, view=ft.AppView.WEB_BROWSER, host="192.168.1.7", port=8080)
+# Під час імпорту (тести) лише створюється схема: без CLI, фонових задач і серверів
+if __name__ == "__main__" and len(sys.argv) > 1 and sys.argv[1] in cli_commands:
+    cli_commands[sys.argv[1]](sys.argv[2:])
+elif __name__ == "__main__":
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    schedule_job("expire_subscriptions", expire_subscriptions, SUBSCRIPTION_EXPIRY_INTERVAL)
+    schedule_job("recompute_priorities", recompute_reservation_priorities, PRIORITY_RECOMPUTE_INTERVAL)
+    schedule_job("prune_reservations", prune_stale_reservations, RESERVATION_PRUNE_INTERVAL)
+    schedule_job("compact_change_log", compact_change_log, CHANGE_LOG_COMPACT_INTERVAL)
+    schedule_job("backup", backup_database, BACKUP_INTERVAL)
+    schedule_job("prune_notifications", prune_notification_outbox, NOTIFY_PRUNE_INTERVAL)
+    schedule_job("prune_exports", prune_exports, EXPORT_PRUNE_INTERVAL)
+    schedule_job("prune_kiosk_sessions", prune_kiosk_sessions, KIOSK_PRUNE_INTERVAL)
+    start_scheduler()
+    start_payment_worker()
+    start_notification_worker()
+    start_api_server()
+    ft.app(target=main, view=ft.AppView.WEB_BROWSER, host=UI_HOST, port=8080, upload_dir=UPLOAD_DIR, assets_dir=ASSETS_DIR)
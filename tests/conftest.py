@@ -0,0 +1,55 @@
+import importlib
+import os
+import sys
+import uuid
+
+import bcrypt
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # app.py під час імпорту відкриває inventory.db у поточному каталозі,
+    # тож модуль імпортується один раз у тимчасовому каталозі з чистою базою
+    workdir = tmp_path_factory.mktemp("inventory")
+    cwd = os.getcwd()
+    environ = {name: os.environ.get(name) for name in ("INVENTORY_API_PORT", "INVENTORY_FACULTIES")}
+    os.chdir(workdir)
+    os.environ["INVENTORY_API_PORT"] = "0"
+    os.environ.pop("INVENTORY_FACULTIES", None)
+    sys.path.insert(0, ROOT)
+    try:
+        yield importlib.import_module("app")
+    finally:
+        sys.path.remove(ROOT)
+        os.chdir(cwd)
+        for name, value in environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+@pytest.fixture
+def equipment(app):
+    # Новий запис техніки: (id, версія)
+    serial = uuid.uuid4().hex[:12]
+    with app.db_lock:
+        app.insert_equipment(app.cursor, "Тестовий проектор", serial, "Кабінет 101", "Тестовий викладач", "Справна")
+        app.commit_changes()
+        app.cursor.execute("SELECT id, version FROM equipment WHERE serial_number = ?", (serial,))
+        return app.cursor.fetchone()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(role="student"):
+        email = f"{uuid.uuid4().hex[:8]}@test"
+        password = bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode("utf-8")
+        with app.db_lock:
+            app.cursor.execute("INSERT INTO users (email, password, role) VALUES (?, ?, ?)", (email, password, role))
+            app.commit_changes()
+        return email
+    return make_user
@@ -0,0 +1,47 @@
+def change_log_rows(app, equipment_id):
+    with app.db_lock:
+        app.cursor.execute("SELECT seq, op FROM change_log WHERE table_name = 'equipment' AND row_id = ? ORDER BY seq",
+                           (equipment_id,))
+        return app.cursor.fetchall()
+
+
+def test_compaction_keeps_latest_change_per_row(app, equipment):
+    equipment_id, version = equipment
+    db = app.primary_db()
+    for status in ("Потрібен ремонт", "Справна", "Потрібен ремонт"):
+        version = app.update_equipment(db, equipment_id, version, status, "Кабінет 101", "Тестовий викладач")
+    assert len(change_log_rows(app, equipment_id)) == 4
+
+    app.compact_change_log(keep=0)
+
+    rows = change_log_rows(app, equipment_id)
+    assert len(rows) == 1
+    change = next(change for change in app.read_changes(rows[0][0] - 1, 1) if change["row_id"] == equipment_id)
+    assert change["data"]["status"] == "Потрібен ремонт"
+    assert change["data"]["version"] == version
+
+
+def test_expired_tombstones_open_a_gap(app, equipment):
+    equipment_id, _ = equipment
+    with app.db_lock:
+        app.cursor.execute("DELETE FROM equipment WHERE id = ?", (equipment_id,))
+        app.commit_changes()
+    (delete_seq, op), = change_log_rows(app, equipment_id)[-1:]
+    assert op == "delete"
+
+    app.compact_change_log(keep=0, tombstone_ttl=-1)
+
+    assert change_log_rows(app, equipment_id) == []
+    # Споживач, що читав до видалення, мусить перечитати журнал з нуля
+    assert app.change_log_gap(delete_seq - 1)
+    assert not app.change_log_gap(delete_seq)
+    assert not app.change_log_gap(0)
+
+
+def test_compaction_keeps_recent_entries(app, equipment):
+    equipment_id, version = equipment
+    app.update_equipment(app.primary_db(), equipment_id, version, "Потрібен ремонт", "Кабінет 101", "Тестовий викладач")
+
+    app.compact_change_log(keep=10)
+
+    assert [op for _, op in change_log_rows(app, equipment_id)] == ["insert", "update"]
@@ -0,0 +1,65 @@
+import threading
+
+
+def equipment_row(app, equipment_id):
+    with app.db_lock:
+        app.cursor.execute("SELECT status, version FROM equipment WHERE id = ?", (equipment_id,))
+        return app.cursor.fetchone()
+
+
+def test_update_with_current_version_bumps_it(app, equipment):
+    equipment_id, version = equipment
+
+    new_version = app.update_equipment(app.primary_db(), equipment_id, version, "Потрібен ремонт", "Кабінет 101", "Тестовий викладач")
+
+    assert new_version == version + 1
+    assert equipment_row(app, equipment_id) == ("Потрібен ремонт", version + 1)
+
+
+def test_update_with_stale_version_is_rejected(app, equipment):
+    equipment_id, version = equipment
+    db = app.primary_db()
+    app.update_equipment(db, equipment_id, version, "Потрібен ремонт", "Кабінет 101", "Тестовий викладач")
+
+    assert app.update_equipment(db, equipment_id, version, "Списана", "Кабінет 101", "Тестовий викладач") is None
+    assert equipment_row(app, equipment_id) == ("Потрібен ремонт", version + 1)
+
+
+def test_update_of_deleted_row_is_rejected(app, equipment):
+    equipment_id, version = equipment
+    with app.db_lock:
+        app.cursor.execute("DELETE FROM equipment WHERE id = ?", (equipment_id,))
+        app.commit_changes()
+
+    assert app.update_equipment(app.primary_db(), equipment_id, version, "Списана", "Кабінет 101", "Тестовий викладач") is None
+
+
+def test_concurrent_updates_have_one_winner(app, equipment):
+    equipment_id, version = equipment
+    db = app.primary_db()
+    statuses = ["Потрібен ремонт", "Списана", "Справна", "Потрібен ремонт"]
+    barrier = threading.Barrier(len(statuses))
+    results = {}
+
+    def edit(status):
+        barrier.wait()
+        results[status, threading.get_ident()] = app.update_equipment(db, equipment_id, version, status, "Кабінет 101", "Тестовий викладач")
+
+    threads = [threading.Thread(target=edit, args=(status,)) for status in statuses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [status for (status, _), result in results.items() if result is not None]
+    assert len(winners) == 1
+    assert equipment_row(app, equipment_id) == (winners[0], version + 1)
+
+
+def test_batch_reports_conflicts(app, equipment):
+    equipment_id, version = equipment
+    db = app.primary_db()
+    app.update_equipment(db, equipment_id, version, "Потрібен ремонт", "Кабінет 101", "Тестовий викладач")
+
+    assert app.update_status_batch(db, {equipment_id: version}, "Списана") == ([], [equipment_id])
+    assert app.update_status_batch(db, {equipment_id: version + 1}, "Списана") == ([equipment_id], [])
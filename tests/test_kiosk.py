@@ -0,0 +1,50 @@
+import uuid
+
+
+def reservations_of(app, email):
+    with app.db_lock:
+        app.cursor.execute("SELECT id, equipment_id FROM reservations WHERE user_email = ?", (email,))
+        return app.cursor.fetchall()
+
+
+def test_replay_with_same_key_returns_first_result(app, equipment, make_user):
+    equipment_id, version = equipment
+    email, key = make_user(), uuid.uuid4().hex
+
+    first = app.replay_reservation(email, key, equipment_id, version)
+    again = app.replay_reservation(email, key, equipment_id, version)
+
+    assert first["status"] == "created"
+    assert again == first
+    assert reservations_of(app, email) == [(first["id"], equipment_id)]
+
+
+def test_replay_with_new_key_is_duplicate(app, equipment, make_user):
+    equipment_id, version = equipment
+    email = make_user()
+    first = app.replay_reservation(email, uuid.uuid4().hex, equipment_id, version)
+
+    assert app.replay_reservation(email, uuid.uuid4().hex, equipment_id, version) == {"status": "duplicate", "id": first["id"]}
+    assert len(reservations_of(app, email)) == 1
+
+
+def test_key_of_another_user_is_rejected(app, equipment, make_user):
+    equipment_id, version = equipment
+    owner, other, key = make_user(), make_user(), uuid.uuid4().hex
+    app.replay_reservation(owner, key, equipment_id, version)
+
+    assert app.replay_reservation(other, key, equipment_id, version)["status"] == "rejected"
+    assert reservations_of(app, other) == []
+
+
+def test_conflict_is_remembered_for_the_key(app, equipment, make_user):
+    equipment_id, version = equipment
+    email, key = make_user(), uuid.uuid4().hex
+    app.update_equipment(app.primary_db(), equipment_id, version, "Потрібен ремонт", "Кабінет 101", "Тестовий викладач")
+
+    conflict = app.replay_reservation(email, key, equipment_id, version)
+
+    assert conflict["status"] == "conflict"
+    # Повтор того самого запиту не бронює техніку за новою версією
+    assert app.replay_reservation(email, key, equipment_id, version + 1) == conflict
+    assert reservations_of(app, email) == []
@@ -0,0 +1,40 @@
+import uuid
+
+
+def pending_payments(app, key):
+    with app.db_lock:
+        app.cursor.execute("SELECT user_email, amount, card_token FROM pending_payments WHERE idempotency_key = ?", (key,))
+        return app.cursor.fetchall()
+
+
+def test_repeated_key_is_stored_once(app, make_user):
+    email, key = make_user(), uuid.uuid4().hex
+
+    assert app.submit_payment(key, email, "100", "tok_first")
+    assert not app.submit_payment(key, email, "100", "tok_second")
+    assert pending_payments(app, key) == [(email, "100", "tok_first")]
+
+
+def test_double_submit_from_two_clicks(app, make_user):
+    # Обидва натискання потрапляють у payment_executor з тим самим ключем
+    email, key = make_user(), uuid.uuid4().hex
+    futures = [app.payment_executor.submit(app.tokenize_and_submit, key, email, "100", "4111111111111111", "12/30", "123")
+               for _ in range(2)]
+    results = sorted(future.result(timeout=10) for future in futures)
+
+    assert results == [(True, "Платіж прийнято! Підписку буде активовано після підтвердження банком."),
+                       (True, "Цей платіж уже обробляється.")]
+    rows = pending_payments(app, key)
+    assert len(rows) == 1
+    assert rows[0][2].endswith("1111") and "4111111111111111" not in rows[0][2]
+
+
+def test_rejected_card_is_not_queued(app, make_user, monkeypatch):
+    def decline(card_number, expiry_date, cvv, timeout):
+        raise ValueError("недійсний номер")
+
+    monkeypatch.setattr(app, "card_tokenizer", decline)
+    email, key = make_user(), uuid.uuid4().hex
+
+    assert app.tokenize_and_submit(key, email, "100", "1234", "12/30", "123") == (False, "Картку відхилено: недійсний номер")
+    assert pending_payments(app, key) == []
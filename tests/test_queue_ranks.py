@@ -0,0 +1,62 @@
+import random
+import sqlite3
+
+
+def sql_queues(conn):
+    # Черги так, як їх видає process_queue_for_equipment
+    queues = {}
+    for reservation_id, equipment_id in conn.execute(
+            "SELECT id, equipment_id FROM reservations ORDER BY equipment_id, priority DESC, reservation_time, id"):
+        queues.setdefault(equipment_id, []).append(reservation_id)
+    return queues
+
+
+def index_queues(index):
+    return {equipment_id: [key[2] for key in keys] for equipment_id, keys in index["queues"].items()}
+
+
+def test_index_order_matches_sql_with_ties(app):
+    rng = random.Random(7)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE reservations (id INTEGER PRIMARY KEY, equipment_id INTEGER, reservation_time INTEGER, priority INTEGER)")
+    # Мало різних часів і пріоритетів, щоб рівних ключів було багато
+    rows = [(i, rng.randrange(3), 1_700_000_000 + rng.randrange(5), rng.choice((0, 1, 2))) for i in range(1, 301)]
+    conn.executemany("INSERT INTO reservations VALUES (?, ?, ?, ?)", rows)
+    index = app.new_queue_index(True)
+    for reservation_id, equipment_id, reservation_time, priority in rng.sample(rows, len(rows)):
+        app.queue_index_add(index, reservation_id, equipment_id, reservation_time, priority)
+
+    removed = rng.sample(rows, 50)
+    for reservation_id, *_ in removed:
+        app.queue_index_remove(index, reservation_id)
+    conn.executemany("DELETE FROM reservations WHERE id = ?", [(row[0],) for row in removed])
+
+    assert index_queues(index) == sql_queues(conn)
+    for equipment_id, queue in sql_queues(conn).items():
+        for place, reservation_id in enumerate(queue, 1):
+            assert app.queue_index_rank(index, reservation_id) == (place, len(queue))
+
+
+def test_queue_positions_follow_commits(app, equipment, make_user):
+    equipment_id, _ = equipment
+    db = app.primary_db()
+    emails = [make_user() for _ in range(6)]
+    with app.db_lock:
+        for number, email in enumerate(emails):
+            app.cursor.execute("INSERT INTO reservations (equipment_id, user_email, reservation_time, priority) VALUES (?, ?, ?, ?)",
+                               (equipment_id, email, 1_700_000_000 + number % 2, number % 3 == 0))
+        app.commit_changes()
+
+    def expected():
+        rows = db["read"]("SELECT id FROM reservations WHERE equipment_id = ? ORDER BY priority DESC, reservation_time, id",
+                          (equipment_id,))
+        return {row[0]: (place, len(rows)) for place, row in enumerate(rows, 1)}
+
+    ranks = expected()
+    assert app.queue_positions(db, [(reservation_id, equipment_id) for reservation_id in ranks]) == ranks
+
+    with app.db_lock:
+        app.cursor.execute("DELETE FROM reservations WHERE id = ?", (min(ranks),))
+        app.commit_changes()
+    ranks = expected()
+    assert app.queue_positions(db, [(reservation_id, equipment_id) for reservation_id in ranks]) == ranks